@@ -1,42 +1,229 @@
-from typing import Optional
+import numpy as np
+from typing import Optional, Sequence
 from actions import Action, ActionType
+from card_catalog import CATALOG
+from cards import Card, PokemonCard, EnergyCard
+from game_engine import can_attack, MAX_HAND_SIZE, MAX_BENCH_SIZE
 from game_state import GameState
-from game import get_valid_actions
+
+
+END_TURN_IDX = 0
+ATTACK_IDX = 1
+PLAY_ACTIVE_OFFSET = 2
+PLAY_BENCH_OFFSET = PLAY_ACTIVE_OFFSET + MAX_HAND_SIZE
+ATTACH_ACTIVE_OFFSET = PLAY_BENCH_OFFSET + MAX_HAND_SIZE
+ATTACH_BENCH_OFFSET = ATTACH_ACTIVE_OFFSET + MAX_HAND_SIZE
+NUM_ACTIONS = ATTACH_BENCH_OFFSET + MAX_HAND_SIZE * MAX_BENCH_SIZE
+
+
+def encode_action(action: Action) -> int:
+    if action.action_type == ActionType.END_TURN:
+        return END_TURN_IDX
+    if action.action_type == ActionType.ATTACK:
+        return ATTACK_IDX
+    assert action.hand_index is not None and action.hand_index < MAX_HAND_SIZE, "Invalid hand index"
+    if action.action_type == ActionType.PLAY_POKEMON:
+        offset = PLAY_BENCH_OFFSET if action.bench else PLAY_ACTIVE_OFFSET
+        return offset + action.hand_index
+    if action.action_type == ActionType.ATTACH_ENERGY:
+        if action.pokemon_index is None:
+            return ATTACH_ACTIVE_OFFSET + action.hand_index
+        assert action.pokemon_index < MAX_BENCH_SIZE, "Invalid bench index"
+        return ATTACH_BENCH_OFFSET + action.hand_index * MAX_BENCH_SIZE + action.pokemon_index
+    raise ValueError(f"Action type {action.action_type} is not part of the action space")
+
+
+def decode_action(idx: int) -> Action:
+    assert 0 <= idx < NUM_ACTIONS, "Invalid action index"
+    if idx == END_TURN_IDX:
+        return Action(ActionType.END_TURN)
+    if idx == ATTACK_IDX:
+        return Action(ActionType.ATTACK)
+    if idx < PLAY_BENCH_OFFSET:
+        return Action(ActionType.PLAY_POKEMON, hand_index=idx - PLAY_ACTIVE_OFFSET, bench=False)
+    if idx < ATTACH_ACTIVE_OFFSET:
+        return Action(ActionType.PLAY_POKEMON, hand_index=idx - PLAY_BENCH_OFFSET, bench=True)
+    if idx < ATTACH_BENCH_OFFSET:
+        return Action(ActionType.ATTACH_ENERGY, hand_index=idx - ATTACH_ACTIVE_OFFSET)
+    hand_index, pokemon_index = divmod(idx - ATTACH_BENCH_OFFSET, MAX_BENCH_SIZE)
+    return Action(ActionType.ATTACH_ENERGY, hand_index=hand_index, pokemon_index=pokemon_index)
+
+
+def fill_action_mask(state: GameState, mask: np.ndarray) -> None:
+    player = state.current_player_state
+    assert len(player.hand) <= MAX_HAND_SIZE, "Hand exceeds action space"
+    
+    mask.fill(False)
+    mask[END_TURN_IDX] = True
+    
+    can_play = not player.pokemon_played_this_turn
+    play_active = can_play and player.active_pokemon is None
+    play_bench = can_play and len(player.bench) < MAX_BENCH_SIZE
+    can_attach = player.energy_attached_this_turn < 1
+    has_active = player.active_pokemon is not None
+    bench_count = len(player.bench)
+    
+    for i, card in enumerate(player.hand):
+        if isinstance(card, PokemonCard):
+            if play_active:
+                mask[PLAY_ACTIVE_OFFSET + i] = True
+            if play_bench:
+                mask[PLAY_BENCH_OFFSET + i] = True
+        elif can_attach and isinstance(card, EnergyCard):
+            if has_active:
+                mask[ATTACH_ACTIVE_OFFSET + i] = True
+            if bench_count:
+                start = ATTACH_BENCH_OFFSET + i * MAX_BENCH_SIZE
+                mask[start:start + bench_count] = True
+    
+    if has_active and state.opponent_player_state.active_pokemon is not None and can_attack(player.active_pokemon):
+        mask[ATTACK_IDX] = True
 
 
 class ActionEncoder:
-    def __init__(self):
-        self.action_to_idx: dict[Action, int] = {}
-        self.idx_to_action: dict[int, Action] = {}
-        self.next_idx = 0
-    
-    def encode(self, action: Action) -> int:
-        if action not in self.action_to_idx:
-            self.action_to_idx[action] = self.next_idx
-            self.idx_to_action[self.next_idx] = action
-            self.next_idx += 1
-        return self.action_to_idx[action]
-    
-    def decode(self, idx: int) -> Optional[Action]:
-        return self.idx_to_action.get(idx)
-    
-    def get_action_mask(self, state: GameState, max_size: Optional[int] = None) -> list[bool]:
-        valid_actions = get_valid_actions(state)
-        valid_set = set(valid_actions)
+    mask_key = "action_mask"
+    
+    def encode(self, action: Action, state: Optional[GameState] = None) -> int:
+        return encode_action(action)
+    
+    def decode(self, idx: int, state: Optional[GameState] = None) -> Optional[Action]:
+        if not 0 <= idx < NUM_ACTIONS:
+            return None
+        return decode_action(int(idx))
+    
+    def fill_mask(self, state: GameState, mask: np.ndarray) -> None:
+        fill_action_mask(state, mask)
+    
+    def get_action_mask(self, state: GameState, max_size: Optional[int] = None) -> np.ndarray:
+        cache = state.cached()
+        mask = cache.get(self.mask_key)
+        if mask is None:
+            mask = np.empty(self.get_max_actions(), dtype=bool)
+            self.fill_mask(state, mask)
+            mask.flags.writeable = False
+            cache[self.mask_key] = mask
         
-        size = max_size if max_size is not None else self.next_idx
-        mask = []
-        for idx in range(size):
-            if idx < self.next_idx:
-                action = self.idx_to_action[idx]
-                mask.append(action in valid_set)
-            else:
-                mask.append(False)
-        return mask
+        size = len(mask)
+        if max_size is None or max_size == size:
+            return mask
+        if max_size < size:
+            return mask[:max_size]
+        return np.concatenate([mask, np.zeros(max_size - size, dtype=bool)])
+    
+    def get_action_masks(self, states: Sequence[GameState], out: Optional[np.ndarray] = None) -> np.ndarray:
+        if out is None:
+            out = np.empty((len(states), self.get_max_actions()), dtype=bool)
+        for i, state in enumerate(states):
+            self.fill_mask(state, out[i])
+        return out
     
     def get_valid_action_indices(self, state: GameState) -> list[int]:
-        valid_actions = get_valid_actions(state)
-        return [self.encode(action) for action in valid_actions]
+        return np.flatnonzero(self.get_action_mask(state)).tolist()
     
     def get_max_actions(self) -> int:
-        return max(self.next_idx, 1)
+        return NUM_ACTIONS
+    
+    def spec(self) -> dict:
+        return {"kind": "static"}
+
+
+class CanonicalActionEncoder(ActionEncoder):
+    mask_key = "canonical_action_mask"
+    
+    def __init__(self, num_cards: Optional[int] = None):
+        self.num_cards = len(CATALOG) if num_cards is None else num_cards
+        self.play_active_offset = 2
+        self.play_bench_offset = self.play_active_offset + self.num_cards
+        self.attach_active_offset = self.play_bench_offset + self.num_cards
+        self.attach_bench_offset = self.attach_active_offset + self.num_cards
+        self.num_actions = self.attach_bench_offset + self.num_cards * MAX_BENCH_SIZE
+    
+    def _card_id(self, card: Card) -> int:
+        card_id = CATALOG.id_of(card)
+        assert card_id < self.num_cards, "Card is not part of the canonical action space"
+        return card_id
+    
+    def encode(self, action: Action, state: Optional[GameState] = None) -> int:
+        if action.action_type == ActionType.END_TURN:
+            return END_TURN_IDX
+        if action.action_type == ActionType.ATTACK:
+            return ATTACK_IDX
+        assert state is not None, "Canonical encoding needs the state the action is taken in"
+        card_id = self._card_id(state.current_player_state.hand[action.hand_index])
+        if action.action_type == ActionType.PLAY_POKEMON:
+            return (self.play_bench_offset if action.bench else self.play_active_offset) + card_id
+        if action.action_type == ActionType.ATTACH_ENERGY:
+            if action.pokemon_index is None:
+                return self.attach_active_offset + card_id
+            return self.attach_bench_offset + card_id * MAX_BENCH_SIZE + action.pokemon_index
+        raise ValueError(f"Action type {action.action_type} is not part of the action space")
+    
+    def decode(self, idx: int, state: Optional[GameState] = None) -> Optional[Action]:
+        if not 0 <= idx < self.num_actions:
+            return None
+        idx = int(idx)
+        if idx == END_TURN_IDX:
+            return Action(ActionType.END_TURN)
+        if idx == ATTACK_IDX:
+            return Action(ActionType.ATTACK)
+        
+        assert state is not None, "Canonical decoding needs the state to find the hand index"
+        if idx < self.attach_active_offset:
+            action_type, bench, pokemon_index = ActionType.PLAY_POKEMON, idx >= self.play_bench_offset, None
+            card_id = idx - (self.play_bench_offset if bench else self.play_active_offset)
+        elif idx < self.attach_bench_offset:
+            action_type, bench, pokemon_index = ActionType.ATTACH_ENERGY, False, None
+            card_id = idx - self.attach_active_offset
+        else:
+            action_type, bench = ActionType.ATTACH_ENERGY, False
+            card_id, pokemon_index = divmod(idx - self.attach_bench_offset, MAX_BENCH_SIZE)
+        
+        id_of = CATALOG.id_of
+        for hand_index, card in enumerate(state.current_player_state.hand):
+            if id_of(card) == card_id:
+                return Action(action_type, hand_index=hand_index, pokemon_index=pokemon_index, bench=bench)
+        return None
+    
+    def fill_mask(self, state: GameState, mask: np.ndarray) -> None:
+        player = state.current_player_state
+        mask.fill(False)
+        mask[END_TURN_IDX] = True
+        
+        can_play = not player.pokemon_played_this_turn
+        play_active = can_play and player.active_pokemon is None
+        play_bench = can_play and len(player.bench) < MAX_BENCH_SIZE
+        can_attach = player.energy_attached_this_turn < 1
+        has_active = player.active_pokemon is not None
+        bench_count = len(player.bench)
+        
+        for card in player.hand:
+            if isinstance(card, PokemonCard):
+                card_id = self._card_id(card)
+                if play_active:
+                    mask[self.play_active_offset + card_id] = True
+                if play_bench:
+                    mask[self.play_bench_offset + card_id] = True
+            elif can_attach and isinstance(card, EnergyCard):
+                card_id = self._card_id(card)
+                if has_active:
+                    mask[self.attach_active_offset + card_id] = True
+                if bench_count:
+                    start = self.attach_bench_offset + card_id * MAX_BENCH_SIZE
+                    mask[start:start + bench_count] = True
+        
+        if has_active and state.opponent_player_state.active_pokemon is not None and can_attack(player.active_pokemon):
+            mask[ATTACK_IDX] = True
+    
+    def get_max_actions(self) -> int:
+        return self.num_actions
+    
+    def spec(self) -> dict:
+        return {"kind": "canonical", "num_cards": self.num_cards}
+
+
+def action_encoder_from_spec(spec: dict) -> ActionEncoder:
+    if spec["kind"] == "static":
+        return ActionEncoder()
+    if spec["kind"] == "canonical":
+        return CanonicalActionEncoder(spec["num_cards"])
+    raise ValueError(f"Unknown action encoder kind {spec['kind']}")
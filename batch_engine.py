@@ -0,0 +1,332 @@
+import numpy as np
+from typing import Optional
+from action_encoder import (
+    END_TURN_IDX,
+    ATTACK_IDX,
+    PLAY_ACTIVE_OFFSET,
+    PLAY_BENCH_OFFSET,
+    ATTACH_ACTIVE_OFFSET,
+    ATTACH_BENCH_OFFSET,
+    NUM_ACTIONS,
+)
+from card_catalog import CardCatalog, CATALOG, ENERGY_TYPES, NUM_ENERGY_TYPES, EMPTY
+from game_engine import (
+    POKEMON_CARDS,
+    ENERGY_CARDS,
+    TRAINER_CARDS,
+    DECK_SIZE,
+    PRIZE_COUNT,
+    INITIAL_HAND_SIZE,
+    MAX_HAND_SIZE,
+    MAX_BENCH_SIZE,
+)
+from game_state import GameState, PlayerState, PokemonInPlay
+
+
+class BatchGameEngine:
+    def __init__(self, seed: Optional[int] = None, catalog: Optional[CardCatalog] = None):
+        self.rng = np.random.default_rng(seed)
+        self.catalog = catalog if catalog is not None else CATALOG
+        self._allocate(0)
+    
+    def _allocate(self, n: int) -> None:
+        self.num_games = n
+        self.deck = np.full((n, 2, DECK_SIZE), EMPTY, dtype=np.int16)
+        self.deck_size = np.zeros((n, 2), dtype=np.int16)
+        self.hand = np.full((n, 2, MAX_HAND_SIZE), EMPTY, dtype=np.int16)
+        self.hand_size = np.zeros((n, 2), dtype=np.int16)
+        self.prizes = np.full((n, 2, PRIZE_COUNT), EMPTY, dtype=np.int16)
+        self.prize_size = np.zeros((n, 2), dtype=np.int16)
+        self.active_card = np.full((n, 2), EMPTY, dtype=np.int16)
+        self.active_damage = np.zeros((n, 2), dtype=np.int32)
+        self.active_energy = np.zeros((n, 2, NUM_ENERGY_TYPES), dtype=np.int16)
+        self.bench_card = np.full((n, 2, MAX_BENCH_SIZE), EMPTY, dtype=np.int16)
+        self.bench_damage = np.zeros((n, 2, MAX_BENCH_SIZE), dtype=np.int32)
+        self.bench_energy = np.zeros((n, 2, MAX_BENCH_SIZE, NUM_ENERGY_TYPES), dtype=np.int16)
+        self.bench_size = np.zeros((n, 2), dtype=np.int16)
+        self.energy_attached_this_turn = np.zeros((n, 2), dtype=np.int16)
+        self.pokemon_played_this_turn = np.zeros((n, 2), dtype=bool)
+        self.current_player = np.zeros(n, dtype=np.int8)
+        self.turn_number = np.ones(n, dtype=np.int32)
+        self.winner = np.full(n, EMPTY, dtype=np.int8)
+    
+    def reset(self, n: int, seed: Optional[int] = None) -> None:
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        
+        catalog = self.catalog
+        pokemon_ids = np.array([catalog.id_of(c) for c in POKEMON_CARDS], dtype=np.int16)
+        energy_ids = np.array([catalog.id_of(ENERGY_CARDS[t]) for t in ENERGY_TYPES], dtype=np.int16)
+        trainer_ids = np.array([catalog.id_of(c) for c in TRAINER_CARDS], dtype=np.int16)
+        
+        third = DECK_SIZE // 3
+        decks = np.concatenate([
+            self.rng.choice(pokemon_ids, (n, 2, third)),
+            self.rng.choice(energy_ids, (n, 2, third)),
+            self.rng.choice(trainer_ids, (n, 2, DECK_SIZE - 2 * third)),
+        ], axis=2)
+        order = self.rng.random(decks.shape).argsort(axis=2)
+        decks = np.take_along_axis(decks, order, axis=2)
+        
+        self._allocate(n)
+        hand_slots = DECK_SIZE - 1 - np.arange(INITIAL_HAND_SIZE)
+        prize_slots = DECK_SIZE - 1 - INITIAL_HAND_SIZE - np.arange(PRIZE_COUNT)
+        remaining = DECK_SIZE - INITIAL_HAND_SIZE - PRIZE_COUNT
+        
+        self.hand[:, :, :INITIAL_HAND_SIZE] = decks[:, :, hand_slots]
+        self.hand_size[:] = INITIAL_HAND_SIZE
+        self.prizes[:] = decks[:, :, prize_slots]
+        self.prize_size[:] = PRIZE_COUNT
+        self.deck[:, :, :remaining] = decks[:, :, :remaining]
+        self.deck_size[:] = remaining
+    
+    def load_states(self, states: list[GameState]) -> None:
+        self._allocate(len(states))
+        catalog = self.catalog
+        
+        for g, state in enumerate(states):
+            for p, player in enumerate((state.player1, state.player2)):
+                assert len(player.deck) <= DECK_SIZE, "Deck too large for batch engine"
+                assert len(player.hand) <= MAX_HAND_SIZE, "Hand too large for batch engine"
+                assert len(player.prizes) <= PRIZE_COUNT, "Too many prizes for batch engine"
+                
+                self.deck[g, p, :len(player.deck)] = [catalog.id_of(c) for c in player.deck]
+                self.deck_size[g, p] = len(player.deck)
+                self.hand[g, p, :len(player.hand)] = [catalog.id_of(c) for c in player.hand]
+                self.hand_size[g, p] = len(player.hand)
+                self.prizes[g, p, :len(player.prizes)] = [catalog.id_of(c) for c in player.prizes]
+                self.prize_size[g, p] = len(player.prizes)
+                
+                if player.active_pokemon is not None:
+                    self._load_pokemon(player.active_pokemon, self.active_card[g], self.active_damage[g],
+                                       self.active_energy[g], p)
+                for slot, pokemon in enumerate(player.bench):
+                    self._load_pokemon(pokemon, self.bench_card[g, p], self.bench_damage[g, p],
+                                       self.bench_energy[g, p], slot)
+                self.bench_size[g, p] = len(player.bench)
+                
+                self.energy_attached_this_turn[g, p] = player.energy_attached_this_turn
+                self.pokemon_played_this_turn[g, p] = player.pokemon_played_this_turn
+            
+            self.current_player[g] = state.current_player
+            self.turn_number[g] = state.turn_number
+            self.winner[g] = EMPTY if state.winner is None else state.winner
+    
+    def _load_pokemon(self, pokemon: PokemonInPlay, cards: np.ndarray, damage: np.ndarray,
+                      energy: np.ndarray, slot: int) -> None:
+        assert pokemon.status is None, "Status conditions are not supported by the batch engine"
+        cards[slot] = self.catalog.id_of(pokemon.card)
+        damage[slot] = pokemon.damage
+        for e in pokemon.attached_energy:
+            energy[slot, ENERGY_TYPES.index(e.energy_type)] += 1
+    
+    def to_state(self, g: int) -> GameState:
+        cards = self.catalog.cards
+        players = []
+        for p in range(2):
+            active = None
+            if self.active_card[g, p] != EMPTY:
+                active = self._to_pokemon(self.active_card[g, p], self.active_damage[g, p], self.active_energy[g, p])
+            bench = [
+                self._to_pokemon(self.bench_card[g, p, slot], self.bench_damage[g, p, slot], self.bench_energy[g, p, slot])
+                for slot in range(self.bench_size[g, p])
+            ]
+            players.append(PlayerState(
+                deck=[cards[c] for c in self.deck[g, p, :self.deck_size[g, p]]],
+                hand=[cards[c] for c in self.hand[g, p, :self.hand_size[g, p]]],
+                active_pokemon=active,
+                bench=bench,
+                prizes=[cards[c] for c in self.prizes[g, p, :self.prize_size[g, p]]],
+                energy_attached_this_turn=int(self.energy_attached_this_turn[g, p]),
+                pokemon_played_this_turn=bool(self.pokemon_played_this_turn[g, p]),
+            ))
+        
+        return GameState(
+            player1=players[0],
+            player2=players[1],
+            current_player=int(self.current_player[g]),
+            turn_number=int(self.turn_number[g]),
+            winner=None if self.winner[g] == EMPTY else int(self.winner[g]),
+        )
+    
+    def _to_pokemon(self, card_id: int, damage: int, energy: np.ndarray) -> PokemonInPlay:
+        attached = [ENERGY_CARDS[t] for t, count in zip(ENERGY_TYPES, energy) for _ in range(count)]
+        return PokemonInPlay(card=self.catalog.cards[card_id], attached_energy=attached, damage=int(damage))
+    
+    def _can_attack(self, games: np.ndarray, players: np.ndarray) -> np.ndarray:
+        active = self.active_card[games, players]
+        cost = self.catalog.attack_cost[active]
+        defending = self.active_card[games, 1 - players]
+        return (active != EMPTY) & (defending != EMPTY) & np.all(self.active_energy[games, players] >= cost, axis=1)
+    
+    def legal_mask(self) -> np.ndarray:
+        n = self.num_games
+        games = np.arange(n)
+        players = self.current_player.astype(np.intp)
+        catalog = self.catalog
+        
+        hand = self.hand[games, players]
+        in_hand = np.arange(MAX_HAND_SIZE) < self.hand_size[games, players][:, None]
+        is_pokemon = catalog.is_pokemon[hand] & in_hand
+        is_energy = catalog.is_energy[hand] & in_hand
+        
+        has_active = self.active_card[games, players] != EMPTY
+        can_play = ~self.pokemon_played_this_turn[games, players]
+        can_attach = self.energy_attached_this_turn[games, players] < 1
+        bench_size = self.bench_size[games, players]
+        bench_slots = np.arange(MAX_BENCH_SIZE) < bench_size[:, None]
+        
+        mask = np.zeros((n, NUM_ACTIONS), dtype=bool)
+        mask[:, END_TURN_IDX] = True
+        mask[:, ATTACK_IDX] = self._can_attack(games, players)
+        mask[:, PLAY_ACTIVE_OFFSET:PLAY_BENCH_OFFSET] = is_pokemon & (can_play & ~has_active)[:, None]
+        mask[:, PLAY_BENCH_OFFSET:ATTACH_ACTIVE_OFFSET] = is_pokemon & (can_play & (bench_size < MAX_BENCH_SIZE))[:, None]
+        mask[:, ATTACH_ACTIVE_OFFSET:ATTACH_BENCH_OFFSET] = is_energy & (can_attach & has_active)[:, None]
+        mask[:, ATTACH_BENCH_OFFSET:] = (
+            is_energy[:, :, None] & can_attach[:, None, None] & bench_slots[:, None, :]
+        ).reshape(n, MAX_HAND_SIZE * MAX_BENCH_SIZE)
+        mask[self.winner != EMPTY] = False
+        return mask
+    
+    def step(self, actions: np.ndarray) -> None:
+        actions = np.asarray(actions, dtype=np.intp)
+        assert actions.shape == (self.num_games,), "Expected one action per game"
+        
+        live = self.winner == EMPTY
+        games = np.arange(self.num_games)
+        legal = self.legal_mask()[games, actions]
+        assert np.all(legal | ~live), f"Illegal actions in games {np.flatnonzero(~legal & live).tolist()}"
+        
+        play_active = live & (actions >= PLAY_ACTIVE_OFFSET) & (actions < PLAY_BENCH_OFFSET)
+        play_bench = live & (actions >= PLAY_BENCH_OFFSET) & (actions < ATTACH_ACTIVE_OFFSET)
+        attach_active = live & (actions >= ATTACH_ACTIVE_OFFSET) & (actions < ATTACH_BENCH_OFFSET)
+        attach_bench = live & (actions >= ATTACH_BENCH_OFFSET)
+        
+        self._play_pokemon(games[play_active], actions[play_active] - PLAY_ACTIVE_OFFSET, bench=False)
+        self._play_pokemon(games[play_bench], actions[play_bench] - PLAY_BENCH_OFFSET, bench=True)
+        self._attach_energy(
+            games[attach_active],
+            actions[attach_active] - ATTACH_ACTIVE_OFFSET,
+            np.full(int(attach_active.sum()), EMPTY, dtype=np.intp),
+        )
+        hand_index, pokemon_index = np.divmod(actions[attach_bench] - ATTACH_BENCH_OFFSET, MAX_BENCH_SIZE)
+        self._attach_energy(games[attach_bench], hand_index, pokemon_index)
+        self._attack(games[live & (actions == ATTACK_IDX)])
+        self._end_turn(games[live & (actions == END_TURN_IDX)])
+    
+    def _remove_from_hand(self, games: np.ndarray, players: np.ndarray, hand_index: np.ndarray) -> np.ndarray:
+        cards = self.hand[games, players, hand_index]
+        cols = np.arange(MAX_HAND_SIZE - 1)
+        src = cols + (cols >= hand_index[:, None])
+        rows = self.hand[games, players]
+        self.hand[games, players, :-1] = np.take_along_axis(rows, src, axis=1)
+        self.hand[games, players, -1] = EMPTY
+        self.hand_size[games, players] -= 1
+        return cards
+    
+    def _add_to_hand(self, games: np.ndarray, players: np.ndarray, cards: np.ndarray) -> None:
+        size = self.hand_size[games, players]
+        assert np.all(size < MAX_HAND_SIZE), "Hand too large for batch engine"
+        self.hand[games, players, size] = cards
+        self.hand_size[games, players] = size + 1
+    
+    def _play_pokemon(self, games: np.ndarray, hand_index: np.ndarray, bench: bool) -> None:
+        if len(games) == 0:
+            return
+        players = self.current_player[games].astype(np.intp)
+        cards = self._remove_from_hand(games, players, hand_index)
+        
+        if bench:
+            slot = self.bench_size[games, players].astype(np.intp)
+            self.bench_card[games, players, slot] = cards
+            self.bench_damage[games, players, slot] = 0
+            self.bench_energy[games, players, slot] = 0
+            self.bench_size[games, players] += 1
+        else:
+            self.active_card[games, players] = cards
+            self.active_damage[games, players] = 0
+            self.active_energy[games, players] = 0
+        
+        self.pokemon_played_this_turn[games, players] = True
+    
+    def _attach_energy(self, games: np.ndarray, hand_index: np.ndarray, pokemon_index: np.ndarray) -> None:
+        if len(games) == 0:
+            return
+        players = self.current_player[games].astype(np.intp)
+        cards = self._remove_from_hand(games, players, hand_index)
+        energy_type = self.catalog.energy_type[cards]
+        
+        to_active = pokemon_index == EMPTY
+        self.active_energy[games[to_active], players[to_active], energy_type[to_active]] += 1
+        to_bench = ~to_active
+        self.bench_energy[games[to_bench], players[to_bench], pokemon_index[to_bench], energy_type[to_bench]] += 1
+        
+        self.energy_attached_this_turn[games, players] += 1
+    
+    def _attack(self, games: np.ndarray) -> None:
+        if len(games) == 0:
+            return
+        players = self.current_player[games].astype(np.intp)
+        opponents = 1 - players
+        defending = self.active_card[games, opponents]
+        assert np.all(defending != EMPTY), "Opponent has no active Pokemon"
+        
+        damage = self.catalog.attack_damage[self.active_card[games, players]]
+        self.active_damage[games, opponents] += damage
+        
+        knocked_out = self.active_damage[games, opponents] >= self.catalog.hp[defending]
+        ko_games, ko_players = games[knocked_out], players[knocked_out]
+        self._take_prize(ko_games, ko_players)
+        self.active_card[ko_games, 1 - ko_players] = EMPTY
+        self.active_damage[ko_games, 1 - ko_players] = 0
+        self.active_energy[ko_games, 1 - ko_players] = 0
+    
+    def _take_prize(self, games: np.ndarray, players: np.ndarray) -> None:
+        if len(games) == 0:
+            return
+        size = self.prize_size[games, players] - 1
+        assert np.all(size >= 0), "No prizes remaining"
+        
+        cards = self.prizes[games, players, size]
+        self.prizes[games, players, size] = EMPTY
+        self.prize_size[games, players] = size
+        self._add_to_hand(games, players, cards)
+        
+        won = size == 0
+        self.winner[games[won]] = players[won]
+    
+    def _end_turn(self, games: np.ndarray) -> None:
+        if len(games) == 0:
+            return
+        players = self.current_player[games].astype(np.intp)
+        self.energy_attached_this_turn[games, players] = 0
+        self.pokemon_played_this_turn[games, players] = False
+        
+        self.current_player[games] = 1 - players
+        self.turn_number[games] += 1
+        self._draw_card(games, 1 - players)
+    
+    def _draw_card(self, games: np.ndarray, players: np.ndarray) -> None:
+        size = self.deck_size[games, players] - 1
+        assert np.all(size >= 0), "Cannot draw from empty deck"
+        
+        cards = self.deck[games, players, size]
+        self.deck[games, players, size] = EMPTY
+        self.deck_size[games, players] = size
+        self._add_to_hand(games, players, cards)
+    
+    def winners(self) -> np.ndarray:
+        no_pokemon = (self.active_card == EMPTY) & (self.bench_size == 0)
+        undecided = self.winner == EMPTY
+        decided = np.select(
+            [
+                self.prize_size[:, 0] == 0,
+                self.prize_size[:, 1] == 0,
+                no_pokemon[:, 0],
+                no_pokemon[:, 1],
+            ],
+            [0, 1, 1, 0],
+            default=EMPTY,
+        )
+        self.winner[undecided] = decided[undecided]
+        return self.winner.copy()
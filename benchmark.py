@@ -0,0 +1,270 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import numpy as np
+import torch
+from dataclasses import dataclass, asdict
+from typing import Callable, Optional
+from action_encoder import ActionEncoder
+from dqn_agent import DQNAgent
+from game import apply_action, get_valid_actions
+from game_engine import initialize_game
+from replay_buffer import ReplayBuffer, CompressedReplayBuffer
+from state_encoder import STATE_DIM, FEATURE_SCALES, encode_state
+from train_ai import play_game, RandomAgent
+
+
+REPLAY_CAPACITIES = (1000, 10000, 100000)
+TRAIN_BATCH_SIZES = (32, 128, 512)
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    value: float
+    unit: str
+    higher_is_better: bool
+
+
+def _seed(seed: int) -> None:
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def _measure(run: Callable[[], int], min_time: float) -> float:
+    run()
+    ops = 0
+    start = time.perf_counter()
+    while True:
+        ops += run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return ops / elapsed
+
+
+def _sample_games(seed: int, num_games: int = 50, max_actions: int = 40) -> list[list]:
+    rng = random.Random(seed)
+    games = []
+    for _ in range(num_games):
+        state = initialize_game(rng=rng)
+        states = []
+        for _ in range(max_actions):
+            states.append(state)
+            actions = get_valid_actions(state)
+            if state.winner is not None or not state.opponent_player_state.deck:
+                break
+            state = state.clone()
+            apply_action(state, rng.choice(actions))
+        games.append(states)
+    return games
+
+
+def _sample_states(seed: int, num_games: int = 50, max_actions: int = 40) -> list:
+    return [state for game in _sample_games(seed, num_games, max_actions) for state in game]
+
+
+def bench_random_playouts(seed: int, min_time: float) -> list[BenchmarkResult]:
+    games = iter(range(seed, sys.maxsize))
+    
+    def run() -> int:
+        game_seed = next(games)
+        play_game(RandomAgent(game_seed), RandomAgent(game_seed + 1), training=False, seed=game_seed)
+        return 1
+    
+    return [BenchmarkResult("random_playouts", _measure(run, min_time), "games/s", True)]
+
+
+def bench_valid_actions(seed: int, min_time: float) -> list[BenchmarkResult]:
+    states = _sample_states(seed)
+    
+    def run() -> int:
+        for state in states:
+            state.cache = None
+            get_valid_actions(state)
+        return len(states)
+    
+    return [BenchmarkResult("get_valid_actions", _measure(run, min_time), "calls/s", True)]
+
+
+def bench_encode_state(seed: int, min_time: float) -> list[BenchmarkResult]:
+    states = _sample_states(seed)
+    
+    def run() -> int:
+        for state in states:
+            state.cache = None
+            encode_state(state, state.current_player)
+        return len(states)
+    
+    return [BenchmarkResult("encode_state", _measure(run, min_time), "calls/s", True)]
+
+
+def bench_replay_sample(seed: int, min_time: float, batch_size: int = 32) -> list[BenchmarkResult]:
+    action_dim = ActionEncoder().get_max_actions()
+    rng = np.random.default_rng(seed)
+    results = []
+    for capacity in REPLAY_CAPACITIES:
+        buffer = ReplayBuffer(capacity, STATE_DIM, action_dim, seed=seed)
+        buffer.push_batch(
+            rng.random((capacity, STATE_DIM), dtype=np.float32),
+            rng.integers(0, action_dim, capacity),
+            rng.random(capacity, dtype=np.float32),
+            rng.random((capacity, STATE_DIM), dtype=np.float32),
+            rng.random(capacity) < 0.05,
+            rng.random((capacity, action_dim)) < 0.1,
+            rng.random((capacity, action_dim)) < 0.1,
+        )
+        
+        def run() -> int:
+            buffer.sample_tensors(batch_size)
+            return 1
+        
+        latency_us = 1e6 / _measure(run, min_time)
+        results.append(BenchmarkResult(f"replay_sample_us[capacity={capacity}]", latency_us, "us", False))
+    return results
+
+
+def bench_compressed_replay(seed: int, min_time: float, batch_size: int = 32) -> list[BenchmarkResult]:
+    encoder = ActionEncoder()
+    pairs = [(a, b) for game in _sample_games(seed) for a, b in zip(game, game[1:])]
+    observations = np.stack([encode_state(a, a.current_player) for a, _ in pairs])
+    next_observations = np.stack([encode_state(b, a.current_player) for a, b in pairs])
+    masks = np.stack([encoder.get_action_mask(a) for a, _ in pairs])
+    next_masks = np.stack([encoder.get_action_mask(b) for _, b in pairs])
+    rng = np.random.default_rng(seed)
+    
+    capacity = max(REPLAY_CAPACITIES)
+    results = []
+    for name, buffer in (
+        ("uncompressed_replay", ReplayBuffer(capacity, STATE_DIM, encoder.get_max_actions(), seed=seed)),
+        ("compressed_replay", CompressedReplayBuffer(capacity, FEATURE_SCALES, encoder.get_max_actions(), seed=seed)),
+    ):
+        while len(buffer) < capacity:
+            buffer.push_batch(observations, rng.integers(0, encoder.get_max_actions(), len(pairs)),
+                              rng.random(len(pairs), dtype=np.float32), next_observations,
+                              rng.random(len(pairs)) < 0.05, masks, next_masks)
+        
+        def run() -> int:
+            buffer.sample_tensors(batch_size)
+            return 1
+        
+        results.append(BenchmarkResult(f"{name}_bytes_per_transition", buffer.bytes_per_transition(), "bytes", False))
+        results.append(BenchmarkResult(f"{name}_sample_us[capacity={capacity}]", 1e6 / _measure(run, min_time), "us", False))
+    return results
+
+
+def bench_train_step(seed: int, min_time: float) -> list[BenchmarkResult]:
+    action_dim = ActionEncoder().get_max_actions()
+    rng = np.random.default_rng(seed)
+    capacity = 4 * max(TRAIN_BATCH_SIZES)
+    results = []
+    for batch_size in TRAIN_BATCH_SIZES:
+        _seed(seed)
+        agent = DQNAgent(STATE_DIM, ActionEncoder(), device=torch.device("cpu"), replay_capacity=capacity, seed=seed)
+        agent.replay_buffer.rng = np.random.default_rng(seed)
+        agent.replay_buffer.push_batch(
+            rng.random((capacity, STATE_DIM), dtype=np.float32),
+            rng.integers(0, action_dim, capacity),
+            rng.random(capacity, dtype=np.float32),
+            rng.random((capacity, STATE_DIM), dtype=np.float32),
+            rng.random(capacity) < 0.05,
+            rng.random((capacity, action_dim)) < 0.1,
+            rng.random((capacity, action_dim)) < 0.1,
+        )
+        
+        def run() -> int:
+            agent.train_step(batch_size)
+            return 1
+        
+        results.append(BenchmarkResult(f"train_step[batch={batch_size}]", _measure(run, min_time), "updates/s", True))
+        agent.start_prefetch(batch_size)
+        rate = _measure(run, min_time)
+        agent.stop_prefetch()
+        results.append(BenchmarkResult(f"train_step_prefetch[batch={batch_size}]", rate, "updates/s", True))
+    return results
+
+
+BENCHMARKS: dict[str, Callable[[int, float], list[BenchmarkResult]]] = {
+    "random_playouts": bench_random_playouts,
+    "get_valid_actions": bench_valid_actions,
+    "encode_state": bench_encode_state,
+    "replay_sample": bench_replay_sample,
+    "compressed_replay": bench_compressed_replay,
+    "train_step": bench_train_step,
+}
+
+
+def run_benchmarks(names: Optional[list[str]] = None, seed: int = 0, min_time: float = 1.0) -> list[BenchmarkResult]:
+    torch.set_num_threads(1)
+    results = []
+    for name in names or list(BENCHMARKS):
+        _seed(seed)
+        for result in BENCHMARKS[name](seed, min_time):
+            assert all(result.name != r.name for r in results), f"Duplicate benchmark result {result.name}"
+            print(f"{result.name:40s} {result.value:14.1f} {result.unit}")
+            results.append(result)
+    return results
+
+
+def compare(results: list[BenchmarkResult], baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for result in results:
+        previous = baseline.get(result.name)
+        if previous is None:
+            continue
+        if result.higher_is_better:
+            change = (result.value - previous["value"]) / previous["value"]
+        else:
+            change = (previous["value"] - result.value) / previous["value"]
+        status = "REGRESSION" if change < -threshold else "ok"
+        print(f"{result.name:40s} {previous['value']:14.1f} -> {result.value:14.1f} {result.unit} ({change:+.1%}) {status}")
+        if status != "ok":
+            regressions.append(result.name)
+    return regressions
+
+
+def to_json(results: list[BenchmarkResult], seed: int, min_time: float) -> dict:
+    return {
+        "meta": {
+            "seed": seed,
+            "min_time": min_time,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "torch": torch.__version__,
+            "machine": platform.machine(),
+        },
+        "results": {result.name: asdict(result) for result in results},
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Throughput benchmarks for the engine, encoders, replay and learner")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="Benchmarks to run (default: all)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-time", type=float, default=1.0, help="Seconds to run each measurement")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--baseline", help="Compare against results JSON written by a previous run")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown counted as a regression")
+    args = parser.parse_args(argv)
+    
+    results = run_benchmarks(args.only, args.seed, args.min_time)
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(to_json(results, args.seed, args.min_time), f, indent=2)
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+import numpy as np
+from typing import Iterable, Optional, Sequence
+from cards import Card, PokemonCard, EnergyCard, TrainerCard, EnergyType
+from game_state import GameState, PlayerState, PokemonInPlay
+
+
+ENERGY_TYPES = list(EnergyType)
+NUM_ENERGY_TYPES = len(ENERGY_TYPES)
+STATUSES = [None, "asleep", "paralyzed", "confused", "poisoned", "burned"]
+EMPTY = -1
+
+POKEMON_CARDS = [
+    PokemonCard("Pikachu", 60, (EnergyType.ELECTRIC,), (EnergyType.ELECTRIC, EnergyType.COLORLESS), 30, 1),
+    PokemonCard("Charmander", 50, (EnergyType.FIRE,), (EnergyType.FIRE,), 20, 1),
+    PokemonCard("Squirtle", 50, (EnergyType.WATER,), (EnergyType.WATER,), 20, 1),
+    PokemonCard("Bulbasaur", 50, (EnergyType.GRASS,), (EnergyType.GRASS,), 20, 1),
+    PokemonCard("Raichu", 80, (EnergyType.ELECTRIC,), (EnergyType.ELECTRIC, EnergyType.ELECTRIC), 50, 1),
+]
+
+TRAINER_CARDS = [
+    TrainerCard("Potion", "Heal 20 damage"),
+    TrainerCard("Switch", "Switch active Pokemon"),
+    TrainerCard("Professor", "Draw 3 cards"),
+]
+
+ENERGY_CARDS = {energy_type: EnergyCard(energy_type) for energy_type in EnergyType}
+
+TABLES = ("is_pokemon", "is_energy", "is_trainer", "hp", "attack_damage", "attack_cost", "energy_type")
+
+
+class CardCatalog:
+    def __init__(self, cards: Iterable[Card] = ()):
+        self.cards: list[Card] = []
+        self.card_to_id: dict[Card, int] = {}
+        self._object_to_id: dict[int, int] = {}
+        for card in cards:
+            self.id_of(card)
+        self._build_tables()
+    
+    def __getattr__(self, name: str):
+        if name not in TABLES:
+            raise AttributeError(name)
+        self._build_tables()
+        return self.__dict__[name]
+    
+    def __len__(self) -> int:
+        return len(self.cards)
+    
+    def id_of(self, card: Card) -> int:
+        card_id = self._object_to_id.get(id(card))
+        if card_id is not None:
+            return card_id
+        card_id = self.card_to_id.get(card)
+        if card_id is None:
+            card_id = len(self.cards)
+            self.cards.append(card)
+            self.card_to_id[card] = card_id
+            self._object_to_id[id(card)] = card_id
+            for name in TABLES:
+                self.__dict__.pop(name, None)
+        return card_id
+    
+    def intern(self, card: Card) -> Card:
+        return self.cards[self.id_of(card)]
+    
+    def card(self, card_id: int) -> Card:
+        return self.cards[card_id]
+    
+    def encode_cards(self, cards: Sequence[Card]) -> np.ndarray:
+        return np.array([self.id_of(c) for c in cards], dtype=np.int16)
+    
+    def decode_cards(self, card_ids: Iterable[int]) -> list[Card]:
+        return [self.cards[c] for c in card_ids]
+    
+    def count_vector(self, cards: Sequence[Card]) -> np.ndarray:
+        return np.bincount(self.encode_cards(cards), minlength=len(self.cards)).astype(np.int16)
+    
+    def _build_tables(self) -> None:
+        n = len(self.cards)
+        self.is_pokemon = np.zeros(n, dtype=bool)
+        self.is_energy = np.zeros(n, dtype=bool)
+        self.is_trainer = np.zeros(n, dtype=bool)
+        self.hp = np.zeros(n, dtype=np.int32)
+        self.attack_damage = np.zeros(n, dtype=np.int32)
+        self.attack_cost = np.zeros((n, NUM_ENERGY_TYPES), dtype=np.int16)
+        self.energy_type = np.full(n, EMPTY, dtype=np.int16)
+        
+        for card_id, card in enumerate(self.cards):
+            if isinstance(card, PokemonCard):
+                self.is_pokemon[card_id] = True
+                self.hp[card_id] = card.hp
+                self.attack_damage[card_id] = card.attack_damage
+                for required in card.attack_cost:
+                    if required != EnergyType.COLORLESS:
+                        self.attack_cost[card_id, ENERGY_TYPES.index(required)] += 1
+            elif isinstance(card, EnergyCard):
+                self.is_energy[card_id] = True
+                self.energy_type[card_id] = ENERGY_TYPES.index(card.energy_type)
+            elif isinstance(card, TrainerCard):
+                self.is_trainer[card_id] = True
+    
+    def pack_state(self, state: GameState) -> bytes:
+        values = [state.current_player, state.turn_number, EMPTY if state.winner is None else state.winner]
+        for player in (state.player1, state.player2):
+            for pile in (player.deck, player.hand, player.prizes, player.discard):
+                values.append(len(pile))
+                values.extend(self.id_of(c) for c in pile)
+            values.append(player.energy_attached_this_turn)
+            values.append(int(player.pokemon_played_this_turn))
+            values.append(int(player.active_pokemon is not None))
+            if player.active_pokemon is not None:
+                self._pack_pokemon(player.active_pokemon, values)
+            values.append(len(player.bench))
+            for pokemon in player.bench:
+                self._pack_pokemon(pokemon, values)
+        return np.array(values, dtype=np.int16).tobytes()
+    
+    def _pack_pokemon(self, pokemon: PokemonInPlay, values: list[int]) -> None:
+        values.append(self.id_of(pokemon.card))
+        values.append(pokemon.damage)
+        values.append(STATUSES.index(pokemon.status))
+        values.append(len(pokemon.attached_energy))
+        values.extend(self.id_of(e) for e in pokemon.attached_energy)
+    
+    def unpack_state(self, data: bytes) -> GameState:
+        values = np.frombuffer(data, dtype=np.int16).tolist()
+        position = 0
+        
+        def take(count: int = 1) -> list[int]:
+            nonlocal position
+            taken = values[position:position + count]
+            position += count
+            return taken
+        
+        def take_pokemon() -> PokemonInPlay:
+            card_id, damage, status, energy_count = take(4)
+            return PokemonInPlay(
+                card=self.cards[card_id],
+                attached_energy=self.decode_cards(take(energy_count)),
+                damage=damage,
+                status=STATUSES[status],
+            )
+        
+        current_player, turn_number, winner = take(3)
+        players = []
+        for _ in range(2):
+            deck, hand, prizes, discard = (self.decode_cards(take(take()[0])) for _ in range(4))
+            energy_attached, pokemon_played, has_active = take(3)
+            active = take_pokemon() if has_active else None
+            bench = [take_pokemon() for _ in range(take()[0])]
+            players.append(PlayerState(
+                deck=deck,
+                hand=hand,
+                active_pokemon=active,
+                bench=bench,
+                prizes=prizes,
+                discard=discard,
+                energy_attached_this_turn=energy_attached,
+                pokemon_played_this_turn=bool(pokemon_played),
+            ))
+        
+        return GameState(
+            player1=players[0],
+            player2=players[1],
+            current_player=current_player,
+            turn_number=turn_number,
+            winner=None if winner == EMPTY else winner,
+        )
+
+
+DEFAULT_CARDS: list[Card] = POKEMON_CARDS + list(ENERGY_CARDS.values()) + TRAINER_CARDS
+CATALOG = CardCatalog(DEFAULT_CARDS)
+
+
+def card_id(card: Card, catalog: Optional[CardCatalog] = None) -> int:
+    return (catalog if catalog is not None else CATALOG).id_of(card)
@@ -0,0 +1,312 @@
+import random
+import threading
+import time
+from contextlib import nullcontext
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from typing import Optional
+from action_encoder import ActionEncoder
+from dqn_agent import DQNAgent
+from dqn_network import DQNNetwork
+from inference_server import InferenceServer, ProcessInferenceBridge
+from replay_buffer import ReplayBuffer, Transition
+from state_encoder import STATE_DIM
+from train_ai import play_game
+
+
+class ShutdownRequested(Exception):
+    pass
+
+
+class SharedTransitionQueue:
+    def __init__(self, capacity: int, state_dim: int, action_dim: int, ctx=mp):
+        self.capacity = capacity
+        self.states = torch.zeros((capacity, state_dim), dtype=torch.float32).share_memory_()
+        self.next_states = torch.zeros((capacity, state_dim), dtype=torch.float32).share_memory_()
+        self.actions = torch.zeros(capacity, dtype=torch.int64).share_memory_()
+        self.rewards = torch.zeros(capacity, dtype=torch.float32).share_memory_()
+        self.dones = torch.zeros(capacity, dtype=torch.bool).share_memory_()
+        self.action_masks = torch.zeros((capacity, action_dim), dtype=torch.bool).share_memory_()
+        self.next_action_masks = torch.zeros((capacity, action_dim), dtype=torch.bool).share_memory_()
+        self.lock = ctx.Lock()
+        self.head = ctx.RawValue("q", 0)
+        self.tail = ctx.RawValue("q", 0)
+        self.stop_event = None
+    
+    def push(self, transition: Transition) -> None:
+        self.push_batch(
+            transition.state[None],
+            np.array([transition.action]),
+            np.array([transition.reward]),
+            transition.next_state[None],
+            np.array([transition.done]),
+            np.asarray(transition.action_mask)[None],
+            np.asarray(transition.next_action_mask)[None],
+        )
+    
+    def push_batch(
+        self,
+        states: np.ndarray,
+        actions: np.ndarray,
+        rewards: np.ndarray,
+        next_states: np.ndarray,
+        dones: np.ndarray,
+        action_masks: np.ndarray,
+        next_action_masks: np.ndarray,
+    ) -> None:
+        written = 0
+        while written < len(states):
+            with self.lock:
+                head = self.head.value
+                free = self.capacity - (head - self.tail.value)
+            if free == 0:
+                if self.stop_event is not None and self.stop_event.is_set():
+                    raise ShutdownRequested()
+                time.sleep(0.001)
+                continue
+            
+            rows = slice(written, written + min(free, len(states) - written))
+            indices = (head + np.arange(rows.stop - rows.start)) % self.capacity
+            self.states.numpy()[indices] = states[rows]
+            self.next_states.numpy()[indices] = next_states[rows]
+            self.actions.numpy()[indices] = actions[rows]
+            self.rewards.numpy()[indices] = rewards[rows]
+            self.dones.numpy()[indices] = dones[rows]
+            self.action_masks.numpy()[indices] = action_masks[rows]
+            self.next_action_masks.numpy()[indices] = next_action_masks[rows]
+            with self.lock:
+                self.head.value = head + len(indices)
+            written = rows.stop
+    
+    def drain(self, replay_buffer: ReplayBuffer) -> int:
+        with self.lock:
+            head = self.head.value
+            tail = self.tail.value
+        if head == tail:
+            return 0
+        
+        indices = np.arange(tail, head) % self.capacity
+        replay_buffer.push_batch(
+            self.states.numpy()[indices],
+            self.actions.numpy()[indices],
+            self.rewards.numpy()[indices],
+            self.next_states.numpy()[indices],
+            self.dones.numpy()[indices],
+            self.action_masks.numpy()[indices],
+            self.next_action_masks.numpy()[indices],
+        )
+        with self.lock:
+            self.tail.value = head
+        return head - tail
+    
+    def nbytes(self) -> int:
+        tensors = (self.states, self.next_states, self.actions, self.rewards, self.dones,
+                   self.action_masks, self.next_action_masks)
+        return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+    
+    def bytes_per_transition(self) -> float:
+        return self.nbytes() / self.capacity
+    
+    def __len__(self) -> int:
+        with self.lock:
+            return self.head.value - self.tail.value
+
+
+class SharedWeights:
+    def __init__(self, network: DQNNetwork, ctx=mp):
+        self.network = DQNNetwork(network.fc1.in_features, network.fc4.out_features, network.fc1.out_features)
+        self.network.load_state_dict(network.state_dict())
+        self.network.share_memory()
+        self.version = ctx.RawValue("q", 0)
+        self.lock = ctx.Lock()
+    
+    def publish(self, network: DQNNetwork) -> None:
+        with self.lock:
+            self.network.load_state_dict(network.state_dict())
+            self.version.value += 1
+    
+    def pull(self, network: DQNNetwork, version: int) -> int:
+        if self.version.value == version:
+            return version
+        with self.lock:
+            network.load_state_dict(self.network.state_dict())
+            return self.version.value
+
+
+def actor_epsilon(actor_id: int, num_actors: int, base: float = 0.4, alpha: float = 7.0) -> float:
+    if num_actors == 1:
+        return base
+    return base ** (1 + alpha * actor_id / (num_actors - 1))
+
+
+def _actor_main(
+    actor_id: int,
+    num_actors: int,
+    seed: int,
+    queue: SharedTransitionQueue,
+    weights: SharedWeights,
+    stop_event,
+    games_played,
+    weight_sync_games: int,
+    inference_client=None,
+) -> None:
+    torch.set_num_threads(1)
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    
+    agent = DQNAgent(
+        STATE_DIM,
+        ActionEncoder(),
+        epsilon_start=actor_epsilon(actor_id, num_actors),
+        device=torch.device("cpu"),
+        replay_capacity=1,
+        seed=seed,
+    )
+    queue.stop_event = stop_event
+    agent.replay_buffer = queue
+    version = weights.pull(agent.q_network, -1) if weights is not None else 0
+    
+    if inference_client is not None:
+        inference_client.epsilon = agent.epsilon
+        inference_client.rng = agent.rng
+        inference_client.replay_buffer = queue
+        agent = inference_client
+    
+    try:
+        while not stop_event.is_set():
+            play_game(agent, training=True)
+            games_played.value += 1
+            if weights is not None and games_played.value % weight_sync_games == 0:
+                version = weights.pull(agent.q_network, version)
+    except (ShutdownRequested, KeyboardInterrupt):
+        pass
+
+
+def train_distributed(
+    num_actors: int = 4,
+    num_updates: int = 100000,
+    batch_size: int = 32,
+    warmup_transitions: int = 1000,
+    target_update_freq: int = 1000,
+    weight_publish_freq: int = 100,
+    weight_sync_games: int = 10,
+    queue_capacity: int = 4096,
+    replay_capacity: int = 1000000,
+    report_interval: float = 10.0,
+    save_path: str = "dqn_model.pt",
+    seed: int = 0,
+    double_dqn: bool = False,
+    prioritized_replay: bool = False,
+    max_seconds: Optional[float] = None,
+    central_inference: bool = False,
+    inference_batch_size: int = 256,
+) -> DQNAgent:
+    ctx = mp.get_context("spawn")
+    agent = DQNAgent(
+        STATE_DIM,
+        ActionEncoder(),
+        replay_capacity=replay_capacity,
+        double_dqn=double_dqn,
+        prioritized_replay=prioritized_replay,
+    )
+    action_dim = agent.action_encoder.get_max_actions()
+    
+    stop_event = ctx.Event()
+    server = None
+    bridge = None
+    model_lock = nullcontext()
+    if central_inference:
+        model_lock = threading.Lock()
+        server = InferenceServer(agent.q_network, agent.device, max_batch_size=inference_batch_size,
+                                 lock=model_lock).start()
+        bridge = ProcessInferenceBridge(server, num_actors, ctx).start()
+        weights = None
+    else:
+        weights = SharedWeights(agent.q_network, ctx)
+    queues = [SharedTransitionQueue(queue_capacity, STATE_DIM, action_dim, ctx) for _ in range(num_actors)]
+    games_played = [ctx.RawValue("q", 0) for _ in range(num_actors)]
+    
+    actors = [
+        ctx.Process(
+            target=_actor_main,
+            args=(
+                i, num_actors, seed + i, queues[i], weights, stop_event, games_played[i], weight_sync_games,
+                bridge.client(i) if bridge is not None else None,
+            ),
+            daemon=True,
+        )
+        for i in range(num_actors)
+    ]
+    for actor in actors:
+        actor.start()
+    
+    updates = 0
+    losses = []
+    start_time = time.time()
+    last_report = start_time
+    last_steps = 0
+    last_updates = 0
+    
+    try:
+        while updates < num_updates:
+            for queue in queues:
+                queue.drain(agent.replay_buffer)
+            
+            if len(agent.replay_buffer) < max(batch_size, warmup_transitions):
+                if not any(actor.is_alive() for actor in actors):
+                    raise RuntimeError("All actor processes exited")
+                time.sleep(0.01)
+                continue
+            
+            with model_lock:
+                loss = agent.train_step(batch_size)
+            updates += 1
+            if loss is not None:
+                losses.append(loss)
+            
+            if weights is not None and updates % weight_publish_freq == 0:
+                weights.publish(agent.q_network)
+            if updates % target_update_freq == 0:
+                agent.update_target_network()
+            
+            now = time.time()
+            if now - last_report >= report_interval:
+                steps = sum(queue.head.value for queue in queues)
+                games = sum(g.value for g in games_played)
+                elapsed = now - last_report
+                avg_loss = sum(losses[-100:]) / len(losses[-100:]) if losses else 0.0
+                print(
+                    f"Updates {updates}, Games {games}, Actor Steps/s: {(steps - last_steps) / elapsed:.0f}, "
+                    f"Learner Updates/s: {(updates - last_updates) / elapsed:.1f}, "
+                    f"Replay: {len(agent.replay_buffer)}, Avg Loss: {avg_loss:.4f}"
+                    + (f", Inference Batch: {server.mean_batch_size():.1f}" if server is not None else "")
+                )
+                last_report, last_steps, last_updates = now, steps, updates
+            
+            if max_seconds is not None and now - start_time >= max_seconds:
+                break
+    except KeyboardInterrupt:
+        print("Interrupted, shutting down actors...")
+    finally:
+        stop_event.set()
+        for actor in actors:
+            actor.join(timeout=5.0)
+        for actor in actors:
+            if actor.is_alive():
+                actor.terminate()
+                actor.join()
+        if bridge is not None:
+            bridge.stop()
+            server.stop()
+    
+    agent.save(save_path)
+    print(f"Training complete after {updates} updates. Final model saved to {save_path}")
+    return agent
+
+
+if __name__ == "__main__":
+    import sys
+    num_actors = int(sys.argv[1]) if len(sys.argv) > 1 else max(mp.cpu_count() - 1, 1)
+    train_distributed(num_actors=num_actors)
@@ -1,15 +1,61 @@
 import random
+import threading
 import numpy as np
 import torch
 import torch.nn.functional as F
 import torch.optim as optim
 from typing import Optional
 from game_state import GameState
-from state_encoder import encode_state
-from action_encoder import ActionEncoder
+from state_encoder import encode_state, FEATURE_SCALES
+from action_encoder import ActionEncoder, action_encoder_from_spec
 from dqn_network import DQNNetwork
-from replay_buffer import ReplayBuffer, Transition
-from actions import Action
+from inference_policy import save_weights, weights_path
+from replay_buffer import (
+    ReplayBuffer, PrioritizedReplayBuffer, CompressedReplayBuffer, BatchPrefetcher, Transition, TensorBatch,
+)
+from profiler import NULL_PROFILER
+from episode_buffer import EpisodeBuffer
+from actions import Action, ActionType
+
+
+def begin_transition(action_encoder: ActionEncoder, state: GameState, action: Action, player_idx: int) -> Transition:
+    return Transition(
+        state=encode_state(state, player_idx),
+        action=action_encoder.encode(action, state),
+        reward=0.0,
+        next_state=None,
+        done=False,
+        action_mask=action_encoder.get_action_mask(state),
+        next_action_mask=None,
+    )
+
+
+def finish_transition(
+    action_encoder: ActionEncoder,
+    transition: Transition,
+    reward: float,
+    next_state: GameState,
+    done: bool,
+    player_idx: int,
+) -> Transition:
+    transition.reward = reward
+    transition.next_state = encode_state(next_state, player_idx)
+    transition.done = done
+    transition.next_action_mask = action_encoder.get_action_mask(next_state)
+    return transition
+
+
+def build_transition(
+    action_encoder: ActionEncoder,
+    state: GameState,
+    action: Action,
+    reward: float,
+    next_state: GameState,
+    done: bool,
+    player_idx: int,
+) -> Transition:
+    transition = begin_transition(action_encoder, state, action, player_idx)
+    return finish_transition(action_encoder, transition, reward, next_state, done, player_idx)
 
 
 class DQNAgent:
@@ -23,12 +69,29 @@ class DQNAgent:
         epsilon_end: float = 0.01,
         epsilon_decay: float = 0.995,
         device: Optional[torch.device] = None,
+        replay_capacity: int = 100000,
+        double_dqn: bool = False,
+        prioritized_replay: bool = False,
+        per_alpha: float = 0.6,
+        per_beta: float = 0.4,
+        compressed_replay: bool = False,
+        n_step: int = 1,
+        td_lambda: Optional[float] = None,
+        seed: Optional[int] = None,
     ):
         self.action_encoder = action_encoder
+        self.rng = random.Random(seed)
         self.gamma = gamma
         self.epsilon = epsilon_start
         self.epsilon_end = epsilon_end
         self.epsilon_decay = epsilon_decay
+        self.double_dqn = double_dqn
+        self.n_step = n_step
+        self.td_lambda = td_lambda
+        self.bootstrap_gamma = gamma ** n_step
+        self.episodes: dict[int, EpisodeBuffer] = {}
+        self.env_steps = 0
+        self.updates = 0
         
         if device is None:
             self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -41,35 +104,51 @@ class DQNAgent:
         self.target_network.eval()
         
         self.optimizer = optim.Adam(self.q_network.parameters(), lr=learning_rate)
-        self.replay_buffer = ReplayBuffer()
+        assert not (prioritized_replay and compressed_replay), "Compressed replay does not support prioritization"
+        if compressed_replay:
+            self.replay_buffer = CompressedReplayBuffer(replay_capacity, FEATURE_SCALES, action_encoder.get_max_actions())
+        elif prioritized_replay:
+            self.replay_buffer = PrioritizedReplayBuffer(
+                replay_capacity, state_dim, action_encoder.get_max_actions(), alpha=per_alpha, beta=per_beta
+            )
+        else:
+            self.replay_buffer = ReplayBuffer(replay_capacity, state_dim, action_encoder.get_max_actions())
+        self.replay_lock = threading.Lock()
+        self.network_lock = threading.Lock()
+        self.prefetcher: Optional[BatchPrefetcher] = None
+        self.trajectory_store = None
+        self.profiler = NULL_PROFILER
     
     def select_action(self, state: GameState, player_idx: int, training: bool = True) -> Action:
-        if training and random.random() < self.epsilon:
+        if training and self.rng.random() < self.epsilon:
             valid_actions = self.action_encoder.get_valid_action_indices(state)
             if not valid_actions:
                 return Action(ActionType.END_TURN)
-            action_idx = random.choice(valid_actions)
-            return self.action_encoder.decode(action_idx)
+            action_idx = self.rng.choice(valid_actions)
+            return self.action_encoder.decode(action_idx, state)
         
-        state_tensor = torch.FloatTensor(encode_state(state, player_idx)).unsqueeze(0).to(self.device)
+        profiler = self.profiler
+        with profiler.phase("select_action.encode_state"):
+            state_tensor = torch.tensor(encode_state(state, player_idx)).unsqueeze(0).to(self.device)
         
-        with torch.no_grad():
+        with profiler.phase("select_action.forward"), self.network_lock, torch.no_grad():
             q_values = self.q_network(state_tensor)
         
-        action_mask = self.action_encoder.get_action_mask(state, max_size=q_values.shape[1])
-        if not any(action_mask):
+        with profiler.phase("select_action.action_mask"):
+            action_mask = self.action_encoder.get_action_mask(state, max_size=q_values.shape[1])
+        if not action_mask.any():
             return Action(ActionType.END_TURN)
         
         q_values_np = q_values.cpu().numpy()[0]
         masked_q_values = np.where(action_mask, q_values_np, -np.inf)
         action_idx = np.argmax(masked_q_values)
         
-        action = self.action_encoder.decode(action_idx)
+        action = self.action_encoder.decode(action_idx, state)
         if action is None:
             valid_actions = self.action_encoder.get_valid_action_indices(state)
             if valid_actions:
-                action_idx = random.choice(valid_actions)
-                action = self.action_encoder.decode(action_idx)
+                action_idx = self.rng.choice(valid_actions)
+                action = self.action_encoder.decode(action_idx, state)
             else:
                 action = Action(ActionType.END_TURN)
         
@@ -88,61 +167,119 @@ class DQNAgent:
         done: bool,
         player_idx: int,
     ) -> None:
-        state_vec = encode_state(state, player_idx)
-        next_state_vec = encode_state(next_state, player_idx)
-        action_idx = self.action_encoder.encode(action)
-        action_mask = self.action_encoder.get_action_mask(state)
-        next_action_mask = self.action_encoder.get_action_mask(next_state)
-        
-        transition = Transition(
-            state=state_vec,
-            action=action_idx,
-            reward=reward,
-            next_state=next_state_vec,
-            done=done,
-            action_mask=action_mask,
-            next_action_mask=next_action_mask,
-        )
-        self.replay_buffer.push(transition)
+        self.end_transition(self.begin_transition(state, action, player_idx), reward, next_state, done, player_idx)
+    
+    def begin_transition(self, state: GameState, action: Action, player_idx: int) -> Transition | EpisodeBuffer:
+        self.env_steps += 1
+        with self.profiler.phase("store_transition.build"):
+            if self.n_step > 1 or self.td_lambda is not None:
+                episode = self.episodes.setdefault(player_idx, EpisodeBuffer())
+                episode.append(
+                    encode_state(state, player_idx),
+                    self.action_encoder.encode(action, state),
+                    self.action_encoder.get_action_mask(state),
+                )
+                return episode
+            return begin_transition(self.action_encoder, state, action, player_idx)
+    
+    def end_transition(self, transition: Transition | EpisodeBuffer, reward: float, next_state: GameState, done: bool,
+                       player_idx: int) -> None:
+        with self.profiler.phase("store_transition.build"):
+            if isinstance(transition, EpisodeBuffer):
+                transition.close_step(
+                    reward, encode_state(next_state, player_idx), self.action_encoder.get_action_mask(next_state), done
+                )
+                return
+            finish_transition(self.action_encoder, transition, reward, next_state, done, player_idx)
+        with self.profiler.phase("store_transition.push"):
+            with self.replay_lock:
+                self.replay_buffer.push(transition)
+            if self.trajectory_store is not None:
+                self.trajectory_store.push(transition)
+    
+    def end_episode(self) -> None:
+        with self.profiler.phase("store_transition.episode"):
+            for episode in self.episodes.values():
+                if len(episode) == 0:
+                    continue
+                if self.td_lambda is None:
+                    arrays = episode.n_step_arrays(self.gamma, self.n_step)
+                else:
+                    next_states, next_masks = episode.next_state_arrays()
+                    with self.network_lock, torch.no_grad():
+                        next_values = self.next_state_values(
+                            torch.from_numpy(next_states).to(self.device), torch.from_numpy(next_masks).to(self.device)
+                        ).cpu().numpy()
+                    arrays = episode.lambda_arrays(self.gamma, self.td_lambda, next_values)
+                if len(arrays[0]):
+                    with self.replay_lock:
+                        self.replay_buffer.push_batch(*arrays)
+                    if self.trajectory_store is not None:
+                        self.trajectory_store.push_batch(*arrays)
+            self.episodes.clear()
+    
+    def start_prefetch(self, batch_size: int = 32, depth: int = 2, pin_memory: bool = False) -> BatchPrefetcher:
+        assert self.prefetcher is None, "Prefetching already started"
+        self.prefetcher = BatchPrefetcher(
+            self.replay_buffer, batch_size, depth, self.device, pin_memory and self.device.type == "cuda", self.replay_lock
+        ).start()
+        return self.prefetcher
+    
+    def stop_prefetch(self) -> None:
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+            self.prefetcher = None
     
     def train_step(self, batch_size: int = 32) -> Optional[float]:
         if len(self.replay_buffer) < batch_size:
             return None
         
-        batch = self.replay_buffer.sample(batch_size)
-        
-        states = torch.FloatTensor(np.array([t.state for t in batch])).to(self.device)
-        actions = torch.LongTensor([t.action for t in batch]).to(self.device)
-        rewards = torch.FloatTensor([t.reward for t in batch]).to(self.device)
-        next_states = torch.FloatTensor(np.array([t.next_state for t in batch])).to(self.device)
-        dones = torch.BoolTensor([t.done for t in batch]).to(self.device)
+        with self.profiler.phase("train_step.sample"):
+            if self.prefetcher is not None:
+                assert self.prefetcher.batch_size == batch_size, "Prefetcher was started with a different batch size"
+                batch = self.prefetcher.get()
+            else:
+                batch = self.replay_buffer.sample_tensors(batch_size, self.device)
         
-        current_q_values = self.q_network(states).gather(1, actions.unsqueeze(1))
+        with self.profiler.phase("train_step.update"):
+            loss = self._update(batch)
+        self.updates += 1
+        return loss
+    
+    def _update(self, batch: TensorBatch) -> float:
+        current_q_values = self.q_network(batch.states).gather(1, batch.actions.unsqueeze(1))
         
         with torch.no_grad():
-            next_q_values = self.target_network(next_states)
-            for i, t in enumerate(batch):
-                mask_tensor = torch.tensor(t.next_action_mask[:next_q_values.shape[1]], dtype=torch.bool).to(self.device)
-                if len(mask_tensor) < next_q_values.shape[1]:
-                    padding = torch.zeros(next_q_values.shape[1] - len(mask_tensor), dtype=torch.bool).to(self.device)
-                    mask_tensor = torch.cat([mask_tensor, padding])
-                next_q_values[i] = torch.where(
-                    mask_tensor,
-                    next_q_values[i],
-                    torch.tensor(-np.inf, device=self.device)
-                )
-            next_max_q = next_q_values.max(1)[0]
-            target_q_values = rewards + (self.gamma * next_max_q * ~dones)
+            next_values = self.next_state_values(batch.next_states, batch.next_action_masks)
+            target_q_values = batch.rewards + self.bootstrap_gamma * torch.where(batch.dones, 0.0, next_values)
         
-        loss = F.mse_loss(current_q_values.squeeze(), target_q_values)
+        current_q_values = current_q_values.squeeze(1)
+        if batch.weights is not None:
+            td_errors = target_q_values - current_q_values
+            loss = (batch.weights * td_errors.pow(2)).mean()
+            with self.replay_lock:
+                self.replay_buffer.update_priorities(batch.indices, td_errors.detach().abs().cpu().numpy())
+        else:
+            loss = F.mse_loss(current_q_values, target_q_values)
         
         self.optimizer.zero_grad()
         loss.backward()
         torch.nn.utils.clip_grad_norm_(self.q_network.parameters(), 10)
-        self.optimizer.step()
+        with self.network_lock:
+            self.optimizer.step()
         
         return loss.item()
     
+    def next_state_values(self, next_states: torch.Tensor, next_action_masks: torch.Tensor) -> torch.Tensor:
+        next_q_values = self.target_network(next_states)
+        if self.double_dqn:
+            online_q_values = self.q_network(next_states).masked_fill(~next_action_masks, -np.inf)
+            next_actions = online_q_values.argmax(dim=1, keepdim=True)
+            next_values = next_q_values.gather(1, next_actions).squeeze(1)
+        else:
+            next_values = next_q_values.masked_fill(~next_action_masks, -np.inf).max(dim=1).values
+        return torch.where(next_action_masks.any(dim=1), next_values, 0.0)
+    
     def update_target_network(self) -> None:
         self.target_network.load_state_dict(self.q_network.state_dict())
     
@@ -152,8 +289,13 @@ class DQNAgent:
             'target_network': self.target_network.state_dict(),
             'optimizer': self.optimizer.state_dict(),
             'epsilon': self.epsilon,
-            'action_encoder': self.action_encoder,
+            'network': self.q_network.spec(),
+            'action_encoder': self.action_encoder.spec(),
         }, path)
+        save_weights(
+            weights_path(path), self.q_network.spec(), self.action_encoder.spec(),
+            {name: tensor.cpu().numpy() for name, tensor in self.q_network.state_dict().items()},
+        )
     
     def load(self, path: str) -> None:
         checkpoint = torch.load(path, map_location=self.device)
@@ -161,4 +303,4 @@ class DQNAgent:
         self.target_network.load_state_dict(checkpoint['target_network'])
         self.optimizer.load_state_dict(checkpoint['optimizer'])
         self.epsilon = checkpoint['epsilon']
-        self.action_encoder = checkpoint['action_encoder']
+        self.action_encoder = action_encoder_from_spec(checkpoint['action_encoder'])
@@ -4,6 +4,8 @@ import torch.nn.functional as F
 
 
 class DQNNetwork(nn.Module):
+    LAYERS = (("fc1", "relu"), ("fc2", "relu"), ("fc3", "relu"), ("fc4", "linear"))
+    
     def __init__(self, state_dim: int, action_dim: int, hidden_dim: int = 256):
         super().__init__()
         self.fc1 = nn.Linear(state_dim, hidden_dim)
@@ -11,6 +13,19 @@ class DQNNetwork(nn.Module):
         self.fc3 = nn.Linear(hidden_dim, hidden_dim)
         self.fc4 = nn.Linear(hidden_dim, action_dim)
     
+    @classmethod
+    def from_spec(cls, spec: dict) -> "DQNNetwork":
+        assert [tuple(layer) for layer in spec["layers"]] == list(cls.LAYERS), "Checkpoint layers do not match DQNNetwork"
+        return cls(spec["state_dim"], spec["action_dim"], spec["hidden_dim"])
+    
+    def spec(self) -> dict:
+        return {
+            "state_dim": self.fc1.in_features,
+            "action_dim": self.fc4.out_features,
+            "hidden_dim": self.fc1.out_features,
+            "layers": [list(layer) for layer in self.LAYERS],
+        }
+    
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         x = F.relu(self.fc1(x))
         x = F.relu(self.fc2(x))
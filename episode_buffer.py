@@ -0,0 +1,92 @@
+import numpy as np
+from functools import lru_cache
+from typing import Optional
+
+
+_BLOCK = 64
+
+
+@lru_cache(maxsize=16)
+def _block_weights(discount: float) -> np.ndarray:
+    gaps = np.arange(_BLOCK)[:, None] - np.arange(_BLOCK)[None, :]
+    return np.where(gaps >= 0, discount ** np.maximum(gaps, 0), 0.0)
+
+
+def discounted_sums(values: np.ndarray, discount: float, horizon: Optional[int] = None) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    count = len(values)
+    if horizon is not None and horizon < count:
+        padded = np.concatenate([values, np.zeros(horizon)])
+        out = padded[horizon - 1:horizon - 1 + count].copy()
+        for k in range(horizon - 2, -1, -1):
+            out = padded[k:k + count] + discount * out
+        return out
+    
+    blocks = -(-count // _BLOCK)
+    padded = np.zeros(blocks * _BLOCK)
+    padded[:count] = values
+    local = padded.reshape(blocks, _BLOCK) @ _block_weights(discount)
+    carry = np.zeros(blocks)
+    if blocks > 1:
+        carry[:-1] = discounted_sums(local[1:, 0], discount ** _BLOCK)
+    return (local + carry[:, None] * discount ** (_BLOCK - np.arange(_BLOCK))).ravel()[:count]
+
+
+class EpisodeBuffer:
+    def __init__(self):
+        self.states: list[np.ndarray] = []
+        self.actions: list[int] = []
+        self.action_masks: list[np.ndarray] = []
+        self.rewards: list[float] = []
+        self.final_state: Optional[np.ndarray] = None
+        self.final_action_mask: Optional[np.ndarray] = None
+        self.done = False
+    
+    def __len__(self) -> int:
+        return len(self.rewards)
+    
+    def append(self, state: np.ndarray, action: int, action_mask: np.ndarray) -> None:
+        assert len(self.states) == len(self.rewards), "Previous step was not closed"
+        self.states.append(state)
+        self.actions.append(action)
+        self.action_masks.append(action_mask)
+    
+    def close_step(self, reward: float, next_state: np.ndarray, next_action_mask: np.ndarray, done: bool) -> None:
+        assert len(self.rewards) == len(self.states) - 1, "No open step to close"
+        self.rewards.append(reward)
+        self.final_state = next_state
+        self.final_action_mask = next_action_mask
+        self.done = done
+    
+    def _stacked(self) -> tuple[np.ndarray, np.ndarray]:
+        states = np.stack(self.states + [self.final_state])
+        masks = np.stack(self.action_masks + [self.final_action_mask])
+        return states, masks
+    
+    def n_step_arrays(self, gamma: float, n_step: int) -> tuple[np.ndarray, ...]:
+        count = len(self)
+        states, masks = self._stacked()
+        returns = discounted_sums(np.array(self.rewards), gamma, n_step)
+        targets = np.minimum(np.arange(count) + n_step, count)
+        dones = self.done & (targets == count)
+        keep = (targets - np.arange(count) == n_step) | dones
+        return (
+            states[:count][keep], np.array(self.actions, dtype=np.int64)[keep], returns[keep].astype(np.float32),
+            states[targets][keep], dones[keep], masks[:count][keep], masks[targets][keep],
+        )
+    
+    def next_state_arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        states, masks = self._stacked()
+        return states[1:], masks[1:]
+    
+    def lambda_arrays(self, gamma: float, td_lambda: float, next_values: np.ndarray) -> tuple[np.ndarray, ...]:
+        count = len(self)
+        states, masks = self._stacked()
+        next_values = np.asarray(next_values, dtype=np.float64)
+        bootstrap = next_values * gamma * (1.0 - td_lambda)
+        bootstrap[-1] = 0.0 if self.done else gamma * next_values[-1]
+        returns = discounted_sums(np.array(self.rewards) + bootstrap, gamma * td_lambda)
+        return (
+            states[:count], np.array(self.actions, dtype=np.int64), returns.astype(np.float32),
+            states[1:], np.ones(count, dtype=bool), masks[:count], masks[1:],
+        )
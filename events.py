@@ -0,0 +1,51 @@
+from enum import Enum
+from typing import NamedTuple, Optional
+from cards import Card
+
+
+class EventType(Enum):
+    CARD_DRAWN = "card_drawn"
+    POKEMON_PLAYED = "pokemon_played"
+    ENERGY_ATTACHED = "energy_attached"
+    DAMAGE_DEALT = "damage_dealt"
+    KNOCKOUT = "knockout"
+    PRIZE_TAKEN = "prize_taken"
+    TURN_ENDED = "turn_ended"
+    GAME_WON = "game_won"
+
+
+class GameEvent(NamedTuple):
+    event_type: EventType
+    player_idx: int
+    card: Optional[Card] = None
+    amount: int = 0
+
+
+def _card_name(card: Optional[Card]) -> str:
+    if card is None:
+        return "a card"
+    if hasattr(card, "name"):
+        return card.name
+    return f"{card.energy_type.value} energy"
+
+
+def describe_event(event: GameEvent, viewer: Optional[int] = None) -> str:
+    who = f"Player {event.player_idx + 1}"
+    hidden = viewer is not None and viewer != event.player_idx
+    card = _card_name(None if hidden else event.card)
+    
+    if event.event_type == EventType.CARD_DRAWN:
+        return f"{who} drew {card}"
+    if event.event_type == EventType.POKEMON_PLAYED:
+        return f"{who} played {_card_name(event.card)} to the {'bench' if event.amount else 'active spot'}"
+    if event.event_type == EventType.ENERGY_ATTACHED:
+        return f"{who} attached {_card_name(event.card)} to {'bench slot ' + str(event.amount) if event.amount else 'the active Pokemon'}"
+    if event.event_type == EventType.DAMAGE_DEALT:
+        return f"{who} dealt {event.amount} damage to {_card_name(event.card)}"
+    if event.event_type == EventType.KNOCKOUT:
+        return f"{who} knocked out {_card_name(event.card)}"
+    if event.event_type == EventType.PRIZE_TAKEN:
+        return f"{who} took a prize ({card}), {event.amount} left"
+    if event.event_type == EventType.TURN_ENDED:
+        return f"{who} ended the turn"
+    return f"{who} wins!"
@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import warnings
+from typing import Callable, Optional
+import numpy as np
+import torch
+import torch.nn as nn
+from action_encoder import ActionEncoder, action_encoder_from_spec
+from dqn_network import DQNNetwork
+from game import apply_action, get_valid_actions
+from game_engine import initialize_game
+from game_state import GameState
+from inference_policy import InferencePolicy, NumpyQNetwork, METADATA_FILE, torch_q_function
+from state_encoder import encode_state
+
+
+VARIANTS = ("float", "int8")
+
+
+def load_checkpoint_network(path: str) -> tuple[DQNNetwork, ActionEncoder]:
+    checkpoint = torch.load(path, map_location="cpu", weights_only=True)
+    network = DQNNetwork.from_spec(checkpoint["network"])
+    network.load_state_dict(checkpoint["q_network"])
+    return network.eval(), action_encoder_from_spec(checkpoint["action_encoder"])
+
+
+def compile_network(network: DQNNetwork, variant: str) -> torch.jit.ScriptModule:
+    assert variant in VARIANTS, f"Unknown variant {variant}"
+    example = torch.zeros(1, network.fc1.in_features)
+    with warnings.catch_warnings(), torch.no_grad():
+        warnings.simplefilter("ignore", FutureWarning)
+        warnings.simplefilter("ignore", DeprecationWarning)
+        warnings.simplefilter("ignore", UserWarning)
+        if variant == "float":
+            return torch.jit.optimize_for_inference(torch.jit.trace(network, example))
+        quantized = torch.ao.quantization.quantize_dynamic(network, {nn.Linear}, dtype=torch.qint8)
+        return torch.jit.freeze(torch.jit.trace(quantized, example))
+
+
+def export_inference(checkpoint_path: str, output_path: str, variant: str = "int8") -> InferencePolicy:
+    network, action_encoder = load_checkpoint_network(checkpoint_path)
+    module = compile_network(network, variant)
+    metadata = {
+        "variant": variant,
+        "state_dim": network.fc1.in_features,
+        "action_dim": network.fc4.out_features,
+        "action_encoder": action_encoder.spec(),
+    }
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        torch.jit.save(module, output_path, _extra_files={METADATA_FILE: json.dumps(metadata)})
+    return InferencePolicy(torch_q_function(module), action_encoder)
+
+
+def sample_states(num_states: int, seed: int = 0) -> list[GameState]:
+    rng = random.Random(seed)
+    states = []
+    while len(states) < num_states:
+        state = initialize_game(rng=rng)
+        while state.winner is None and state.opponent_player_state.deck and len(states) < num_states:
+            states.append(state.clone())
+            actions = get_valid_actions(state)
+            apply_action(state, rng.choice(actions))
+    return states
+
+
+def masked_argmax(q_values: np.ndarray, action_mask: np.ndarray) -> int:
+    return int(np.argmax(np.where(action_mask, q_values, -np.inf)))
+
+
+def argmax_agreement(reference: DQNNetwork, policy: InferencePolicy, states: list[GameState]) -> float:
+    agree = 0
+    for state in states:
+        state_vec = encode_state(state, state.current_player)
+        action_mask = policy.action_encoder.get_action_mask(state)
+        with torch.no_grad():
+            expected = reference(torch.tensor(state_vec).unsqueeze(0))[0].numpy()
+        agree += masked_argmax(expected, action_mask) == masked_argmax(policy.q_values(state_vec), action_mask)
+    return agree / len(states)
+
+
+def forward_latency_us(q_function: Callable[[np.ndarray], np.ndarray], state_vecs: np.ndarray, repeats: int = 5) -> float:
+    best = float("inf")
+    for row in state_vecs[:50]:
+        q_function(row)
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for row in state_vecs:
+            q_function(row)
+        best = min(best, (time.perf_counter() - start) / len(state_vecs))
+    return 1e6 * best
+
+
+def compare_variants(checkpoint_path: str, num_states: int = 1000, seed: int = 0) -> list[dict]:
+    network, action_encoder = load_checkpoint_network(checkpoint_path)
+    states = sample_states(num_states, seed)
+    state_vecs = np.stack([encode_state(state, state.current_player) for state in states])
+    rows = [{"variant": "eager", "agreement": 1.0, "latency_us": forward_latency_us(torch_q_function(network), state_vecs)}]
+    numpy_network = NumpyQNetwork.from_spec(network.spec(), {k: v.numpy() for k, v in network.state_dict().items()})
+    candidates = [("numpy", numpy_network)]
+    candidates += [(variant, torch_q_function(compile_network(network, variant))) for variant in VARIANTS]
+    for variant, q_function in candidates:
+        policy = InferencePolicy(q_function, action_encoder)
+        rows.append({
+            "variant": variant,
+            "agreement": argmax_agreement(network, policy, states),
+            "latency_us": forward_latency_us(q_function, state_vecs),
+        })
+    return rows
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export a DQN checkpoint as a compiled CPU inference artifact")
+    parser.add_argument("checkpoint")
+    parser.add_argument("--output", help="Artifact path (default: <checkpoint>.<variant>.ts)")
+    parser.add_argument("--variant", choices=VARIANTS, default="int8")
+    parser.add_argument("--states", type=int, default=1000, help="Sampled states for the agreement and latency check")
+    parser.add_argument("--min-agreement", type=float, default=0.98)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    
+    torch.set_num_threads(1)
+    rows = compare_variants(args.checkpoint, args.states, args.seed)
+    for row in rows:
+        print(f"{row['variant']:8s} agreement {row['agreement']:7.2%}   latency {row['latency_us']:8.1f} us")
+    
+    output = args.output or f"{os.path.splitext(args.checkpoint)[0]}.{args.variant}.ts"
+    agreement = next(row["agreement"] for row in rows if row["variant"] == args.variant)
+    if agreement < args.min_agreement:
+        print(f"Refusing to export {args.variant}: agreement {agreement:.2%} is below {args.min_agreement:.2%}")
+        return 1
+    export_inference(args.checkpoint, output, args.variant)
+    print(f"Exported {args.variant} policy to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,33 @@
-from game_engine import GameState, initialize_game, draw_card, play_pokemon, attach_energy, attack, end_turn, check_win_condition, get_observable_state
+from dataclasses import dataclass
+from typing import Optional
+from card_catalog import CATALOG
+from cards import Card, PokemonCard, EnergyCard
+from game_engine import GameState, MAX_BENCH_SIZE, can_attack, initialize_game, draw_card, play_pokemon, attach_energy, attack, end_turn, check_win_condition, get_observable_state
+from game_state import PokemonInPlay
 from actions import Action, ActionType
 
 
-def apply_action(state: GameState, action: Action) -> bool:
+@dataclass(frozen=True)
+class UndoRecord:
+    action: Action
+    player_idx: int
+    energy_attached_this_turn: int
+    pokemon_played_this_turn: bool
+    card: Optional[Card] = None
+    defending: Optional[PokemonInPlay] = None
+    defending_damage: int = 0
+    hashes: Optional[tuple[int, int, int]] = None
+
+
+def apply_action(state: GameState, action: Action, record_undo: bool = False) -> bool | UndoRecord:
     assert state.winner is None, "Game is over"
     assert state.current_player == 0 or state.current_player == 1, "Invalid current player"
     
+    if record_undo:
+        record = _make_undo_record(state, action)
+        apply_action(state, action)
+        return record
+    
     if action.action_type == ActionType.DRAW_CARD:
         return draw_card(state, state.current_player)
     
@@ -30,18 +52,95 @@ def apply_action(state: GameState, action: Action) -> bool:
     return False
 
 
-def get_valid_actions(state: GameState) -> list[Action]:
-    from cards import PokemonCard, EnergyCard
+def _make_undo_record(state: GameState, action: Action) -> UndoRecord:
+    player = state.current_player_state
+    card = None
+    defending = None
+    defending_damage = 0
+    
+    if action.action_type in (ActionType.PLAY_POKEMON, ActionType.ATTACH_ENERGY):
+        assert action.hand_index is not None and action.hand_index < len(player.hand), "Invalid hand index"
+        card = player.hand[action.hand_index]
+    elif action.action_type == ActionType.ATTACK:
+        defending = state.opponent_player_state.active_pokemon
+        if defending is not None:
+            defending_damage = defending.damage
+    
+    return UndoRecord(
+        action=action,
+        player_idx=state.current_player,
+        energy_attached_this_turn=player.energy_attached_this_turn,
+        pokemon_played_this_turn=player.pokemon_played_this_turn,
+        card=card,
+        defending=defending,
+        defending_damage=defending_damage,
+        hashes=tuple(state.hashes) if state.hashes is not None else None,
+    )
+
+
+def undo_action(state: GameState, record: UndoRecord) -> None:
+    action = record.action
+    player = state.player1 if record.player_idx == 0 else state.player2
+    opponent = state.player2 if record.player_idx == 0 else state.player1
+    
+    if action.action_type == ActionType.DRAW_CARD:
+        player.deck.append(player.hand.pop())
+    
+    elif action.action_type == ActionType.PLAY_POKEMON:
+        if action.bench:
+            player.bench.pop()
+        else:
+            player.active_pokemon = None
+        player.hand.insert(action.hand_index, record.card)
     
+    elif action.action_type == ActionType.ATTACH_ENERGY:
+        target = player.active_pokemon if action.pokemon_index is None else player.bench[action.pokemon_index]
+        target.attached_energy.pop()
+        player.hand.insert(action.hand_index, record.card)
+    
+    elif action.action_type == ActionType.ATTACK:
+        if opponent.active_pokemon is None:
+            player.prizes.append(player.hand.pop())
+            opponent.active_pokemon = record.defending
+        record.defending.damage = record.defending_damage
+    
+    elif action.action_type == ActionType.END_TURN:
+        opponent.deck.append(opponent.hand.pop())
+        state.current_player = record.player_idx
+        state.turn_number -= 1
+    
+    player.energy_attached_this_turn = record.energy_attached_this_turn
+    player.pokemon_played_this_turn = record.pokemon_played_this_turn
+    state.winner = None
+    state.hashes = list(record.hashes) if record.hashes is not None else None
+    state.version += 1
+
+
+def get_valid_actions(state: GameState, canonical: bool = False) -> list[Action]:
+    key = "canonical_actions" if canonical else "actions"
+    cache = state.cached()
+    actions = cache.get(key)
+    if actions is None:
+        actions = cache[key] = tuple(_legal_actions(state, canonical))
+    return list(actions)
+
+
+def _legal_actions(state: GameState, canonical: bool) -> list[Action]:
     player = state.current_player_state
     
     actions = [Action(ActionType.END_TURN)]
     
+    seen = set()
     for i, card in enumerate(player.hand):
+        if canonical:
+            card_id = CATALOG.id_of(card)
+            if card_id in seen:
+                continue
+            seen.add(card_id)
         if isinstance(card, PokemonCard):
             if player.active_pokemon is None and not player.pokemon_played_this_turn:
                 actions.append(Action(ActionType.PLAY_POKEMON, hand_index=i, bench=False))
-            if len(player.bench) < 5 and not player.pokemon_played_this_turn:
+            if len(player.bench) < MAX_BENCH_SIZE and not player.pokemon_played_this_turn:
                 actions.append(Action(ActionType.PLAY_POKEMON, hand_index=i, bench=True))
         elif isinstance(card, EnergyCard):
             if player.energy_attached_this_turn < 1:
@@ -50,9 +149,19 @@ def get_valid_actions(state: GameState) -> list[Action]:
                 for bench_idx in range(len(player.bench)):
                     actions.append(Action(ActionType.ATTACH_ENERGY, hand_index=i, pokemon_index=bench_idx))
     
-    if player.active_pokemon is not None:
-        from game_engine import can_attack
-        if can_attack(player.active_pokemon):
-            actions.append(Action(ActionType.ATTACK))
+    if (player.active_pokemon is not None and state.opponent_player_state.active_pokemon is not None
+            and can_attack(player.active_pokemon)):
+        actions.append(Action(ActionType.ATTACK))
     
     return actions
+
+
+def canonical_action(state: GameState, action: Action) -> Action:
+    if action.hand_index is None:
+        return action
+    hand = state.current_player_state.hand
+    card_id = CATALOG.id_of(hand[action.hand_index])
+    for i in range(action.hand_index):
+        if CATALOG.id_of(hand[i]) == card_id:
+            return Action(action.action_type, hand_index=i, pokemon_index=action.pokemon_index, bench=action.bench)
+    return action
@@ -2,57 +2,61 @@ import random
 from typing import Optional
 from cards import Card, PokemonCard, EnergyCard, TrainerCard, EnergyType
 from game_state import GameState, PlayerState, PokemonInPlay
+from card_catalog import POKEMON_CARDS, ENERGY_CARDS, TRAINER_CARDS
+import zobrist
+from events import EventType, GameEvent
 
 
-def create_deck(pokemon_count: int = 20, energy_count: int = 20, trainer_count: int = 20) -> list[Card]:
-    from cards import PokemonCard, EnergyCard, TrainerCard, EnergyType
-    
+DECK_SIZE = 60
+PRIZE_COUNT = 6
+INITIAL_HAND_SIZE = 7
+MAX_HAND_SIZE = DECK_SIZE
+MAX_BENCH_SIZE = 5
+
+
+def create_deck(
+    pokemon_count: int = 20,
+    energy_count: int = 20,
+    trainer_count: int = 20,
+    rng: Optional[random.Random] = None,
+) -> list[Card]:
+    if rng is None:
+        rng = random
     deck = []
-    
-    pokemon_cards = [
-        PokemonCard("Pikachu", 60, (EnergyType.ELECTRIC,), (EnergyType.ELECTRIC, EnergyType.COLORLESS), 30, 1),
-        PokemonCard("Charmander", 50, (EnergyType.FIRE,), (EnergyType.FIRE,), 20, 1),
-        PokemonCard("Squirtle", 50, (EnergyType.WATER,), (EnergyType.WATER,), 20, 1),
-        PokemonCard("Bulbasaur", 50, (EnergyType.GRASS,), (EnergyType.GRASS,), 20, 1),
-        PokemonCard("Raichu", 80, (EnergyType.ELECTRIC,), (EnergyType.ELECTRIC, EnergyType.ELECTRIC), 50, 1),
-    ]
-    
     energy_types = list(EnergyType)
-    trainer_cards = [
-        TrainerCard("Potion", "Heal 20 damage"),
-        TrainerCard("Switch", "Switch active Pokemon"),
-        TrainerCard("Professor", "Draw 3 cards"),
-    ]
     
     for _ in range(pokemon_count):
-        deck.append(random.choice(pokemon_cards))
+        deck.append(rng.choice(POKEMON_CARDS))
     for _ in range(energy_count):
-        deck.append(EnergyCard(random.choice(energy_types)))
+        deck.append(ENERGY_CARDS[rng.choice(energy_types)])
     for _ in range(trainer_count):
-        deck.append(random.choice(trainer_cards))
+        deck.append(rng.choice(TRAINER_CARDS))
     
-    random.shuffle(deck)
+    rng.shuffle(deck)
     return deck
 
 
-def initialize_game(deck1: Optional[list[Card]] = None, deck2: Optional[list[Card]] = None) -> GameState:
+def initialize_game(
+    deck1: Optional[list[Card]] = None,
+    deck2: Optional[list[Card]] = None,
+    rng: Optional[random.Random] = None,
+) -> GameState:
     if deck1 is None:
-        deck1 = create_deck()
+        deck1 = create_deck(rng=rng)
     if deck2 is None:
-        deck2 = create_deck()
+        deck2 = create_deck(rng=rng)
     
-    assert len(deck1) >= 7, "Deck must have at least 7 cards"
-    assert len(deck2) >= 7, "Deck must have at least 7 cards"
+    assert len(deck1) >= INITIAL_HAND_SIZE, "Deck must have at least 7 cards"
+    assert len(deck2) >= INITIAL_HAND_SIZE, "Deck must have at least 7 cards"
     
     player1_deck = deck1.copy()
     player2_deck = deck2.copy()
     
-    player1_hand = [player1_deck.pop() for _ in range(7)]
-    player2_hand = [player2_deck.pop() for _ in range(7)]
+    player1_hand = [player1_deck.pop() for _ in range(INITIAL_HAND_SIZE)]
+    player2_hand = [player2_deck.pop() for _ in range(INITIAL_HAND_SIZE)]
     
-    prize_count = 6
-    player1_prizes = [player1_deck.pop() for _ in range(prize_count)]
-    player2_prizes = [player2_deck.pop() for _ in range(prize_count)]
+    player1_prizes = [player1_deck.pop() for _ in range(PRIZE_COUNT)]
+    player2_prizes = [player2_deck.pop() for _ in range(PRIZE_COUNT)]
     
     return GameState(
         player1=PlayerState(deck=player1_deck, hand=player1_hand, prizes=player1_prizes),
@@ -68,6 +72,11 @@ def draw_card(state: GameState, player_idx: int) -> bool:
     
     card = player.deck.pop()
     player.hand.append(card)
+    state.version += 1
+    if state.hashes is not None:
+        zobrist.on_draw(state.hashes, player_idx, player, card)
+    if state.events is not None:
+        state.events.append(GameEvent(EventType.CARD_DRAWN, player_idx, card))
     return True
 
 
@@ -79,13 +88,23 @@ def play_pokemon(state: GameState, player_idx: int, hand_index: int, bench: bool
     card = player.hand[hand_index]
     assert isinstance(card, PokemonCard), "Card must be a Pokemon"
     
+    pokemon = PokemonInPlay(card=card)
     if bench:
-        assert len(player.bench) < 5, "Bench is full"
-        player.bench.append(PokemonInPlay(card=card))
+        assert len(player.bench) < MAX_BENCH_SIZE, "Bench is full"
+        slot = 1 + len(player.bench)
+        player.bench.append(pokemon)
     else:
         assert player.active_pokemon is None, "Active Pokemon already exists"
-        player.active_pokemon = PokemonInPlay(card=card)
-    
+        slot = 0
+        player.active_pokemon = pokemon
+    
+    state.version += 1
+    if state.hashes is not None:
+        zobrist.on_pokemon_placed(state.hashes, player_idx, slot, pokemon)
+        zobrist.on_hand_remove(state.hashes, player_idx, player.hand, hand_index)
+        zobrist.on_turn_flags(state.hashes, player_idx, player, player.energy_attached_this_turn, True)
+    if state.events is not None:
+        state.events.append(GameEvent(EventType.POKEMON_PLAYED, player_idx, card, slot))
     player.hand.pop(hand_index)
     player.pokemon_played_this_turn = True
     return True
@@ -107,6 +126,15 @@ def attach_energy(state: GameState, player_idx: int, hand_index: int, pokemon_in
     assert target is not None, "No Pokemon to attach energy to"
     
     target.attached_energy.append(card)
+    state.version += 1
+    slot = 0 if pokemon_index is None else 1 + pokemon_index
+    if state.hashes is not None:
+        zobrist.on_energy_attached(state.hashes, player_idx, slot, target, card)
+        zobrist.on_hand_remove(state.hashes, player_idx, player.hand, hand_index)
+        zobrist.on_turn_flags(state.hashes, player_idx, player, player.energy_attached_this_turn + 1,
+                              player.pokemon_played_this_turn)
+    if state.events is not None:
+        state.events.append(GameEvent(EventType.ENERGY_ATTACHED, player_idx, card, slot))
     player.hand.pop(hand_index)
     player.energy_attached_this_turn += 1
     return True
@@ -138,10 +166,20 @@ def attack(state: GameState, player_idx: int) -> bool:
     assert can_attack(player.active_pokemon), "Cannot attack"
     
     damage = player.active_pokemon.card.attack_damage
-    opponent.active_pokemon.damage += damage
-    
-    if opponent.active_pokemon.is_knocked_out:
+    defending = opponent.active_pokemon
+    state.version += 1
+    if state.hashes is not None:
+        zobrist.on_damage(state.hashes, 1 - player_idx, 0, defending.damage, defending.damage + damage)
+    if state.events is not None:
+        state.events.append(GameEvent(EventType.DAMAGE_DEALT, player_idx, defending.card, damage))
+    defending.damage += damage
+    
+    if defending.is_knocked_out:
+        if state.events is not None:
+            state.events.append(GameEvent(EventType.KNOCKOUT, player_idx, defending.card))
         take_prize(state, player_idx)
+        if state.hashes is not None:
+            zobrist.on_pokemon_placed(state.hashes, 1 - player_idx, 0, defending)
         opponent.active_pokemon = None
     
     return True
@@ -153,9 +191,14 @@ def take_prize(state: GameState, player_idx: int) -> bool:
     
     prize = player.prizes.pop()
     player.hand.append(prize)
+    state.version += 1
+    if state.hashes is not None:
+        zobrist.on_take_prize(state.hashes, player_idx, player, prize)
+    if state.events is not None:
+        state.events.append(GameEvent(EventType.PRIZE_TAKEN, player_idx, prize, len(player.prizes)))
     
     if len(player.prizes) == 0:
-        state.winner = player_idx
+        _set_winner(state, player_idx)
     
     return True
 
@@ -165,24 +208,40 @@ def check_win_condition(state: GameState) -> Optional[int]:
         return state.winner
     
     if len(state.player1.prizes) == 0:
-        state.winner = 0
+        _set_winner(state, 0)
         return 0
     if len(state.player2.prizes) == 0:
-        state.winner = 1
+        _set_winner(state, 1)
         return 1
     
     if state.player1.active_pokemon is None and len(state.player1.bench) == 0:
-        state.winner = 1
+        _set_winner(state, 1)
         return 1
     if state.player2.active_pokemon is None and len(state.player2.bench) == 0:
-        state.winner = 0
+        _set_winner(state, 0)
         return 0
     
     return None
 
 
+def _set_winner(state: GameState, winner: int) -> None:
+    state.version += 1
+    if state.hashes is not None:
+        zobrist.on_winner(state.hashes, state.winner)
+        zobrist.on_winner(state.hashes, winner)
+    if state.events is not None:
+        state.events.append(GameEvent(EventType.GAME_WON, winner))
+    state.winner = winner
+
+
 def end_turn(state: GameState) -> None:
     current_player = state.current_player_state
+    state.version += 1
+    if state.hashes is not None:
+        zobrist.on_turn_flags(state.hashes, state.current_player, current_player, 0, False)
+        zobrist.on_end_turn(state.hashes, state.current_player, state.turn_number)
+    if state.events is not None:
+        state.events.append(GameEvent(EventType.TURN_ENDED, state.current_player, amount=state.turn_number + 1))
     current_player.reset_turn_flags()
     
     state.current_player = 1 - state.current_player
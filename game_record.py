@@ -0,0 +1,76 @@
+import random
+import struct
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+from action_encoder import encode_action, decode_action
+from actions import Action
+from card_catalog import CATALOG
+from game import apply_action
+from game_engine import initialize_game, check_win_condition
+from game_state import GameState
+
+
+_HEADER = struct.Struct("<QBHHI")
+_UINT16_MAX = np.iinfo(np.uint16).max
+
+
+@dataclass
+class GameRecord:
+    seed: int
+    actions: list[int] = field(default_factory=list)
+    deck_ids: Optional[tuple[list[int], list[int]]] = None
+    
+    @classmethod
+    def for_decks(cls, deck1: list, deck2: list, seed: int = 0) -> "GameRecord":
+        return cls(seed, deck_ids=(CATALOG.encode_cards(deck1).tolist(), CATALOG.encode_cards(deck2).tolist()))
+    
+    def __len__(self) -> int:
+        return len(self.actions)
+    
+    def append(self, action: Action) -> None:
+        self.actions.append(encode_action(action))
+    
+    def initial_state(self) -> GameState:
+        if self.deck_ids is not None:
+            return initialize_game(CATALOG.decode_cards(self.deck_ids[0]), CATALOG.decode_cards(self.deck_ids[1]))
+        return initialize_game(rng=random.Random(self.seed))
+    
+    def states(self) -> Iterator[GameState]:
+        state = self.initial_state()
+        yield state
+        for action_idx in self.actions:
+            apply_action(state, decode_action(action_idx))
+            check_win_condition(state)
+            yield state
+    
+    def state_at(self, ply: Optional[int] = None) -> GameState:
+        ply = len(self.actions) if ply is None else ply
+        assert 0 <= ply <= len(self.actions), "Ply out of range"
+        for i, state in enumerate(self.states()):
+            if i == ply:
+                return state
+    
+    def to_bytes(self) -> bytes:
+        decks = self.deck_ids if self.deck_ids is not None else ([], [])
+        assert all(len(deck) <= _UINT16_MAX for deck in decks), "Deck too large to serialize"
+        for values in (*decks, self.actions):
+            assert all(0 <= value <= _UINT16_MAX for value in values), "Record value out of uint16 range"
+        header = _HEADER.pack(self.seed, int(self.deck_ids is not None), len(decks[0]), len(decks[1]), len(self.actions))
+        return (
+            header
+            + np.asarray(decks[0], dtype=np.uint16).tobytes()
+            + np.asarray(decks[1], dtype=np.uint16).tobytes()
+            + np.asarray(self.actions, dtype=np.uint16).tobytes()
+        )
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "GameRecord":
+        seed, has_decks, deck1_size, deck2_size, num_actions = _HEADER.unpack_from(data)
+        offset = _HEADER.size
+        deck1 = np.frombuffer(data, dtype=np.uint16, count=deck1_size, offset=offset).tolist()
+        offset += 2 * deck1_size
+        deck2 = np.frombuffer(data, dtype=np.uint16, count=deck2_size, offset=offset).tolist()
+        offset += 2 * deck2_size
+        actions = np.frombuffer(data, dtype=np.uint16, count=num_actions, offset=offset).tolist()
+        return cls(seed=seed, actions=actions, deck_ids=(deck1, deck2) if has_decks else None)
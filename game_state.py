@@ -1,6 +1,7 @@
 from dataclasses import dataclass, field
 from typing import Optional
 from cards import Card, PokemonCard, EnergyCard
+from events import GameEvent
 
 
 @dataclass
@@ -14,6 +15,9 @@ class PokemonInPlay:
     def is_knocked_out(self) -> bool:
         return self.damage >= self.card.hp
 
+    def clone(self) -> "PokemonInPlay":
+        return PokemonInPlay(self.card, self.attached_energy.copy(), self.damage, self.status)
+
 
 @dataclass
 class PlayerState:
@@ -30,6 +34,18 @@ class PlayerState:
         self.energy_attached_this_turn = 0
         self.pokemon_played_this_turn = False
 
+    def clone(self) -> "PlayerState":
+        return PlayerState(
+            deck=self.deck.copy(),
+            hand=self.hand.copy(),
+            active_pokemon=self.active_pokemon.clone() if self.active_pokemon is not None else None,
+            bench=[p.clone() for p in self.bench],
+            prizes=self.prizes.copy(),
+            discard=self.discard.copy(),
+            energy_attached_this_turn=self.energy_attached_this_turn,
+            pokemon_played_this_turn=self.pokemon_played_this_turn,
+        )
+
 
 @dataclass
 class GameState:
@@ -38,6 +54,10 @@ class GameState:
     current_player: int
     turn_number: int
     winner: Optional[int] = None
+    hashes: Optional[list[int]] = field(default=None, compare=False, repr=False)
+    version: int = field(default=0, compare=False, repr=False)
+    cache: Optional[dict] = field(default=None, compare=False, repr=False)
+    events: Optional[list[GameEvent]] = field(default=None, compare=False, repr=False)
 
     @property
     def current_player_state(self) -> PlayerState:
@@ -46,3 +66,25 @@ class GameState:
     @property
     def opponent_player_state(self) -> PlayerState:
         return self.player2 if self.current_player == 0 else self.player1
+
+    def clone(self) -> "GameState":
+        return GameState(
+            player1=self.player1.clone(),
+            player2=self.player2.clone(),
+            current_player=self.current_player,
+            turn_number=self.turn_number,
+            winner=self.winner,
+            hashes=self.hashes.copy() if self.hashes is not None else None,
+            version=self.version,
+            cache=self.cache,
+        )
+
+    def cached(self) -> dict:
+        cache = self.cache
+        if cache is None or cache["version"] != self.version:
+            cache = self.cache = {"version": self.version}
+        return cache
+
+    def invalidate(self) -> None:
+        self.version += 1
+        self.hashes = None
@@ -0,0 +1,136 @@
+import json
+import os
+import random
+import warnings
+import zipfile
+from typing import Callable, Optional
+import numpy as np
+from action_encoder import ActionEncoder, action_encoder_from_spec
+from actions import Action, ActionType
+from game_state import GameState
+from state_encoder import encode_state
+
+
+METADATA_FILE = "policy.json"
+SPEC_KEY = "spec"
+
+_ACTIVATIONS = {
+    "relu": lambda x: np.maximum(x, 0.0),
+    "linear": lambda x: x,
+}
+
+
+def weights_path(checkpoint_path: str) -> str:
+    return f"{checkpoint_path}.npz"
+
+
+def save_weights(path: str, network_spec: dict, action_encoder_spec: dict, weights: dict[str, np.ndarray]) -> None:
+    spec = {"network": network_spec, "action_encoder": action_encoder_spec}
+    np.savez(path, **{SPEC_KEY: np.array(json.dumps(spec))}, **weights)
+
+
+def read_weights(path: str) -> tuple[dict, dict[str, np.ndarray]]:
+    with np.load(path, allow_pickle=False) as archive:
+        spec = json.loads(archive[SPEC_KEY].item())
+        weights = {name: archive[name] for name in archive.files if name != SPEC_KEY}
+    return spec, weights
+
+
+class NumpyQNetwork:
+    def __init__(self, layers: list[tuple[np.ndarray, np.ndarray, Callable[[np.ndarray], np.ndarray]]]):
+        self.layers = layers
+    
+    @classmethod
+    def from_spec(cls, spec: dict, state_dict: dict[str, np.ndarray]) -> "NumpyQNetwork":
+        layers = []
+        for name, activation in spec["layers"]:
+            assert activation in _ACTIVATIONS, f"Unsupported activation {activation}"
+            layers.append((
+                np.ascontiguousarray(state_dict[f"{name}.weight"].T, dtype=np.float32),
+                state_dict[f"{name}.bias"].astype(np.float32),
+                _ACTIVATIONS[activation],
+            ))
+        assert layers[0][0].shape[0] == spec["state_dim"], "Checkpoint shape mismatch"
+        assert layers[-1][0].shape[1] == spec["action_dim"], "Checkpoint shape mismatch"
+        return cls(layers)
+    
+    def __call__(self, state_vec: np.ndarray) -> np.ndarray:
+        x = state_vec
+        for weight, bias, activation in self.layers:
+            x = activation(x @ weight + bias)
+        return x
+
+
+def torch_q_function(network) -> Callable[[np.ndarray], np.ndarray]:
+    import torch
+    
+    def q_values(state_vec: np.ndarray) -> np.ndarray:
+        with torch.inference_mode():
+            return network(torch.tensor(state_vec).unsqueeze(0))[0].numpy()
+    
+    return q_values
+
+
+def is_exported_policy(path: str) -> bool:
+    with zipfile.ZipFile(path) as archive:
+        return any(name.endswith(f"/extra/{METADATA_FILE}") for name in archive.namelist())
+
+
+class InferencePolicy:
+    def __init__(self, q_function: Callable[[np.ndarray], np.ndarray], action_encoder: ActionEncoder,
+                 seed: Optional[int] = None):
+        self.q_values = q_function
+        self.action_encoder = action_encoder
+        self.rng = random.Random(seed)
+    
+    @classmethod
+    def load(cls, path: str, seed: Optional[int] = None) -> "InferencePolicy":
+        if not path.endswith(".npz") and is_exported_policy(path):
+            return cls.from_export(path, seed)
+        return cls.from_checkpoint(path, seed)
+    
+    @classmethod
+    def from_checkpoint(cls, path: str, seed: Optional[int] = None) -> "InferencePolicy":
+        path = path if path.endswith(".npz") else weights_path(path)
+        assert os.path.exists(path), f"No inference weights at {path}, re-save the checkpoint with DQNAgent.save"
+        spec, weights = read_weights(path)
+        network = NumpyQNetwork.from_spec(spec["network"], weights)
+        return cls(network, action_encoder_from_spec(spec["action_encoder"]), seed)
+    
+    @classmethod
+    def from_export(cls, path: str, seed: Optional[int] = None) -> "InferencePolicy":
+        import torch
+        
+        extra_files = {METADATA_FILE: ""}
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", FutureWarning)
+            network = torch.jit.load(path, map_location="cpu", _extra_files=extra_files)
+        metadata = json.loads(extra_files[METADATA_FILE])
+        return cls(torch_q_function(network), action_encoder_from_spec(metadata["action_encoder"]), seed)
+    
+    def select_action(self, state: GameState, player_idx: int, training: bool = False) -> Action:
+        q_values = self.q_values(encode_state(state, player_idx))
+        action_mask = self.action_encoder.get_action_mask(state, max_size=len(q_values))
+        if not action_mask.any():
+            return Action(ActionType.END_TURN)
+        
+        action = self.action_encoder.decode(np.argmax(np.where(action_mask, q_values, -np.inf)), state)
+        if action is None:
+            valid_actions = self.action_encoder.get_valid_action_indices(state)
+            if valid_actions:
+                action = self.action_encoder.decode(self.rng.choice(valid_actions), state)
+            else:
+                action = Action(ActionType.END_TURN)
+        return action
+    
+    def store_transition(self, *args) -> None:
+        pass
+    
+    def begin_transition(self, *args) -> None:
+        return None
+    
+    def end_transition(self, *args) -> None:
+        pass
+    
+    def end_episode(self) -> None:
+        pass
@@ -0,0 +1,231 @@
+import queue
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+import numpy as np
+import torch
+import torch.nn as nn
+from concurrent.futures import Future
+from typing import Optional
+from actions import Action, ActionType
+from action_encoder import ActionEncoder
+from dqn_agent import begin_transition, finish_transition
+from game_state import GameState
+from replay_buffer import Transition
+from state_encoder import encode_state
+
+
+class InferenceServer:
+    def __init__(
+        self,
+        network: nn.Module,
+        device: Optional[torch.device] = None,
+        max_batch_size: int = 256,
+        max_wait: float = 0.002,
+        lock: Optional[threading.Lock] = None,
+    ):
+        self.network = network
+        self.lock = lock if lock is not None else nullcontext()
+        self.device = device if device is not None else next(network.parameters()).device
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests: queue.Queue = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
+        self.running = False
+        self.batches = 0
+        self.requests_served = 0
+    
+    def start(self) -> "InferenceServer":
+        assert self.thread is None, "Server already started"
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, name="inference-server", daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self) -> None:
+        if self.thread is None:
+            return
+        self.running = False
+        self.requests.put(None)
+        self.thread.join()
+        self.thread = None
+    
+    def __enter__(self) -> "InferenceServer":
+        return self.start()
+    
+    def __exit__(self, *exc) -> None:
+        self.stop()
+    
+    def submit(self, state_vec: np.ndarray, action_mask: np.ndarray) -> Future:
+        future = Future()
+        self.requests.put((state_vec, action_mask, future))
+        return future
+    
+    def predict(self, state_vec: np.ndarray, action_mask: np.ndarray) -> int:
+        return self.submit(state_vec, action_mask).result()
+    
+    def mean_batch_size(self) -> float:
+        return self.requests_served / max(self.batches, 1)
+    
+    def client(self, action_encoder: Optional[ActionEncoder] = None, epsilon: float = 0.0) -> "InferenceClient":
+        return InferenceClient(self, action_encoder, epsilon)
+    
+    def _collect(self) -> list:
+        first = self.requests.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.requests.put(None)
+                break
+            batch.append(item)
+        return batch
+    
+    def _serve(self) -> None:
+        while self.running:
+            batch = self._collect()
+            if not batch:
+                continue
+            try:
+                actions = self._forward(
+                    np.stack([item[0] for item in batch]),
+                    np.stack([item[1] for item in batch]),
+                )
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, _, future), action_idx in zip(batch, actions):
+                future.set_result(int(action_idx))
+            self.batches += 1
+            self.requests_served += len(batch)
+    
+    def _forward(self, states: np.ndarray, masks: np.ndarray) -> np.ndarray:
+        with self.lock, torch.no_grad():
+            q_values = self.network(torch.from_numpy(states).to(self.device))
+            mask_tensor = torch.from_numpy(masks[:, :q_values.shape[1]]).to(self.device)
+            q_values = q_values.masked_fill(~mask_tensor, -np.inf)
+            return q_values.argmax(dim=1).cpu().numpy()
+
+
+class _InferenceClientBase(ABC):
+    def __init__(self, action_encoder: Optional[ActionEncoder] = None, epsilon: float = 0.0, replay_buffer=None,
+                 seed: Optional[int] = None):
+        self.action_encoder = action_encoder if action_encoder is not None else ActionEncoder()
+        self.rng = random.Random(seed)
+        self.epsilon = epsilon
+        self.replay_buffer = replay_buffer
+    
+    def select_action(self, state: GameState, player_idx: int, training: bool = False) -> Action:
+        action_mask = self.action_encoder.get_action_mask(state)
+        if not action_mask.any():
+            return Action(ActionType.END_TURN)
+        
+        if training and self.rng.random() < self.epsilon:
+            action_idx = self.rng.choice(np.flatnonzero(action_mask).tolist())
+        else:
+            action_idx = self._predict(encode_state(state, player_idx), action_mask)
+        return self.action_encoder.decode(action_idx, state)
+    
+    def store_transition(
+        self,
+        state: GameState,
+        action: Action,
+        reward: float,
+        next_state: GameState,
+        done: bool,
+        player_idx: int,
+    ) -> None:
+        self.end_transition(self.begin_transition(state, action, player_idx), reward, next_state, done, player_idx)
+    
+    def begin_transition(self, state: GameState, action: Action, player_idx: int) -> Optional[Transition]:
+        if self.replay_buffer is None:
+            return None
+        return begin_transition(self.action_encoder, state, action, player_idx)
+    
+    def end_transition(self, transition: Optional[Transition], reward: float, next_state: GameState, done: bool,
+                       player_idx: int) -> None:
+        if transition is not None:
+            self.replay_buffer.push(finish_transition(self.action_encoder, transition, reward, next_state, done, player_idx))
+    
+    def end_episode(self) -> None:
+        pass
+    
+    @abstractmethod
+    def _predict(self, state_vec: np.ndarray, action_mask: np.ndarray) -> int:
+        pass
+
+
+class InferenceClient(_InferenceClientBase):
+    def __init__(self, server: InferenceServer, action_encoder: Optional[ActionEncoder] = None,
+                 epsilon: float = 0.0, replay_buffer=None):
+        super().__init__(action_encoder, epsilon, replay_buffer)
+        self.server = server
+    
+    def _predict(self, state_vec: np.ndarray, action_mask: np.ndarray) -> int:
+        return self.server.predict(state_vec, action_mask)
+
+
+class ProcessInferenceBridge:
+    def __init__(self, server: InferenceServer, num_workers: int, ctx):
+        self.server = server
+        self.request_queue = ctx.Queue()
+        self.response_queues = [ctx.Queue() for _ in range(num_workers)]
+        self.thread: Optional[threading.Thread] = None
+    
+    def start(self) -> "ProcessInferenceBridge":
+        assert self.thread is None, "Bridge already started"
+        self.thread = threading.Thread(target=self._forward_requests, name="inference-bridge", daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self) -> None:
+        if self.thread is None:
+            return
+        self.request_queue.put(None)
+        self.thread.join()
+        self.thread = None
+    
+    def client(self, worker_id: int, epsilon: float = 0.0, replay_buffer=None) -> "RemoteInferenceClient":
+        return RemoteInferenceClient(self.request_queue, self.response_queues[worker_id], worker_id, epsilon, replay_buffer)
+    
+    def _forward_requests(self) -> None:
+        while True:
+            request = self.request_queue.get()
+            if request is None:
+                return
+            worker_id, state_vec, action_mask = request
+            future = self.server.submit(state_vec, action_mask)
+            response_queue = self.response_queues[worker_id]
+            future.add_done_callback(lambda f, q=response_queue: q.put(_response(f)))
+
+
+def _response(future: Future) -> tuple[Optional[int], Optional[str]]:
+    error = future.exception()
+    if error is not None:
+        return None, repr(error)
+    return future.result(), None
+
+
+class RemoteInferenceClient(_InferenceClientBase):
+    def __init__(self, request_queue, response_queue, worker_id: int, epsilon: float = 0.0, replay_buffer=None):
+        super().__init__(None, epsilon, replay_buffer)
+        self.request_queue = request_queue
+        self.response_queue = response_queue
+        self.worker_id = worker_id
+    
+    def _predict(self, state_vec: np.ndarray, action_mask: np.ndarray) -> int:
+        self.request_queue.put((self.worker_id, state_vec, action_mask))
+        action_idx, error = self.response_queue.get()
+        if error is not None:
+            raise RuntimeError(f"Central inference failed: {error}")
+        return action_idx
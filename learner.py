@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import deque
+from typing import Optional
+from dqn_agent import DQNAgent
+
+
+class ConcurrentLearner:
+    def __init__(
+        self,
+        agent: DQNAgent,
+        batch_size: int = 32,
+        updates_per_step: float = 0.25,
+        max_lag: int = 100,
+    ):
+        assert updates_per_step > 0, "Learner needs a positive update-to-data ratio"
+        self.agent = agent
+        self.batch_size = batch_size
+        self.updates_per_step = updates_per_step
+        self.max_lag = max_lag
+        self.lock = threading.Lock()
+        self.progress = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.running = False
+        self.error: Optional[BaseException] = None
+        self.losses: deque = deque(maxlen=100)
+        self.warmup_steps = agent.env_steps
+        self.warmup_updates = agent.updates
+        self.actor_wait_s = 0.0
+        self.learner_idle_s = 0.0
+    
+    def start(self) -> "ConcurrentLearner":
+        assert self.thread is None, "Learner already started"
+        self.running = True
+        self.thread = threading.Thread(target=self._learn, name="learner", daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self) -> None:
+        if self.thread is None:
+            return
+        with self.progress:
+            self.running = False
+            self.progress.notify_all()
+        self.thread.join()
+        self.thread = None
+    
+    def __enter__(self) -> "ConcurrentLearner":
+        return self.start()
+    
+    def __exit__(self, *exc) -> None:
+        self.stop()
+    
+    def updates_due(self) -> float:
+        return (self.agent.env_steps - self.warmup_steps) * self.updates_per_step
+    
+    def updates_done(self) -> int:
+        return self.agent.updates - self.warmup_updates
+    
+    def throttle(self) -> None:
+        start = time.perf_counter()
+        with self.progress:
+            self.progress.notify_all()
+            while self.running and self.error is None and self.updates_done() < self.updates_due() - self.max_lag:
+                self.progress.wait(0.1)
+        self.actor_wait_s += time.perf_counter() - start
+        if self.error is not None:
+            raise RuntimeError("Learner thread failed") from self.error
+    
+    def _learn(self) -> None:
+        try:
+            while self.running:
+                with self.progress:
+                    if len(self.agent.replay_buffer) < self.batch_size:
+                        self.warmup_steps = self.agent.env_steps
+                        self.warmup_updates = self.agent.updates
+                    if self.updates_done() >= self.updates_due():
+                        start = time.perf_counter()
+                        self.progress.wait(0.01)
+                        self.learner_idle_s += time.perf_counter() - start
+                        continue
+                with self.lock:
+                    loss = self.agent.train_step(self.batch_size)
+                with self.progress:
+                    if loss is not None:
+                        self.losses.append(loss)
+                    self.progress.notify_all()
+        except BaseException as error:
+            self.error = error
@@ -0,0 +1,283 @@
+import math
+import os
+import random
+import time
+import numpy as np
+import torch
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+import torch.multiprocessing as mp
+from action_encoder import encode_action, decode_action
+from actions import Action, ActionType
+from dqn_network import DQNNetwork
+from game import apply_action, undo_action, get_valid_actions
+from game_engine import check_win_condition, PRIZE_COUNT
+from game_state import GameState
+from state_encoder import encode_state
+from zobrist import view_hash
+
+
+def search_actions(state: GameState) -> list[Action]:
+    actions = get_valid_actions(state, canonical=True)
+    if state.opponent_player_state.active_pokemon is None:
+        actions = [a for a in actions if a.action_type != ActionType.ATTACK]
+    if not state.opponent_player_state.deck:
+        actions = [a for a in actions if a.action_type != ActionType.END_TURN]
+    return actions
+
+
+def information_set_key(state: GameState, player_idx: int) -> int:
+    return view_hash(state, player_idx)
+
+
+def determinize(state: GameState, player_idx: int, rng: random.Random) -> None:
+    player = state.player1 if player_idx == 0 else state.player2
+    opponent = state.player2 if player_idx == 0 else state.player1
+    
+    hidden = opponent.hand + opponent.deck + opponent.prizes
+    rng.shuffle(hidden)
+    hand_size, deck_size = len(opponent.hand), len(opponent.deck)
+    opponent.hand[:] = hidden[:hand_size]
+    opponent.deck[:] = hidden[hand_size:hand_size + deck_size]
+    opponent.prizes[:] = hidden[hand_size + deck_size:]
+    
+    hidden = player.deck + player.prizes
+    rng.shuffle(hidden)
+    player.deck[:] = hidden[:len(player.deck)]
+    player.prizes[:] = hidden[len(player.deck):]
+    state.invalidate()
+
+
+class _Node:
+    __slots__ = ("visits", "action_visits", "action_values", "priors")
+    
+    def __init__(self, priors: dict[int, float]):
+        self.visits = 0
+        self.action_visits: dict[int, int] = {}
+        self.action_values: dict[int, float] = {}
+        self.priors = priors
+
+
+class MCTSSearch:
+    def __init__(
+        self,
+        network: Optional[DQNNetwork] = None,
+        c_puct: float = 1.5,
+        rollout_depth: int = 40,
+        max_table_size: int = 200000,
+        seed: Optional[int] = None,
+    ):
+        self.network = network
+        self.c_puct = c_puct
+        self.rollout_depth = rollout_depth
+        self.max_table_size = max_table_size
+        self.rng = random.Random(seed)
+        self.table: dict[int, _Node] = {}
+    
+    def run(
+        self,
+        state: GameState,
+        player_idx: int,
+        playouts: Optional[int] = None,
+        time_limit: Optional[float] = None,
+    ) -> dict[int, int]:
+        assert playouts is not None or time_limit is not None, "Search needs a playout or time budget"
+        if len(self.table) > self.max_table_size:
+            self.table.clear()
+        
+        deadline = time.monotonic() + time_limit if time_limit is not None else math.inf
+        world = state.clone()
+        completed = 0
+        while (playouts is None or completed < playouts) and time.monotonic() < deadline:
+            determinize(world, player_idx, self.rng)
+            self._playout(world, player_idx)
+            completed += 1
+        
+        root = self.table.get(information_set_key(state, player_idx))
+        return dict(root.action_visits) if root is not None else {}
+    
+    def _playout(self, world: GameState, root_player: int) -> None:
+        path = []
+        records = []
+        value = None
+        
+        while value is None:
+            actions = search_actions(world)
+            if world.winner is not None or not actions:
+                value = self._terminal_value(world, root_player)
+                break
+            
+            mover = world.current_player
+            key = information_set_key(world, mover)
+            node = self.table.get(key)
+            if node is None:
+                priors, leaf_value = self._evaluate(world, mover, actions)
+                self.table[key] = node = _Node(priors)
+                if leaf_value is None:
+                    leaf_value = self._rollout(world, root_player)
+                elif mover != root_player:
+                    leaf_value = -leaf_value
+                value = leaf_value
+            
+            if value is None:
+                action_idx = self._select(node, actions)
+                path.append((node, action_idx, mover))
+                records.append(apply_action(world, decode_action(action_idx), record_undo=True))
+                check_win_condition(world)
+        
+        for node, action_idx, mover in path:
+            node.visits += 1
+            node.action_visits[action_idx] = node.action_visits.get(action_idx, 0) + 1
+            node.action_values[action_idx] = (
+                node.action_values.get(action_idx, 0.0) + (value if mover == root_player else -value)
+            )
+        for record in reversed(records):
+            undo_action(world, record)
+    
+    def _select(self, node: _Node, actions: list[Action]) -> int:
+        exploration = self.c_puct * math.sqrt(node.visits + 1)
+        uniform = 1.0 / len(actions)
+        best_idx = -1
+        best_score = -math.inf
+        for action in actions:
+            idx = encode_action(action)
+            visits = node.action_visits.get(idx, 0)
+            q = node.action_values[idx] / visits if visits else 0.0
+            score = q + exploration * node.priors.get(idx, uniform) / (1 + visits)
+            if score > best_score:
+                best_idx, best_score = idx, score
+        return best_idx
+    
+    def _evaluate(self, world: GameState, mover: int, actions: list[Action]) -> tuple[dict[int, float], Optional[float]]:
+        if self.network is None:
+            return {}, None
+        
+        indices = [encode_action(a) for a in actions]
+        device = next(self.network.parameters()).device
+        with torch.no_grad():
+            state_tensor = torch.tensor(encode_state(world, mover)).unsqueeze(0).to(device)
+            q_values = self.network(state_tensor)[0].cpu().numpy()
+        legal_q = q_values[indices]
+        weights = np.exp((legal_q - legal_q.max()) / 10.0)
+        weights /= weights.sum()
+        return dict(zip(indices, weights.tolist())), math.tanh(float(legal_q.max()) / 100.0)
+    
+    def _rollout(self, world: GameState, root_player: int) -> float:
+        hashes, world.hashes = world.hashes, None
+        records = []
+        for _ in range(self.rollout_depth):
+            actions = search_actions(world)
+            if world.winner is not None or not actions:
+                break
+            records.append(apply_action(world, self.rng.choice(actions), record_undo=True))
+            check_win_condition(world)
+        value = self._terminal_value(world, root_player)
+        for record in reversed(records):
+            undo_action(world, record)
+        world.hashes = hashes
+        return value
+    
+    def _terminal_value(self, world: GameState, root_player: int) -> float:
+        if world.winner is not None:
+            return 1.0 if world.winner == root_player else -1.0
+        player = world.player1 if root_player == 0 else world.player2
+        opponent = world.player2 if root_player == 0 else world.player1
+        return (len(opponent.prizes) - len(player.prizes)) / PRIZE_COUNT
+
+
+_worker_search: Optional[MCTSSearch] = None
+
+
+def _init_worker(network_config: Optional[tuple], search_kwargs: dict, seed: int) -> None:
+    global _worker_search
+    torch.set_num_threads(1)
+    network = None
+    if network_config is not None:
+        state_dim, action_dim, hidden_dim, state_dict = network_config
+        network = DQNNetwork(state_dim, action_dim, hidden_dim)
+        network.load_state_dict(state_dict)
+    _worker_search = MCTSSearch(network, seed=seed + os.getpid(), **search_kwargs)
+
+
+def _worker_run(state: GameState, player_idx: int, playouts: Optional[int], time_limit: Optional[float]) -> dict[int, int]:
+    return _worker_search.run(state, player_idx, playouts, time_limit)
+
+
+class MCTSAgent:
+    def __init__(
+        self,
+        playouts: Optional[int] = 200,
+        time_limit: Optional[float] = None,
+        network: Optional[DQNNetwork] = None,
+        c_puct: float = 1.5,
+        rollout_depth: int = 40,
+        max_table_size: int = 200000,
+        num_workers: int = 1,
+        seed: Optional[int] = None,
+    ):
+        assert playouts is not None or time_limit is not None, "MCTSAgent needs a playout or time budget"
+        self.playouts = playouts
+        self.time_limit = time_limit
+        self.num_workers = num_workers
+        search_kwargs = {"c_puct": c_puct, "rollout_depth": rollout_depth, "max_table_size": max_table_size}
+        self.search = MCTSSearch(network, seed=seed, **search_kwargs)
+        self.pool: Optional[ProcessPoolExecutor] = None
+        if num_workers > 1:
+            network_config = None
+            if network is not None:
+                network_config = (network.fc1.in_features, network.fc4.out_features, network.fc1.out_features,
+                                  {k: v.cpu() for k, v in network.state_dict().items()})
+            self.pool = ProcessPoolExecutor(
+                num_workers,
+                mp_context=mp.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(network_config, search_kwargs, seed if seed is not None else 0),
+            )
+    
+    def select_action(self, state: GameState, player_idx: int, training: bool = False) -> Action:
+        actions = search_actions(state)
+        if not actions:
+            return Action(ActionType.END_TURN)
+        if len(actions) == 1:
+            return actions[0]
+        
+        visits = self.root_visits(state, player_idx)
+        return max(actions, key=lambda a: visits.get(encode_action(a), 0))
+    
+    def root_visits(self, state: GameState, player_idx: int) -> dict[int, int]:
+        if self.pool is None:
+            return self.search.run(state, player_idx, self.playouts, self.time_limit)
+        
+        playouts = -(-self.playouts // self.num_workers) if self.playouts is not None else None
+        futures = [
+            self.pool.submit(_worker_run, state, player_idx, playouts, self.time_limit)
+            for _ in range(self.num_workers)
+        ]
+        visits: dict[int, int] = {}
+        for future in futures:
+            for idx, count in future.result().items():
+                visits[idx] = visits.get(idx, 0) + count
+        return visits
+    
+    def store_transition(self, *args) -> None:
+        pass
+    
+    def begin_transition(self, *args) -> None:
+        return None
+    
+    def end_transition(self, *args) -> None:
+        pass
+    
+    def end_episode(self) -> None:
+        pass
+    
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+    
+    def __enter__(self) -> "MCTSAgent":
+        return self
+    
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -1,25 +1,34 @@
-from game_engine import initialize_game, check_win_condition
+import os
+import subprocess
+import sys
+import time
+from game_engine import initialize_game, check_win_condition, get_observable_state
 from game import apply_action, get_valid_actions
-from state_encoder import encode_state
-from action_encoder import ActionEncoder
-from dqn_agent import DQNAgent
-from actions import Action, ActionType
-from train_ai import build_action_space
+from inference_policy import InferencePolicy
+from events import describe_event
+
+
+def first_ai_move(model_path: str = "dqn_model.pt") -> None:
+    agent = InferencePolicy.load(model_path)
+    state = initialize_game()
+    agent.select_action(state, state.current_player)
+
+
+def time_to_first_move(model_path: str = "dqn_model.pt") -> float:
+    script = (
+        f"import sys; sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r}); "
+        f"import play_ai; play_ai.first_ai_move({os.path.abspath(model_path)!r})"
+    )
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", script], check=True)
+    return time.perf_counter() - start
 
 
 def play_against_ai(model_path: str = "dqn_model.pt"):
-    action_encoder = ActionEncoder()
-    build_action_space(action_encoder)
-    
-    sample_state = initialize_game()
-    sample_obs = encode_state(sample_state, 0)
-    state_dim = len(sample_obs)
-    
-    agent = DQNAgent(state_dim, action_encoder)
-    agent.load(model_path)
-    agent.epsilon = 0.0
+    agent = InferencePolicy.load(model_path)
     
     state = initialize_game()
+    state.events = []
     
     print("Playing against AI. You are Player 1, AI is Player 2.")
     print("Type 'help' for commands.\n")
@@ -53,7 +62,7 @@ def play_against_ai(model_path: str = "dqn_model.pt"):
             try:
                 choice = input("\nChoose action (number) or 'auto': ")
                 if choice == 'auto':
-                    action = agent.select_action(state, 0, training=False)
+                    action = agent.select_action(state, 0)
                     print(f"AI chose: {action.action_type.value}")
                 elif choice == 'help':
                     print("Commands: 'auto' - let AI play, 'help' - show this, number - choose action")
@@ -72,17 +81,26 @@ def play_against_ai(model_path: str = "dqn_model.pt"):
             apply_action(state, action)
         else:
             print("AI's turn...")
-            action = agent.select_action(state, 1, training=False)
+            action = agent.select_action(state, 1)
             print(f"AI chose: {action.action_type.value}")
             apply_action(state, action)
         
         check_win_condition(state)
+        for event in state.events:
+            print(f"  {describe_event(event, viewer=0)}")
+        state.events.clear()
     
     if state.winner is not None:
         print(f"\nPlayer {state.winner + 1} wins!")
 
 
 if __name__ == "__main__":
-    import sys
-    model_path = sys.argv[1] if len(sys.argv) > 1 else "dqn_model.pt"
-    play_against_ai(model_path)
+    import argparse
+    parser = argparse.ArgumentParser(description="Play against a trained AI")
+    parser.add_argument("model_path", nargs="?", default="dqn_model.pt", help="Checkpoint or exported policy")
+    parser.add_argument("--startup", action="store_true", help="Time loading and the first AI move, then exit")
+    args = parser.parse_args()
+    if args.startup:
+        print(f"First AI move {1000 * time_to_first_move(args.model_path):.0f} ms after start")
+    else:
+        play_against_ai(args.model_path)
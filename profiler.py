@@ -0,0 +1,158 @@
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Optional
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "start")
+    
+    def __init__(self, profiler: "PhaseProfiler", name: str):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+    
+    def __enter__(self) -> "_Phase":
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc) -> None:
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+
+
+class PhaseProfiler:
+    enabled = True
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._reset()
+    
+    def reset(self) -> None:
+        with self.lock:
+            self._reset()
+    
+    def _reset(self) -> None:
+        self.totals: dict[str, float] = defaultdict(float)
+        self.calls: dict[str, int] = defaultdict(int)
+        self.counters: dict[str, int] = defaultdict(int)
+        self.window_start = time.perf_counter()
+    
+    def phase(self, name: str) -> _Phase:
+        return _Phase(self, name)
+    
+    def add(self, name: str, seconds: float) -> None:
+        with self.lock:
+            self.totals[name] += seconds
+            self.calls[name] += 1
+    
+    def count(self, name: str, amount: int = 1) -> None:
+        with self.lock:
+            self.counters[name] += amount
+    
+    def begin_game(self) -> int:
+        return sys.getallocatedblocks()
+    
+    def end_game(self, blocks_at_start: int) -> None:
+        self.count("games")
+        self.count("retained_blocks", sys.getallocatedblocks() - blocks_at_start)
+    
+    def window(self, **fields) -> dict:
+        with self.lock:
+            return self._window(fields)
+    
+    def _window(self, fields: dict) -> dict:
+        elapsed = time.perf_counter() - self.window_start
+        record = dict(fields)
+        record["elapsed_s"] = elapsed
+        record["phases"] = {
+            name: {
+                "calls": self.calls[name],
+                "total_s": total,
+                "mean_us": 1e6 * total / self.calls[name],
+                "share": total / elapsed if elapsed > 0 else 0.0,
+            }
+            for name, total in sorted(self.totals.items(), key=lambda item: -item[1])
+        }
+        record["counters"] = dict(self.counters)
+        games = self.counters.get("games", 0)
+        if games:
+            record["counters"]["retained_blocks_per_game"] = self.counters["retained_blocks"] / games
+        self._reset()
+        return record
+
+
+class _NullPhase:
+    __slots__ = ()
+    
+    def __enter__(self) -> "_NullPhase":
+        return self
+    
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+class NullProfiler:
+    enabled = False
+    _phase = _NullPhase()
+    
+    def phase(self, name: str) -> _NullPhase:
+        return self._phase
+    
+    def add(self, name: str, seconds: float) -> None:
+        pass
+    
+    def count(self, name: str, amount: int = 1) -> None:
+        pass
+    
+    def begin_game(self) -> int:
+        return 0
+    
+    def end_game(self, blocks_at_start: int) -> None:
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+def format_window(record: dict, top: int = 6) -> str:
+    phases = ", ".join(
+        f"{name} {stats['share']:.0%} ({stats['mean_us']:.0f}us)"
+        for name, stats in list(record["phases"].items())[:top]
+    )
+    retained = record["counters"].get("retained_blocks_per_game")
+    return f"Profile: {phases}" + (f", Retained Blocks/Game: {retained:+.0f}" if retained is not None else "")
+
+
+class ProfileWriter:
+    CSV_FIELDS = ["phase", "calls", "total_s", "mean_us", "share"]
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.csv = os.path.splitext(path)[1].lower() == ".csv"
+        self.fields: Optional[list[str]] = None
+    
+    def write(self, record: dict) -> None:
+        if not self.csv:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+            return
+        
+        window_fields = [k for k in record if k not in ("phases", "counters")]
+        if self.fields is None:
+            self.fields = window_fields + self.CSV_FIELDS
+            new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        else:
+            new_file = False
+        with open(self.path, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=self.fields, extrasaction="ignore")
+            if new_file:
+                writer.writeheader()
+            base = {k: record[k] for k in window_fields}
+            for name, stats in record["phases"].items():
+                writer.writerow({**base, "phase": name, **stats})
+            for name, value in record["counters"].items():
+                writer.writerow({**base, "phase": f"counter:{name}", "calls": value})
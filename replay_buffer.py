@@ -1,6 +1,11 @@
-from collections import deque
+import queue
+import threading
+import time
+from contextlib import nullcontext
 from dataclasses import dataclass
+from typing import Optional
 import numpy as np
+import torch
 
 
 @dataclass
@@ -10,20 +15,512 @@ class Transition:
     reward: float
     next_state: np.ndarray
     done: bool
-    action_mask: list[bool]
-    next_action_mask: list[bool]
+    action_mask: np.ndarray
+    next_action_mask: np.ndarray
+
+
+@dataclass
+class TransitionBatch:
+    states: np.ndarray
+    actions: np.ndarray
+    rewards: np.ndarray
+    next_states: np.ndarray
+    dones: np.ndarray
+    action_masks: np.ndarray
+    next_action_masks: np.ndarray
+    indices: np.ndarray
+    weights: Optional[np.ndarray] = None
+
+
+@dataclass
+class TensorBatch:
+    states: torch.Tensor
+    actions: torch.Tensor
+    rewards: torch.Tensor
+    next_states: torch.Tensor
+    dones: torch.Tensor
+    action_masks: torch.Tensor
+    next_action_masks: torch.Tensor
+    indices: np.ndarray
+    weights: Optional[torch.Tensor] = None
 
 
 class ReplayBuffer:
-    def __init__(self, capacity: int = 100000):
-        self.buffer = deque(maxlen=capacity)
+    def __init__(
+        self,
+        capacity: int = 100000,
+        state_dim: Optional[int] = None,
+        action_dim: Optional[int] = None,
+        seed: Optional[int] = None,
+    ):
+        self.capacity = capacity
+        self.state_dim = state_dim
+        self.action_dim = action_dim
+        self.rng = np.random.default_rng(seed)
+        self.position = 0
+        self.size = 0
+        self.states: Optional[np.ndarray] = None
+        if state_dim is not None and action_dim is not None:
+            self._allocate(state_dim, action_dim)
+    
+    def _allocate(self, state_dim: int, action_dim: int) -> None:
+        self.state_dim = state_dim
+        self.action_dim = action_dim
+        self.states = np.zeros((self.capacity, state_dim), dtype=np.float32)
+        self.next_states = np.zeros((self.capacity, state_dim), dtype=np.float32)
+        self.actions = np.zeros(self.capacity, dtype=np.int64)
+        self.rewards = np.zeros(self.capacity, dtype=np.float32)
+        self.dones = np.zeros(self.capacity, dtype=bool)
+        self.action_masks = np.zeros((self.capacity, action_dim), dtype=bool)
+        self.next_action_masks = np.zeros((self.capacity, action_dim), dtype=bool)
     
     def push(self, transition: Transition) -> None:
-        self.buffer.append(transition)
+        if self.states is None:
+            self._allocate(len(transition.state), len(transition.action_mask))
+        
+        i = self.position
+        self.states[i] = transition.state
+        self.next_states[i] = transition.next_state
+        self.actions[i] = transition.action
+        self.rewards[i] = transition.reward
+        self.dones[i] = transition.done
+        self.action_masks[i] = transition.action_mask
+        self.next_action_masks[i] = transition.next_action_mask
+        
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
     
-    def sample(self, batch_size: int) -> list[Transition]:
-        indices = np.random.choice(len(self.buffer), batch_size, replace=False)
-        return [self.buffer[i] for i in indices]
+    def push_batch(
+        self,
+        states: np.ndarray,
+        actions: np.ndarray,
+        rewards: np.ndarray,
+        next_states: np.ndarray,
+        dones: np.ndarray,
+        action_masks: np.ndarray,
+        next_action_masks: np.ndarray,
+    ) -> np.ndarray:
+        n = len(states)
+        if self.states is None:
+            self._allocate(states.shape[1], action_masks.shape[1])
+        if n > self.capacity:
+            return self.push_batch(
+                states[-self.capacity:], actions[-self.capacity:], rewards[-self.capacity:],
+                next_states[-self.capacity:], dones[-self.capacity:],
+                action_masks[-self.capacity:], next_action_masks[-self.capacity:],
+            )
+        
+        indices = (self.position + np.arange(n)) % self.capacity
+        self.states[indices] = states
+        self.next_states[indices] = next_states
+        self.actions[indices] = actions
+        self.rewards[indices] = rewards
+        self.dones[indices] = dones
+        self.action_masks[indices] = action_masks
+        self.next_action_masks[indices] = next_action_masks
+        
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        return indices
+    
+    def sample_indices(self, batch_size: int) -> np.ndarray:
+        return self.rng.integers(0, self.size, size=batch_size)
+    
+    def sample(self, batch_size: int) -> TransitionBatch:
+        return self.gather(self.sample_indices(batch_size))
+    
+    def gather(self, indices: np.ndarray) -> TransitionBatch:
+        return TransitionBatch(
+            states=self.states[indices],
+            actions=self.actions[indices],
+            rewards=self.rewards[indices],
+            next_states=self.next_states[indices],
+            dones=self.dones[indices],
+            action_masks=self.action_masks[indices],
+            next_action_masks=self.next_action_masks[indices],
+            indices=indices,
+        )
+    
+    def sample_tensors(
+        self,
+        batch_size: int,
+        device: Optional[torch.device] = None,
+        pin_memory: bool = False,
+    ) -> TensorBatch:
+        return to_tensors(self.sample(batch_size), device, pin_memory)
+    
+    def nbytes(self) -> int:
+        if self.states is None:
+            return 0
+        arrays = (self.states, self.next_states, self.actions, self.rewards, self.dones,
+                  self.action_masks, self.next_action_masks)
+        return sum(array.nbytes for array in arrays)
+    
+    def bytes_per_transition(self) -> float:
+        return self.nbytes() / self.capacity
     
     def __len__(self) -> int:
-        return len(self.buffer)
+        return self.size
+
+
+def to_tensors(batch: TransitionBatch, device: Optional[torch.device] = None, pin_memory: bool = False) -> TensorBatch:
+    def convert(array: np.ndarray) -> torch.Tensor:
+        tensor = torch.from_numpy(array)
+        if pin_memory:
+            tensor = tensor.pin_memory()
+        if device is not None:
+            tensor = tensor.to(device, non_blocking=pin_memory)
+        return tensor
+    
+    return TensorBatch(
+        states=convert(batch.states),
+        actions=convert(batch.actions),
+        rewards=convert(batch.rewards),
+        next_states=convert(batch.next_states),
+        dones=convert(batch.dones),
+        action_masks=convert(batch.action_masks),
+        next_action_masks=convert(batch.next_action_masks),
+        indices=batch.indices,
+        weights=convert(batch.weights) if batch.weights is not None else None,
+    )
+
+
+class BatchPrefetcher:
+    def __init__(
+        self,
+        replay_buffer: ReplayBuffer,
+        batch_size: int,
+        depth: int = 2,
+        device: Optional[torch.device] = None,
+        pin_memory: bool = False,
+        lock: Optional[threading.Lock] = None,
+    ):
+        assert depth >= 1, "Prefetch queue needs room for at least one batch"
+        self.replay_buffer = replay_buffer
+        self.batch_size = batch_size
+        self.depth = depth
+        self.device = device
+        self.pin_memory = pin_memory
+        self.lock = lock if lock is not None else nullcontext()
+        self.batches: queue.Queue = queue.Queue(maxsize=depth)
+        self.stopping = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.error: Optional[BaseException] = None
+        self.produced = 0
+        self.consumed = 0
+        self.waits = 0
+        self.wait_s = 0.0
+    
+    def start(self) -> "BatchPrefetcher":
+        assert self.thread is None, "Prefetcher already started"
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._fill, name="batch-prefetcher", daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self) -> None:
+        if self.thread is None:
+            return
+        self.stopping.set()
+        while self.thread.is_alive():
+            try:
+                self.batches.get_nowait()
+            except queue.Empty:
+                pass
+            self.thread.join(timeout=0.01)
+        self.thread = None
+        while not self.batches.empty():
+            self.batches.get_nowait()
+    
+    def __enter__(self) -> "BatchPrefetcher":
+        return self.start()
+    
+    def __exit__(self, *exc) -> None:
+        self.stop()
+    
+    def get(self) -> TensorBatch:
+        assert self.thread is not None, "Prefetcher is not running"
+        try:
+            batch = self.batches.get_nowait()
+        except queue.Empty:
+            self.waits += 1
+            start = time.perf_counter()
+            while True:
+                if self.error is not None:
+                    raise RuntimeError("Batch prefetcher failed") from self.error
+                try:
+                    batch = self.batches.get(timeout=0.1)
+                    break
+                except queue.Empty:
+                    pass
+            self.wait_s += time.perf_counter() - start
+        self.consumed += 1
+        return batch
+    
+    def wait_rate(self) -> float:
+        return self.waits / max(self.consumed, 1)
+    
+    def stats(self) -> dict:
+        return {
+            "produced": self.produced,
+            "consumed": self.consumed,
+            "waits": self.waits,
+            "wait_rate": self.wait_rate(),
+            "wait_s": self.wait_s,
+        }
+    
+    def _fill(self) -> None:
+        try:
+            while not self.stopping.is_set():
+                with self.lock:
+                    batch = self.replay_buffer.sample(self.batch_size) if len(self.replay_buffer) >= self.batch_size else None
+                if batch is None:
+                    self.stopping.wait(0.001)
+                    continue
+                tensors = to_tensors(batch, self.device, self.pin_memory)
+                while not self.stopping.is_set():
+                    try:
+                        self.batches.put(tensors, timeout=0.1)
+                        self.produced += 1
+                        break
+                    except queue.Full:
+                        pass
+        except BaseException as error:
+            self.error = error
+
+
+class CompressedReplayBuffer(ReplayBuffer):
+    def __init__(
+        self,
+        capacity: int,
+        feature_scales: np.ndarray,
+        action_dim: Optional[int] = None,
+        seed: Optional[int] = None,
+        frame_capacity: Optional[int] = None,
+    ):
+        self.feature_scales = np.asarray(feature_scales, dtype=np.float64)
+        self.quantized = np.flatnonzero(self.feature_scales > 0)
+        self.exact = np.flatnonzero(self.feature_scales == 0)
+        scales = self.feature_scales[self.quantized]
+        codes = np.arange(256)[:, None]
+        assert (scales == np.rint(scales)).all(), "Quantized feature scales must be whole numbers"
+        assert (np.rint((codes / scales).astype(np.float32) * scales) == codes).all(), (
+            "Feature scales do not round-trip every uint8 code through float32"
+        )
+        self.column_order = np.argsort(np.concatenate([self.quantized, self.exact]))
+        self.frame_capacity = 2 * capacity if frame_capacity is None else frame_capacity
+        self.frame_codes: Optional[np.ndarray] = None
+        super().__init__(capacity, len(self.feature_scales), action_dim, seed)
+    
+    def _allocate(self, state_dim: int, action_dim: int) -> None:
+        assert state_dim == len(self.feature_scales), "Feature scales do not match the state dim"
+        self.state_dim = state_dim
+        self.action_dim = action_dim
+        self.frame_codes = np.zeros((self.frame_capacity, len(self.quantized)), dtype=np.uint8)
+        self.frame_exact = np.zeros((self.frame_capacity, len(self.exact)), dtype=np.float32)
+        self.frame_masks = np.zeros((self.frame_capacity, (action_dim + 7) // 8), dtype=np.uint8)
+        self.frames_written = 0
+        self.state_frames = np.zeros(self.capacity, dtype=np.int64)
+        self.next_frames = np.zeros(self.capacity, dtype=np.int64)
+        self.oldest_frames = np.zeros(self.capacity, dtype=np.int64)
+        self.actions = np.zeros(self.capacity, dtype=np.int64)
+        self.rewards = np.zeros(self.capacity, dtype=np.float32)
+        self.dones = np.zeros(self.capacity, dtype=bool)
+        self.last_frame: Optional[tuple[int, np.ndarray, np.ndarray]] = None
+    
+    def _write_frames(self, states: np.ndarray, masks: np.ndarray) -> np.ndarray:
+        n = len(states)
+        assert n <= self.frame_capacity, "Batch needs more frames than the frame ring holds"
+        frames = self.frames_written + np.arange(n)
+        slots = frames % self.frame_capacity
+        self.frame_codes[slots] = np.rint(states[:, self.quantized] * self.feature_scales[self.quantized])
+        self.frame_exact[slots] = states[:, self.exact]
+        self.frame_masks[slots] = np.packbits(masks, axis=1)
+        self.frames_written += n
+        self.size -= self._stale_count(self.frames_written - self.frame_capacity)
+        return frames
+    
+    def _stale_count(self, oldest_live: int) -> int:
+        start = (self.position - self.size) % self.capacity
+        head = self.oldest_frames[start:min(start + self.size, self.capacity)]
+        stale = int(np.searchsorted(head, oldest_live))
+        if stale == len(head) and len(head) < self.size:
+            stale += int(np.searchsorted(self.oldest_frames[:self.size - len(head)], oldest_live))
+        return stale
+    
+    def _read_frames(self, frames: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        slots = frames % self.frame_capacity
+        quantized = (self.frame_codes[slots] / self.feature_scales[self.quantized]).astype(np.float32)
+        states = np.concatenate([quantized, self.frame_exact[slots]], axis=1)[:, self.column_order]
+        masks = np.unpackbits(self.frame_masks[slots], axis=1, count=self.action_dim).view(bool)
+        return states, masks
+    
+    def _store(self, indices: np.ndarray, state_frames: np.ndarray, next_frames: np.ndarray, oldest: int,
+               actions, rewards, dones) -> None:
+        self.state_frames[indices] = state_frames
+        self.next_frames[indices] = next_frames
+        self.oldest_frames[indices] = oldest
+        self.actions[indices] = actions
+        self.rewards[indices] = rewards
+        self.dones[indices] = dones
+        n = len(indices)
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+    
+    def push(self, transition: Transition) -> None:
+        if self.frame_codes is None:
+            self._allocate(len(transition.state), len(transition.action_mask))
+        
+        last = self.last_frame
+        if last is not None and (last[1] is transition.state or np.array_equal(last[1], transition.state)) and (
+            last[2] is transition.action_mask or np.array_equal(last[2], transition.action_mask)
+        ):
+            state_frame = last[0]
+            next_frame = self._write_frames(transition.next_state[None], np.asarray(transition.next_action_mask)[None])[0]
+        else:
+            state_frame, next_frame = self._write_frames(
+                np.stack([transition.state, transition.next_state]),
+                np.stack([transition.action_mask, transition.next_action_mask]),
+            )
+        self.last_frame = (next_frame, transition.next_state, transition.next_action_mask)
+        self._store(np.array([self.position]), state_frame, next_frame, state_frame,
+                    transition.action, transition.reward, transition.done)
+    
+    def push_batch(
+        self,
+        states: np.ndarray,
+        actions: np.ndarray,
+        rewards: np.ndarray,
+        next_states: np.ndarray,
+        dones: np.ndarray,
+        action_masks: np.ndarray,
+        next_action_masks: np.ndarray,
+    ) -> np.ndarray:
+        n = len(states)
+        if self.frame_codes is None:
+            self._allocate(states.shape[1], action_masks.shape[1])
+        if n > self.capacity:
+            return self.push_batch(
+                states[-self.capacity:], actions[-self.capacity:], rewards[-self.capacity:],
+                next_states[-self.capacity:], dones[-self.capacity:],
+                action_masks[-self.capacity:], next_action_masks[-self.capacity:],
+            )
+        
+        all_states = np.concatenate([states, next_states]).astype(np.float32, copy=False)
+        all_masks = np.concatenate([action_masks, next_action_masks])
+        keys = np.concatenate([all_states.view(np.uint8), np.packbits(all_masks, axis=1)], axis=1)
+        keys = np.ascontiguousarray(keys).view(np.dtype((np.void, keys.shape[1]))).ravel()
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        frames = self._write_frames(all_states[first], all_masks[first])[inverse.ravel()]
+        
+        indices = (self.position + np.arange(n)) % self.capacity
+        self.last_frame = None
+        self._store(indices, frames[:n], frames[n:], frames.min(), actions, rewards, dones)
+        return indices
+    
+    def sample_indices(self, batch_size: int) -> np.ndarray:
+        return (self.position - 1 - self.rng.integers(0, self.size, size=batch_size)) % self.capacity
+    
+    def gather(self, indices: np.ndarray) -> TransitionBatch:
+        n = len(indices)
+        states, masks = self._read_frames(np.concatenate([self.state_frames[indices], self.next_frames[indices]]))
+        return TransitionBatch(
+            states=states[:n],
+            actions=self.actions[indices],
+            rewards=self.rewards[indices],
+            next_states=states[n:],
+            dones=self.dones[indices],
+            action_masks=masks[:n],
+            next_action_masks=masks[n:],
+            indices=indices,
+        )
+    
+    def nbytes(self) -> int:
+        if self.frame_codes is None:
+            return 0
+        arrays = (self.frame_codes, self.frame_exact, self.frame_masks, self.state_frames, self.next_frames,
+                  self.oldest_frames, self.actions, self.rewards, self.dones)
+        return sum(array.nbytes for array in arrays)
+
+
+class SumTree:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.leaf_offset = 1 << max(capacity - 1, 1).bit_length()
+        self.depth = self.leaf_offset.bit_length() - 1
+        self.tree = np.zeros(2 * self.leaf_offset, dtype=np.float64)
+    
+    def total(self) -> float:
+        return float(self.tree[1])
+    
+    def leaves(self, indices: np.ndarray) -> np.ndarray:
+        return self.tree[self.leaf_offset + indices]
+    
+    def update(self, indices: np.ndarray, priorities: np.ndarray) -> None:
+        nodes = self.leaf_offset + np.asarray(indices)
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = nodes >> 1
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+    
+    def find(self, values: np.ndarray) -> np.ndarray:
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            go_right = (values >= left_sum) & (self.tree[left + 1] > 0)
+            values -= np.where(go_right, left_sum, 0.0)
+            nodes = left + go_right
+        return nodes - self.leaf_offset
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    def __init__(
+        self,
+        capacity: int = 100000,
+        state_dim: Optional[int] = None,
+        action_dim: Optional[int] = None,
+        seed: Optional[int] = None,
+        alpha: float = 0.6,
+        beta: float = 0.4,
+        beta_increment: float = 1e-5,
+        epsilon: float = 1e-6,
+    ):
+        super().__init__(capacity, state_dim, action_dim, seed)
+        self.tree = SumTree(capacity)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon
+        self.max_priority = 1.0
+    
+    def push(self, transition: Transition) -> None:
+        index = self.position
+        super().push(transition)
+        self.tree.update(np.array([index]), np.array([self.max_priority ** self.alpha]))
+    
+    def push_batch(self, *args) -> np.ndarray:
+        indices = super().push_batch(*args)
+        self.tree.update(indices, np.full(len(indices), self.max_priority ** self.alpha))
+        return indices
+    
+    def sample_indices(self, batch_size: int) -> np.ndarray:
+        segment = self.tree.total() / batch_size
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * segment
+        return np.minimum(self.tree.find(values), self.size - 1)
+    
+    def sample(self, batch_size: int) -> TransitionBatch:
+        indices = self.sample_indices(batch_size)
+        batch = self.gather(indices)
+        
+        probabilities = self.tree.leaves(indices) / self.tree.total()
+        weights = (self.size * probabilities) ** -self.beta
+        batch.weights = (weights / weights.max()).astype(np.float32)
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        return batch
+    
+    def update_priorities(self, indices: np.ndarray, td_errors: np.ndarray) -> None:
+        priorities = np.abs(td_errors) + self.epsilon
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(indices, priorities ** self.alpha)
@@ -1,12 +1,122 @@
 import numpy as np
-from typing import Optional
+from typing import Optional, Sequence
+from cards import PokemonCard
+from card_catalog import CATALOG
 from game_engine import get_observable_state
 from game_state import GameState
 
 
+STATE_DIM = 63
+
+_MY_ACTIVE = 10
+_MY_BENCH = 31
+_OPPONENT_ACTIVE = 51
+_card_feature_table = np.zeros((0, 16), dtype=np.float32)
+
+FEATURE_SCALES = np.zeros(STATE_DIM)
+FEATURE_SCALES[[0, _MY_ACTIVE, _OPPONENT_ACTIVE]] = 1.0
+FEATURE_SCALES[[2, 3, 5, 6, 7]] = 60.0
+FEATURE_SCALES[[4, 8]] = 6.0
+FEATURE_SCALES[9] = 5.0
+FEATURE_SCALES[[_MY_ACTIVE + 3, _OPPONENT_ACTIVE + 3]] = 10.0
+FEATURE_SCALES[_MY_ACTIVE + 4] = 100.0
+FEATURE_SCALES[_MY_ACTIVE + 5:_MY_BENCH] = 1.0
+FEATURE_SCALES[_MY_BENCH:_OPPONENT_ACTIVE:4] = 1.0
+FEATURE_SCALES[_MY_BENCH + 3:_OPPONENT_ACTIVE:4] = 10.0
+FEATURE_SCALES[_OPPONENT_ACTIVE + 4:] = 1.0
+
+
 def encode_state(state: GameState, player_idx: int) -> np.ndarray:
-    obs = get_observable_state(state, player_idx)
+    cache = state.cached()
+    key = ("observation", player_idx)
+    out = cache.get(key)
+    if out is None:
+        out = np.empty(STATE_DIM, dtype=np.float32)
+        encode_state_into(state, player_idx, out)
+        out.flags.writeable = False
+        cache[key] = out
+    return out
+
+
+def encode_state_into(state: GameState, player_idx: int, out: np.ndarray) -> None:
+    player = state.player1 if player_idx == 0 else state.player2
+    opponent = state.player2 if player_idx == 0 else state.player1
+    
+    out.fill(0.0)
+    
+    out[0] = float(state.current_player == player_idx)
+    out[1] = state.turn_number / 100.0
+    
+    out[2] = len(player.hand) / 60.0
+    out[3] = len(player.deck) / 60.0
+    out[4] = len(player.prizes) / 6.0
+    out[5] = len(player.discard) / 60.0
+    
+    out[6] = len(opponent.hand) / 60.0
+    out[7] = len(opponent.deck) / 60.0
+    out[8] = len(opponent.prizes) / 6.0
+    out[9] = len(opponent.bench) / 5.0
+    
+    active = player.active_pokemon
+    if active is not None:
+        hp = active.card.hp
+        out[_MY_ACTIVE] = 1.0
+        out[_MY_ACTIVE + 1] = (hp - active.damage) / hp
+        out[_MY_ACTIVE + 2] = active.damage / hp
+        out[_MY_ACTIVE + 3] = len(active.attached_energy) / 10.0
+        out[_MY_ACTIVE + 4] = active.card.attack_damage / 100.0
+        out[_MY_ACTIVE + 5:_MY_BENCH] = _card_features(active.card)
     
+    for i, pokemon in enumerate(player.bench[:5]):
+        base = _MY_BENCH + 4 * i
+        hp = pokemon.card.hp
+        out[base] = 1.0
+        out[base + 1] = (hp - pokemon.damage) / hp
+        out[base + 2] = pokemon.damage / hp
+        out[base + 3] = len(pokemon.attached_energy) / 10.0
+    
+    opponent_active = opponent.active_pokemon
+    if opponent_active is not None:
+        hp = opponent_active.card.hp
+        out[_OPPONENT_ACTIVE] = 1.0
+        out[_OPPONENT_ACTIVE + 1] = (hp - opponent_active.damage) / hp
+        out[_OPPONENT_ACTIVE + 2] = opponent_active.damage / hp
+        out[_OPPONENT_ACTIVE + 3] = len(opponent_active.attached_energy) / 10.0
+        out[_OPPONENT_ACTIVE + 4:] = _card_features(opponent_active.card)[:8]
+
+
+def encode_states(
+    states: Sequence[GameState],
+    player_indices: Sequence[int],
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    if out is None:
+        out = np.empty((len(states), STATE_DIM), dtype=np.float32)
+    for i, (state, player_idx) in enumerate(zip(states, player_indices)):
+        encode_state_into(state, player_idx, out[i])
+    return out
+
+
+def _card_features(card: PokemonCard) -> np.ndarray:
+    card_id = CATALOG.id_of(card)
+    if card_id >= len(_card_feature_table):
+        _build_card_feature_table()
+    return _card_feature_table[card_id]
+
+
+def _build_card_feature_table() -> None:
+    global _card_feature_table
+    table = np.zeros((len(CATALOG), 16), dtype=np.float32)
+    for card_id in np.flatnonzero(CATALOG.is_pokemon):
+        card = CATALOG.card(card_id)
+        for e in card.energy_types:
+            table[card_id, _energy_type_to_idx(e.value)] = 1.0
+        for e in card.attack_cost:
+            table[card_id, 8 + _energy_type_to_idx(e.value)] += 1.0
+    _card_feature_table = table
+
+
+def encode_observation(obs: dict, player_idx: int) -> np.ndarray:
     features = []
     
     features.append(float(obs["current_player"] == player_idx))
@@ -70,6 +180,10 @@ def encode_state(state: GameState, player_idx: int) -> np.ndarray:
     return np.array(features, dtype=np.float32)
 
 
+def encode_state_from_observation(state: GameState, player_idx: int) -> np.ndarray:
+    return encode_observation(get_observable_state(state, player_idx), player_idx)
+
+
 def _energy_type_to_idx(energy_type: str) -> int:
     mapping = {
         "fire": 0,
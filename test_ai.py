@@ -0,0 +1,677 @@
+import random
+import numpy as np
+from game import initialize_game, apply_action, get_valid_actions
+from actions import ActionType
+
+
+def _random_states(num_games: int, max_actions: int = 40):
+    states = []
+    for _ in range(num_games):
+        state = initialize_game()
+        for _ in range(max_actions):
+            states.append(state)
+            actions = get_valid_actions(state)
+            if state.winner is not None or len(state.opponent_player_state.deck) == 0:
+                break
+            state = state.clone()
+            apply_action(state, random.choice(actions))
+    return states
+
+
+def test_encode_state_matches_observation_encoder():
+    from state_encoder import encode_state, encode_states, encode_state_from_observation, STATE_DIM
+    
+    random.seed(42)
+    states = _random_states(10)
+    
+    for player_idx in (0, 1):
+        expected = np.stack([encode_state_from_observation(s, player_idx) for s in states])
+        assert expected.shape[1] == STATE_DIM
+        
+        direct = np.stack([encode_state(s, player_idx) for s in states])
+        assert direct.tobytes() == expected.tobytes()
+        
+        out = np.full((len(states), STATE_DIM), np.nan, dtype=np.float32)
+        encode_states(states, [player_idx] * len(states), out=out)
+        assert out.tobytes() == expected.tobytes()
+
+
+def test_action_mask_matches_valid_actions():
+    from action_encoder import ActionEncoder, NUM_ACTIONS
+    
+    random.seed(7)
+    states = _random_states(10)
+    encoder = ActionEncoder()
+    
+    for idx in range(NUM_ACTIONS):
+        assert encoder.encode(encoder.decode(idx)) == idx
+    
+    masks = encoder.get_action_masks(states)
+    for state, mask in zip(states, masks):
+        valid = get_valid_actions(state)
+        assert sorted(encoder.get_valid_action_indices(state)) == sorted(encoder.encode(a) for a in valid)
+        assert set(encoder.decode(i) for i in np.flatnonzero(mask)) == set(valid)
+        assert (encoder.get_action_mask(state) == mask).all()
+
+
+def test_canonical_actions_collapse_duplicate_cards():
+    from action_encoder import CanonicalActionEncoder
+    from card_catalog import CATALOG
+    from game import canonical_action
+    
+    random.seed(11)
+    states = _random_states(20)
+    encoder = CanonicalActionEncoder()
+    collapsed = 0
+    
+    for state in states:
+        valid = get_valid_actions(state)
+        canonical = get_valid_actions(state, canonical=True)
+        assert set(canonical) <= set(valid)
+        assert set(canonical_action(state, a) for a in valid) == set(canonical)
+        collapsed += len(valid) - len(canonical)
+        
+        for action in valid:
+            if action.action_type == ActionType.ATTACK:
+                continue
+            concrete, representative = state.clone(), state.clone()
+            apply_action(concrete, action)
+            apply_action(representative, canonical_action(state, action))
+            for world in (concrete, representative):
+                world.current_player_state.hand.sort(key=CATALOG.id_of)
+            assert concrete == representative
+        
+        indices = encoder.get_valid_action_indices(state)
+        assert len(indices) == len(canonical)
+        assert sorted(encoder.encode(a, state) for a in canonical) == indices
+        assert all(encoder.encode(encoder.decode(i, state), state) == i for i in indices)
+        assert set(encoder.decode(i, state) for i in indices) == set(canonical)
+    
+    assert collapsed > 0
+
+
+def test_episode_returns_match_reference_recursions():
+    from episode_buffer import EpisodeBuffer, discounted_sums
+    
+    rng = np.random.default_rng(3)
+    n_step = 3
+    for gamma, td_lambda, count, done in (
+        (0.9, 0.7, 1, True), (0.9, 0.7, 7, True), (0.9, 0.7, 8, False), (0.99, 0.8, 201, True), (0.5, 0.5, 100, False),
+    ):
+        rewards = rng.normal(size=count)
+        rewards[-1] += 100.0
+        values = rng.normal(size=count)
+        episode = EpisodeBuffer()
+        for t in range(count):
+            episode.append(np.full(4, t, dtype=np.float32), t, np.ones(5, dtype=bool))
+            episode.close_step(rewards[t], np.full(4, t + 1, dtype=np.float32), np.ones(5, dtype=bool), done and t == count - 1)
+        
+        for horizon in (1, n_step, None):
+            expected = [sum(gamma ** k * rewards[t + k] for k in range(min(horizon or count, count - t)))
+                        for t in range(count)]
+            assert np.allclose(discounted_sums(rewards, gamma, horizon), expected)
+        
+        states, actions, returns, next_states, dones, _, _ = episode.n_step_arrays(gamma, n_step)
+        kept = [t for t in range(count) if done or t + n_step <= count]
+        assert actions.tolist() == kept
+        assert np.allclose(returns, [discounted_sums(rewards, gamma, n_step)[t] for t in kept])
+        assert next_states[:, 0].tolist() == [min(t + n_step, count) for t in kept]
+        assert dones.tolist() == [done and t + n_step >= count for t in kept]
+        
+        expected = np.zeros(count)
+        following = 0.0 if done else values[-1]
+        for t in reversed(range(count)):
+            bootstrap = following if t == count - 1 else (1 - td_lambda) * values[t] + td_lambda * expected[t + 1]
+            expected[t] = rewards[t] + gamma * bootstrap
+        _, _, returns, _, dones, _, _ = episode.lambda_arrays(gamma, td_lambda, values)
+        assert np.allclose(returns, expected, atol=1e-5) and dones.all()
+    
+    rewards = rng.normal(size=5000)
+    expected = np.zeros(5001)
+    for t in reversed(range(5000)):
+        expected[t] = rewards[t] + 0.8 * expected[t + 1]
+    assert np.allclose(discounted_sums(rewards, 0.8), expected[:-1], rtol=1e-12, atol=1e-12)
+
+
+def test_n_step_agent_fills_replay_once_per_episode():
+    import torch
+    from action_encoder import ActionEncoder
+    from dqn_agent import DQNAgent
+    from state_encoder import STATE_DIM
+    from train_ai import play_game
+    
+    for td_lambda in (None, 0.8):
+        agent = DQNAgent(STATE_DIM, ActionEncoder(), device=torch.device("cpu"), replay_capacity=1000,
+                         n_step=3, td_lambda=td_lambda, seed=0)
+        pushes = []
+        push_batch = agent.replay_buffer.push_batch
+        agent.replay_buffer.push_batch = lambda *arrays: pushes.append(len(arrays[0])) or push_batch(*arrays)
+        for seed in range(20):
+            play_game(agent, training=True, seed=seed)
+            assert not agent.episodes
+        assert len(pushes) == 20 and sum(pushes) == len(agent.replay_buffer) > 0
+        assert agent.train_step(8) is not None
+
+
+def test_concurrent_learner_tracks_update_to_data_ratio():
+    import math
+    import torch
+    from action_encoder import ActionEncoder
+    from dqn_agent import DQNAgent
+    from learner import ConcurrentLearner
+    from profiler import PhaseProfiler
+    from state_encoder import STATE_DIM
+    from train_ai import play_game
+    
+    agent = DQNAgent(STATE_DIM, ActionEncoder(), device=torch.device("cpu"), replay_capacity=1000, seed=0)
+    agent.epsilon = 0.5
+    profiler = agent.profiler = PhaseProfiler()
+    phases = set()
+    with ConcurrentLearner(agent, batch_size=8, updates_per_step=0.5, max_lag=4) as learner:
+        for seed in range(60):
+            play_game(agent, training=True, seed=seed, profiler=profiler)
+            learner.throttle()
+            assert learner.updates_done() >= learner.updates_due() - learner.max_lag
+            phases.update(profiler.window()["phases"])
+        learner.throttle()
+    assert {"select_action.forward", "train_step.update"} <= phases
+    assert learner.thread is None and learner.error is None
+    assert min(agent.updates, learner.losses.maxlen) == len(learner.losses) > 0
+    assert learner.updates_done() <= math.ceil(learner.updates_due())
+
+
+def test_replay_buffer_ring_overwrites_oldest():
+    from replay_buffer import ReplayBuffer, Transition
+    
+    buffer = ReplayBuffer(capacity=4, seed=0)
+    for i in range(6):
+        buffer.push(Transition(
+            state=np.full(3, i, dtype=np.float32),
+            action=i,
+            reward=float(i),
+            next_state=np.full(3, i + 1, dtype=np.float32),
+            done=i == 5,
+            action_mask=np.array([True, False]),
+            next_action_mask=np.array([False, True]),
+        ))
+    
+    assert len(buffer) == 4
+    assert sorted(buffer.actions.tolist()) == [2, 3, 4, 5]
+    
+    batch = buffer.sample_tensors(16)
+    assert batch.states.shape == (16, 3)
+    assert (batch.next_states[:, 0] == batch.states[:, 0] + 1).all()
+    assert (batch.rewards.numpy() == batch.actions.numpy()).all()
+    assert set(batch.actions.tolist()) <= {2, 3, 4, 5}
+
+
+def test_compressed_replay_round_trips_encoded_states():
+    import dataclasses
+    import pytest
+    from action_encoder import ActionEncoder
+    from replay_buffer import CompressedReplayBuffer, ReplayBuffer, Transition
+    from state_encoder import FEATURE_SCALES, encode_state
+    
+    random.seed(5)
+    encoder = ActionEncoder()
+    states = []
+    state = initialize_game()
+    while len(states) < 300 and state.winner is None and state.opponent_player_state.deck:
+        states.append(state.clone())
+        actions = get_valid_actions(state)
+        apply_action(state, random.choice(actions))
+    
+    transitions = [
+        Transition(encode_state(a, 0), encoder.encode(random.choice(get_valid_actions(a))), random.random(),
+                   encode_state(b, 0), False, encoder.get_action_mask(a), encoder.get_action_mask(b))
+        for a, b in zip(states, states[1:])
+    ]
+    plain = ReplayBuffer(len(transitions), seed=0)
+    compressed = CompressedReplayBuffer(len(transitions), FEATURE_SCALES, seed=0)
+    for transition in transitions:
+        plain.push(transition)
+        compressed.push(transition)
+    assert compressed.frames_written == len(transitions) + 1
+    assert compressed.bytes_per_transition() < plain.bytes_per_transition() / 3
+    
+    indices = compressed.sample_indices(64)
+    expected, actual = plain.gather(indices), compressed.gather(indices)
+    for field in ("states", "actions", "rewards", "next_states", "dones", "action_masks", "next_action_masks"):
+        assert np.array_equal(getattr(expected, field), getattr(actual, field)), field
+    
+    arrays = [np.stack([getattr(t, f) for t in transitions]) for f in
+              ("state", "action", "reward", "next_state", "done", "action_mask", "next_action_mask")]
+    small = CompressedReplayBuffer(100, FEATURE_SCALES, frame_capacity=120, seed=0)
+    for start in range(0, len(transitions), 40):
+        small.push_batch(*(array[start:start + 40] for array in arrays))
+        live = small.sample_indices(200)
+        batch = small.gather(live)
+        order = (live - small.position) % small.capacity + len(transitions[:start + 40]) - small.capacity
+        assert np.array_equal(batch.states, arrays[0][order]) and np.array_equal(batch.next_states, arrays[3][order])
+    assert 0 < len(small) < 100
+    
+    tiny = CompressedReplayBuffer(10, FEATURE_SCALES, frame_capacity=12, seed=0)
+    for transition in transitions:
+        tiny.push(transition)
+        batch = tiny.gather((tiny.position - 1 - np.arange(len(tiny))) % tiny.capacity)
+        assert 0 < len(tiny) <= 10 and np.array_equal(batch.next_states[0], transition.next_state)
+    late = states[-1].clone()
+    late.turn_number = 300
+    tiny.push(dataclasses.replace(transitions[0], state=encode_state(late, 0)))
+    assert np.array_equal(tiny.gather(np.array([(tiny.position - 1) % tiny.capacity])).states[0], encode_state(late, 0))
+    with pytest.raises(AssertionError, match="whole numbers"):
+        CompressedReplayBuffer(10, np.full(3, 2.5))
+
+
+def test_batch_prefetcher_serves_collated_batches_and_stops():
+    from replay_buffer import BatchPrefetcher, ReplayBuffer
+    
+    rng = np.random.default_rng(0)
+    buffer = ReplayBuffer(64, 4, 3, seed=0)
+    prefetcher = BatchPrefetcher(buffer, batch_size=8, depth=3).start()
+    buffer.push_batch(
+        np.arange(64 * 4, dtype=np.float32).reshape(64, 4), rng.integers(0, 3, 64), np.arange(64, dtype=np.float32),
+        np.zeros((64, 4), dtype=np.float32), np.zeros(64, dtype=bool),
+        np.ones((64, 3), dtype=bool), np.ones((64, 3), dtype=bool),
+    )
+    for _ in range(10):
+        batch = prefetcher.get()
+        assert batch.states.shape == (8, 4)
+        assert np.array_equal(batch.states.numpy()[:, 0], 4 * batch.rewards.numpy())
+        assert np.array_equal(batch.rewards.numpy(), batch.indices.astype(np.float32))
+    assert prefetcher.consumed == 10 and prefetcher.produced >= 10
+    assert prefetcher.waits <= 10 and prefetcher.wait_rate() == prefetcher.waits / 10
+    prefetcher.stop()
+    assert prefetcher.thread is None and prefetcher.batches.empty()
+
+
+def test_next_state_values_match_per_row_masking():
+    import torch
+    from action_encoder import ActionEncoder
+    from dqn_agent import DQNAgent
+    from state_encoder import STATE_DIM
+    
+    torch.manual_seed(0)
+    agent = DQNAgent(STATE_DIM, ActionEncoder(), device=torch.device("cpu"))
+    action_dim = agent.action_encoder.get_max_actions()
+    next_states = torch.randn(64, STATE_DIM)
+    masks = torch.rand(64, action_dim) < 0.05
+    masks[0] = False
+    
+    with torch.no_grad():
+        target_q = agent.target_network(next_states)
+        online_q = agent.q_network(next_states)
+        for double_dqn in (False, True):
+            agent.double_dqn = double_dqn
+            values = agent.next_state_values(next_states, masks)
+            for i in range(64):
+                valid = torch.nonzero(masks[i]).flatten()
+                if len(valid) == 0:
+                    expected = 0.0
+                elif double_dqn:
+                    expected = target_q[i, valid[online_q[i, valid].argmax()]].item()
+                else:
+                    expected = target_q[i, valid].max().item()
+                assert abs(values[i].item() - expected) < 1e-6
+
+
+def test_inference_server_matches_direct_masked_argmax():
+    import torch
+    from concurrent.futures import ThreadPoolExecutor
+    from dqn_network import DQNNetwork
+    from inference_server import InferenceServer
+    
+    torch.manual_seed(0)
+    rng = np.random.default_rng(0)
+    network = DQNNetwork(8, 16)
+    states = rng.random((200, 8), dtype=np.float32)
+    masks = rng.random((200, 16)) < 0.3
+    masks[:, 0] = True
+    
+    with torch.no_grad():
+        expected = network(torch.from_numpy(states)).masked_fill(~torch.from_numpy(masks), -np.inf).argmax(dim=1)
+    
+    with InferenceServer(network, max_batch_size=32, max_wait=0.01) as server:
+        with ThreadPoolExecutor(16) as pool:
+            actions = list(pool.map(server.predict, states, masks))
+    
+    assert actions == expected.tolist()
+    assert server.batches < len(states)
+    
+    import multiprocessing
+    import pytest
+    from inference_server import ProcessInferenceBridge
+    
+    with InferenceServer(network, max_batch_size=32) as server:
+        bridge = ProcessInferenceBridge(server, 1, multiprocessing.get_context("spawn")).start()
+        client = bridge.client(0)
+        assert client._predict(states[0], masks[0]) == expected[0]
+        with pytest.raises(RuntimeError, match="Central inference failed"):
+            client._predict(states[0, :3], masks[0])
+        assert client._predict(states[1], masks[1]) == expected[1]
+        bridge.stop()
+
+
+def test_exported_inference_policy_matches_float_argmax(tmp_path):
+    import torch
+    from action_encoder import CanonicalActionEncoder
+    from dqn_agent import DQNAgent
+    from export_inference import argmax_agreement, export_inference, load_checkpoint_network, sample_states
+    from inference_policy import InferencePolicy
+    from state_encoder import STATE_DIM
+    
+    torch.manual_seed(0)
+    agent = DQNAgent(STATE_DIM, CanonicalActionEncoder(), device=torch.device("cpu"), replay_capacity=10)
+    agent.save(str(tmp_path / "model.pt"))
+    network, _ = load_checkpoint_network(str(tmp_path / "model.pt"))
+    states = sample_states(100)
+    
+    for variant, threshold in (("float", 1.0), ("int8", 0.9)):
+        path = str(tmp_path / f"model.{variant}.ts")
+        export_inference(str(tmp_path / "model.pt"), path, variant)
+        policy = InferencePolicy.load(path)
+        assert isinstance(policy.action_encoder, CanonicalActionEncoder)
+        assert argmax_agreement(network, policy, states) >= threshold
+        for state in states[:10]:
+            assert policy.select_action(state, state.current_player) in get_valid_actions(state)
+
+
+def test_checkpoint_inference_matches_agent_without_torch(tmp_path):
+    import pytest
+    import subprocess
+    import sys
+    import torch
+    from action_encoder import CanonicalActionEncoder
+    from dqn_agent import DQNAgent
+    from export_inference import sample_states
+    from inference_policy import InferencePolicy, NumpyQNetwork, read_weights, weights_path
+    from play_ai import time_to_first_move
+    from state_encoder import STATE_DIM, encode_state
+    
+    torch.manual_seed(1)
+    agent = DQNAgent(STATE_DIM, CanonicalActionEncoder(), device=torch.device("cpu"), replay_capacity=10)
+    agent.epsilon = 0.0
+    agent.save(str(tmp_path / "model.pt"))
+    policy = InferencePolicy.load(str(tmp_path / "model.pt"))
+    assert isinstance(policy.q_values, NumpyQNetwork)
+    assert isinstance(policy.action_encoder, CanonicalActionEncoder)
+    
+    spec, weights = read_weights(weights_path(str(tmp_path / "model.pt")))
+    reordered = NumpyQNetwork.from_spec(spec["network"], dict(reversed(list(weights.items()))))
+    state_vec = encode_state(sample_states(1)[0], 0)
+    assert np.array_equal(reordered(state_vec), policy.q_values(state_vec))
+    spec["network"]["layers"][0][1] = "tanh"
+    with pytest.raises(AssertionError, match="Unsupported activation"):
+        NumpyQNetwork.from_spec(spec["network"], weights)
+    
+    for state in sample_states(100):
+        state_vec = encode_state(state, state.current_player)
+        with torch.no_grad():
+            expected = agent.q_network(torch.tensor(state_vec).unsqueeze(0))[0].numpy()
+        assert np.allclose(policy.q_values(state_vec), expected, atol=1e-5)
+        assert policy.select_action(state, state.current_player) == agent.select_action(state, state.current_player, training=False)
+    
+    check = "import sys, play_ai; sys.exit('torch' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", check]).returncode == 0
+    assert 0 < time_to_first_move(str(tmp_path / "model.pt")) < 30
+
+
+def test_prioritized_replay_samples_by_priority():
+    from replay_buffer import PrioritizedReplayBuffer, SumTree
+    
+    tree = SumTree(10)
+    tree.update(np.arange(10), np.arange(10, dtype=np.float64))
+    assert tree.total() == 45.0
+    assert tree.find(np.array([0.5, 1.0, 44.9])).tolist() == [1, 2, 9]
+    
+    buffer = PrioritizedReplayBuffer(capacity=8, state_dim=2, action_dim=2, seed=0, alpha=1.0, beta=1.0)
+    n = 8
+    buffer.push_batch(
+        np.zeros((n, 2), dtype=np.float32), np.arange(n), np.zeros(n, dtype=np.float32),
+        np.zeros((n, 2), dtype=np.float32), np.zeros(n, dtype=bool),
+        np.ones((n, 2), dtype=bool), np.ones((n, 2), dtype=bool),
+    )
+    td_errors = np.ones(n)
+    td_errors[3] = 100.0
+    buffer.update_priorities(np.arange(n), td_errors)
+    
+    batch = buffer.sample(64)
+    assert 0.8 < (batch.actions == 3).mean() < 1.0
+    assert batch.weights.max() == 1.0
+    assert batch.weights[batch.actions == 3].max() < batch.weights[batch.actions != 3].min()
+
+
+def test_shared_transition_queue_and_weights():
+    import multiprocessing
+    import threading
+    import time
+    import pytest
+    import torch
+    from distributed_train import SharedTransitionQueue, SharedWeights, ShutdownRequested, actor_epsilon
+    from dqn_network import DQNNetwork
+    from replay_buffer import ReplayBuffer, Transition
+    
+    ctx = multiprocessing.get_context("spawn")
+    queue = SharedTransitionQueue(4, 3, 2, ctx)
+    buffer = ReplayBuffer(capacity=16)
+    
+    def transition(i: int) -> Transition:
+        return Transition(np.full(3, i, dtype=np.float32), i, float(i), np.full(3, i + 1, dtype=np.float32),
+                          i % 2 == 0, np.array([True, i % 2 == 0]), np.array([False, True]))
+    
+    for i in range(3):
+        queue.push(transition(i))
+    assert queue.drain(buffer) == 3 and queue.drain(buffer) == 0
+    for i in range(3, 7):
+        queue.push(transition(i))
+    assert len(queue) == 4
+    
+    blocked = threading.Thread(target=queue.push, args=(transition(7),))
+    blocked.start()
+    time.sleep(0.05)
+    assert blocked.is_alive()
+    assert queue.drain(buffer) == 4
+    blocked.join(timeout=5.0)
+    assert not blocked.is_alive() and queue.drain(buffer) == 1
+    assert buffer.actions[:8].tolist() == list(range(8))
+    assert (buffer.states[:8, 0] == np.arange(8)).all()
+    assert buffer.dones[:8].tolist() == [i % 2 == 0 for i in range(8)]
+    assert buffer.action_masks[:8, 1].tolist() == [i % 2 == 0 for i in range(8)]
+    
+    fields = ("state", "action", "reward", "next_state", "done", "action_mask", "next_action_mask")
+    arrays = [np.stack([getattr(transition(i), f) for i in range(8, 14)]) for f in fields]
+    pusher = threading.Thread(target=queue.push_batch, args=arrays)
+    pusher.start()
+    drained = 0
+    deadline = time.monotonic() + 5.0
+    while drained < 6 and time.monotonic() < deadline:
+        drained += queue.drain(buffer)
+    pusher.join(timeout=5.0)
+    assert drained == 6 and not pusher.is_alive()
+    assert buffer.actions[:14].tolist() == list(range(14)) and (buffer.next_states[8:14, 0] == np.arange(9, 15)).all()
+    assert queue.bytes_per_transition() > 0
+    
+    for i in range(4):
+        queue.push(transition(i))
+    queue.stop_event = ctx.Event()
+    queue.stop_event.set()
+    with pytest.raises(ShutdownRequested):
+        queue.push(transition(4))
+    
+    torch.manual_seed(0)
+    source, target = DQNNetwork(3, 2, 8), DQNNetwork(3, 2, 8)
+    weights = SharedWeights(source, ctx)
+    assert weights.pull(target, -1) == 0
+    assert torch.equal(target.fc1.weight, source.fc1.weight)
+    with torch.no_grad():
+        source.fc1.weight.add_(1.0)
+    assert weights.pull(target, 0) == 0
+    assert not torch.equal(target.fc1.weight, source.fc1.weight)
+    weights.publish(source)
+    assert weights.pull(target, 0) == 1
+    assert torch.equal(target.fc1.weight, source.fc1.weight)
+    
+    assert actor_epsilon(0, 1) == 0.4
+    epsilons = [actor_epsilon(i, 8) for i in range(8)]
+    assert epsilons[0] == 0.4 and np.isclose(epsilons[-1], 0.4 ** 8)
+    assert all(a > b for a, b in zip(epsilons, epsilons[1:]))
+
+
+def test_profiler_windows_and_writers(tmp_path):
+    import csv
+    import json
+    import threading
+    import time
+    from profiler import PhaseProfiler, ProfileWriter, format_window
+    
+    profiler = PhaseProfiler()
+    for _ in range(3):
+        with profiler.phase("fast"):
+            pass
+    with profiler.phase("slow"):
+        time.sleep(0.01)
+    profiler.count("actions", 5)
+    blocks = profiler.begin_game()
+    kept = [object() for _ in range(100)]
+    profiler.end_game(blocks)
+    
+    record = profiler.window(episode=7)
+    assert record["episode"] == 7 and record["elapsed_s"] > 0.01
+    assert list(record["phases"]) == ["slow", "fast"]
+    assert record["phases"]["fast"]["calls"] == 3 and record["phases"]["slow"]["total_s"] >= 0.01
+    assert record["counters"]["actions"] == 5 and record["counters"]["games"] == 1
+    assert record["counters"]["retained_blocks_per_game"] == record["counters"]["retained_blocks"] >= len(kept)
+    assert "Retained Blocks/Game" in format_window(record)
+    assert profiler.window()["phases"] == {}
+    
+    with profiler.phase("outer"):
+        time.sleep(0.01)
+        with profiler.phase("outer"):
+            pass
+    entered = threading.Event()
+    
+    def worker():
+        entered.wait()
+        time.sleep(0.01)
+        with profiler.phase("shared"):
+            pass
+    
+    thread = threading.Thread(target=worker)
+    thread.start()
+    with profiler.phase("shared"):
+        entered.set()
+        thread.join()
+    phases = profiler.window()["phases"]
+    assert phases["outer"]["calls"] == 2 and phases["outer"]["total_s"] >= 0.01
+    assert phases["shared"]["calls"] == 2 and phases["shared"]["total_s"] >= 0.01
+    
+    jsonl = ProfileWriter(str(tmp_path / "profile.jsonl"))
+    table = ProfileWriter(str(tmp_path / "profile.csv"))
+    for episode in (0, 100):
+        jsonl.write({**record, "episode": episode})
+        table.write({**record, "episode": episode})
+    with open(tmp_path / "profile.jsonl") as f:
+        lines = [json.loads(line) for line in f]
+    assert [line["episode"] for line in lines] == [0, 100] and lines[0]["phases"] == record["phases"]
+    with open(tmp_path / "profile.csv", newline="") as f:
+        rows = list(csv.DictReader(f))
+    per_window = len(record["phases"]) + len(record["counters"])
+    assert len(rows) == 2 * per_window
+    assert [row["phase"] for row in rows[:2]] == ["slow", "fast"] and rows[1]["calls"] == "3"
+    assert rows[per_window]["episode"] == "100"
+    assert {"counter:actions", "counter:retained_blocks"} <= {row["phase"] for row in rows}
+
+
+def test_benchmarks_run_and_flag_regressions():
+    from benchmark import BenchmarkResult, _sample_games, compare, run_benchmarks, to_json
+    
+    results = run_benchmarks(["get_valid_actions", "encode_state"], min_time=0.01)
+    assert [result.name for result in results] == ["get_valid_actions", "encode_state"]
+    assert all(result.value > 0 and result.higher_is_better for result in results)
+    assert set(to_json(results, 0, 0.01)["results"]) == {"get_valid_actions", "encode_state"}
+    
+    baseline = {
+        "get_valid_actions": {"value": 10 * results[0].value},
+        "encode_state": {"value": results[1].value},
+        "latency_us": {"value": 100.0},
+    }
+    latency = BenchmarkResult("latency_us", 105.0, "us", False)
+    assert compare(results + [latency], baseline, threshold=0.10) == ["get_valid_actions"]
+    assert compare([BenchmarkResult("latency_us", 150.0, "us", False)], baseline, threshold=0.10) == ["latency_us"]
+    
+    for game in _sample_games(0, num_games=5):
+        assert game[0].turn_number == 1 and game[0].winner is None
+        assert all(b.turn_number >= a.turn_number for a, b in zip(game, game[1:]))
+
+
+def test_trajectory_store_round_trips_through_memmap(tmp_path):
+    import pytest
+    from replay_buffer import ReplayBuffer, Transition
+    from trajectory_store import TrajectoryStore, MemmapReplayBuffer
+    
+    path = str(tmp_path / "trajectories")
+    store = TrajectoryStore(path, state_dim=3, action_dim=2, chunk_size=4, write_buffer=3, gamma=0.9, n_step=3)
+    for i in range(7):
+        store.push(Transition(
+            state=np.full(3, i, dtype=np.float32),
+            action=i,
+            reward=float(i),
+            next_state=np.full(3, i + 1, dtype=np.float32),
+            done=i == 6,
+            action_mask=np.array([True, False]),
+            next_action_mask=np.array([False, True]),
+        ))
+    store.push_batch(
+        np.full((3, 3), 7, dtype=np.float32), np.arange(7, 10), np.arange(7, 10, dtype=np.float32),
+        np.full((3, 3), 8, dtype=np.float32), np.zeros(3, dtype=bool),
+        np.ones((3, 2), dtype=bool), np.ones((3, 2), dtype=bool),
+    )
+    store.flush()
+    with open(store._chunk_path(2), "ab") as f:
+        f.write(b"torn")
+    
+    reopened = TrajectoryStore(path)
+    assert len(reopened) == 10
+    assert (reopened.gamma, reopened.n_step, reopened.td_lambda) == (0.9, 3, None)
+    with pytest.raises(AssertionError, match="N-step"):
+        TrajectoryStore(path, n_step=1)
+    assert reopened.chunk_sizes == [4, 4, 2]
+    
+    buffer = ReplayBuffer(capacity=5)
+    assert reopened.load_into(buffer) == 5
+    assert sorted(buffer.actions.tolist()) == [5, 6, 7, 8, 9]
+    
+    source = MemmapReplayBuffer(reopened, seed=0)
+    batch = source.gather(np.arange(10))
+    assert batch.actions.tolist() == list(range(10))
+    assert (batch.states[:7, 0] == np.arange(7)).all()
+    assert batch.dones.tolist() == [i == 6 for i in range(10)]
+    tensors = source.sample_tensors(8)
+    assert (tensors.rewards.numpy() == tensors.actions.numpy()).all()
+
+
+def test_mcts_agent_finds_immediate_win():
+    from mcts_agent import MCTSAgent, information_set_key, determinize
+    from game_engine import check_win_condition
+    
+    for seed in range(10):
+        state = initialize_game(rng=random.Random(seed))
+        if not any(a.action_type == ActionType.PLAY_POKEMON for a in get_valid_actions(state)):
+            continue
+        snapshot = state.clone()
+        key = information_set_key(state, 0)
+        
+        action = MCTSAgent(playouts=60, seed=seed).select_action(state, 0)
+        assert state == snapshot
+        assert action.action_type == ActionType.PLAY_POKEMON
+        apply_action(state, action)
+        assert check_win_condition(state) == 0
+        
+        determinize(snapshot, 0, random.Random(seed))
+        assert information_set_key(snapshot, 0) == key
+
+
+if __name__ == "__main__":
+    import sys
+    import pytest
+    sys.exit(pytest.main([__file__]))
@@ -1,6 +1,7 @@
-from game import initialize_game, apply_action, get_valid_actions, get_observable_state
+from game import initialize_game, apply_action, undo_action, get_valid_actions, get_observable_state
 from game_engine import check_win_condition
 from actions import Action, ActionType
+from cards import EnergyType
 
 
 def test_basic_gameplay():
@@ -32,5 +33,310 @@ def test_basic_gameplay():
     print("Basic gameplay test passed!")
 
 
+def test_attack_requires_a_defending_pokemon():
+    from action_encoder import ATTACK_IDX, ActionEncoder, CanonicalActionEncoder
+    from card_catalog import POKEMON_CARDS
+    from cards import EnergyCard
+    from game_state import PokemonInPlay
+    
+    state = initialize_game()
+    card = POKEMON_CARDS[0]
+    energy = [EnergyCard(energy_type) for energy_type in card.attack_cost]
+    state.player1.active_pokemon = PokemonInPlay(card, energy)
+    state.player2.active_pokemon = PokemonInPlay(card)
+    assert Action(ActionType.ATTACK) in get_valid_actions(state)
+    
+    state.player2.active_pokemon = None
+    state.version += 1
+    assert Action(ActionType.ATTACK) not in get_valid_actions(state)
+    assert not ActionEncoder().get_action_mask(state)[ATTACK_IDX]
+    assert not CanonicalActionEncoder().get_action_mask(state)[ATTACK_IDX]
+
+
+def test_batch_engine_matches_scalar_engine():
+    import random
+    import numpy as np
+    from batch_engine import BatchGameEngine
+    from action_encoder import NUM_ACTIONS, ATTACK_IDX, encode_action, decode_action
+    
+    random.seed(1234)
+    states = [initialize_game() for _ in range(32)]
+    engine = BatchGameEngine(seed=1234)
+    engine.load_states(states)
+    rng = np.random.default_rng(1234)
+    energy_order = list(EnergyType)
+    
+    for _ in range(60):
+        mask = engine.legal_mask()
+        for i, state in enumerate(states):
+            expected = np.zeros(NUM_ACTIONS, dtype=bool)
+            if state.winner is None:
+                expected[[encode_action(a) for a in get_valid_actions(state)]] = True
+            assert (mask[i] == expected).all()
+            if state.opponent_player_state.active_pokemon is None:
+                assert not mask[i, ATTACK_IDX]
+        
+        scores = np.where(mask, rng.random(mask.shape), -1.0)
+        actions = scores.argmax(axis=1)
+        engine.step(actions)
+        
+        for i, state in enumerate(states):
+            if state.winner is None:
+                apply_action(state, decode_action(int(actions[i])))
+            for player in (state.player1, state.player2):
+                for pokemon in [player.active_pokemon] + player.bench:
+                    if pokemon is not None:
+                        pokemon.attached_energy.sort(key=lambda e: energy_order.index(e.energy_type))
+            assert engine.to_state(i) == state
+    
+    winners = engine.winners()
+    for i, state in enumerate(states):
+        expected = check_win_condition(state)
+        assert winners[i] == (-1 if expected is None else expected)
+    
+    assert any(state.player1.active_pokemon is not None or state.player1.bench for state in states)
+    reloaded = BatchGameEngine()
+    reloaded.load_states(states)
+    assert (reloaded.legal_mask() == engine.legal_mask()).all()
+    for i, state in enumerate(states):
+        assert reloaded.to_state(i) == state
+
+
+def test_batch_engine_reset():
+    from batch_engine import BatchGameEngine
+    
+    engine = BatchGameEngine(seed=7)
+    engine.reset(8)
+    for i in range(8):
+        state = engine.to_state(i)
+        assert len(state.player1.hand) == 7
+        assert len(state.player2.prizes) == 6
+        assert len(state.player1.deck) == 47
+    
+    other = BatchGameEngine()
+    other.reset(8, seed=7)
+    assert (other.deck == engine.deck).all()
+
+
+def test_undo_action_restores_prior_states():
+    import random
+    
+    random.seed(99)
+    for _ in range(20):
+        state = initialize_game()
+        snapshots = []
+        records = []
+        while state.winner is None and len(records) < 80:
+            actions = get_valid_actions(state)
+            if not state.opponent_player_state.deck:
+                actions = [a for a in actions if a.action_type != ActionType.END_TURN]
+            if not actions:
+                break
+            snapshots.append(state.clone())
+            records.append(apply_action(state, random.choice(actions), record_undo=True))
+        
+        check_win_condition(state)
+        while records:
+            undo_action(state, records.pop())
+            assert state == snapshots.pop()
+
+
+def test_card_catalog_packs_states():
+    import random
+    from card_catalog import CATALOG, DEFAULT_CARDS, CardCatalog
+    from cards import PokemonCard
+    from game_engine import create_deck, ENERGY_CARDS
+    
+    random.seed(5)
+    deck = create_deck()
+    assert all(c is ENERGY_CARDS[c.energy_type] for c in deck if c in ENERGY_CARDS.values())
+    assert CATALOG.decode_cards(CATALOG.encode_cards(deck)) == deck
+    assert CATALOG.count_vector(deck).sum() == len(deck)
+    
+    catalog = CardCatalog(DEFAULT_CARDS)
+    assert catalog.hp.tolist() == CATALOG.hp.tolist()
+    mew = catalog.id_of(PokemonCard("Mew", 70, (EnergyType.PSYCHIC,), (EnergyType.PSYCHIC,), 40, 0))
+    assert catalog.hp[mew] == 70 and catalog.is_pokemon[mew] and len(catalog.attack_cost) == len(catalog)
+    
+    for _ in range(10):
+        state = initialize_game()
+        for _ in range(30):
+            actions = get_valid_actions(state)
+            if not state.opponent_player_state.deck:
+                actions = [a for a in actions if a.action_type != ActionType.END_TURN]
+            if not actions:
+                break
+            apply_action(state, random.choice(actions))
+            assert CATALOG.unpack_state(CATALOG.pack_state(state)) == state
+
+
+def test_game_record_replays_games():
+    import pytest
+    from game_record import GameRecord
+    from game_engine import create_deck
+    from train_ai import play_game, RandomAgent
+    
+    for seed in range(20):
+        record = GameRecord(seed=0)
+        winner, _ = play_game(RandomAgent(seed), RandomAgent(seed + 1), training=False, seed=seed, record=record)
+        restored = GameRecord.from_bytes(record.to_bytes())
+        assert restored == record
+        assert restored.state_at().winner == winner
+        
+        again = GameRecord(seed=0)
+        play_game(RandomAgent(seed), RandomAgent(seed + 1), training=False, seed=seed, record=again)
+        assert again == record
+    
+    deck1, deck2 = create_deck(), create_deck()
+    record = GameRecord.for_decks(deck1, deck2)
+    state = initialize_game(deck1, deck2)
+    assert GameRecord.from_bytes(record.to_bytes()).state_at(0) == state
+    for _ in range(5):
+        action = get_valid_actions(state)[0]
+        record.append(action)
+        apply_action(state, action)
+        check_win_condition(state)
+        assert record.state_at(len(record)) == state
+        if state.winner is not None:
+            break
+    
+    wide = GameRecord(seed=1, actions=[3], deck_ids=([300] * 300, [1, 65535]))
+    assert GameRecord.from_bytes(wide.to_bytes()) == wide
+    with pytest.raises(AssertionError, match="uint16"):
+        GameRecord(seed=1, deck_ids=([65536], [])).to_bytes()
+
+
+def test_zobrist_hashes_track_engine_mutations():
+    import random
+    from zobrist import compute_hashes, ensure_hashes, state_hash, view_hash
+    
+    random.seed(17)
+    seen = {}
+    for _ in range(20):
+        state = initialize_game()
+        ensure_hashes(state)
+        records = []
+        while state.winner is None and len(records) < 80:
+            actions = get_valid_actions(state)
+            if not state.opponent_player_state.deck:
+                actions = [a for a in actions if a.action_type != ActionType.END_TURN]
+            if not actions:
+                break
+            records.append(apply_action(state, random.choice(actions), record_undo=True))
+            assert state.hashes == compute_hashes(state)
+            assert state.clone().hashes == state.hashes
+            seen.setdefault(state_hash(state), state.clone())
+            assert seen[state_hash(state)] == state
+        
+        check_win_condition(state)
+        assert state.hashes == compute_hashes(state)
+        while records:
+            undo_action(state, records.pop())
+            assert state.hashes == compute_hashes(state)
+    
+    state = initialize_game()
+    before = [view_hash(state, 0), view_hash(state, 1), state_hash(state)]
+    state.player2.hand[0], state.player2.deck[0] = state.player2.deck[0], state.player2.hand[0]
+    after = compute_hashes(state)
+    assert after[1] == before[0]
+    if state.player2.hand[0] != state.player2.deck[0]:
+        assert after[2] != before[1] and after[0] != before[2]
+
+
+def test_state_queries_are_memoized_per_version():
+    import random
+    import numpy as np
+    from action_encoder import ActionEncoder
+    from state_encoder import encode_state
+    
+    random.seed(23)
+    encoder = ActionEncoder()
+    for _ in range(10):
+        state = initialize_game()
+        records = []
+        while state.winner is None and len(records) < 60:
+            mask = encoder.get_action_mask(state)
+            observation = encode_state(state, 1 - state.current_player)
+            assert encoder.get_action_mask(state) is mask
+            assert encode_state(state, 1 - state.current_player) is observation
+            assert not mask.flags.writeable
+            
+            fresh = state.clone()
+            fresh.cache = None
+            assert get_valid_actions(state) == get_valid_actions(fresh)
+            assert np.array_equal(mask, encoder.get_action_mask(fresh))
+            assert np.array_equal(observation, encode_state(fresh, 1 - state.current_player))
+            
+            actions = get_valid_actions(state)
+            if not state.opponent_player_state.deck:
+                actions = [a for a in actions if a.action_type != ActionType.END_TURN]
+            if not actions:
+                break
+            version = state.version
+            records.append(apply_action(state, random.choice(actions), record_undo=True))
+            assert state.version > version
+            assert encoder.get_action_mask(state) is not mask
+        
+        while records:
+            version = state.version
+            undo_action(state, records.pop())
+            assert state.version > version
+            fresh = state.clone()
+            fresh.cache = None
+            assert get_valid_actions(state) == get_valid_actions(fresh)
+
+
+def test_engine_events_describe_state_changes():
+    import random
+    from events import EventType
+    
+    random.seed(29)
+    counts = {event_type: 0 for event_type in EventType}
+    for _ in range(30):
+        state = initialize_game()
+        state.events = []
+        while state.winner is None and state.turn_number < 150:
+            actions = get_valid_actions(state)
+            if not state.opponent_player_state.deck:
+                break
+            before = state.clone()
+            mover = state.current_player
+            state.events.clear()
+            apply_action(state, random.choice(actions))
+            if state.turn_number > 4:
+                check_win_condition(state)
+            
+            for event in state.events:
+                counts[event.event_type] += 1
+            for p in (0, 1):
+                player, previous = (state.player1, before.player1) if p == 0 else (state.player2, before.player2)
+                prizes = [e for e in state.events if e.event_type == EventType.PRIZE_TAKEN and e.player_idx == p]
+                drawn = [e for e in state.events if e.event_type == EventType.CARD_DRAWN and e.player_idx == p]
+                assert len(previous.prizes) - len(player.prizes) == len(prizes)
+                assert len(previous.deck) - len(player.deck) == len(drawn)
+                assert [e.card for e in drawn] == previous.deck[len(previous.deck) - len(drawn):][::-1]
+            
+            damage = sum(e.amount for e in state.events if e.event_type == EventType.DAMAGE_DEALT)
+            defending = before.opponent_player_state.active_pokemon
+            if damage:
+                assert all(e.player_idx == mover for e in state.events if e.event_type == EventType.DAMAGE_DEALT)
+                knocked_out = any(e.event_type == EventType.KNOCKOUT for e in state.events)
+                assert knocked_out == ((state.player2 if mover == 0 else state.player1).active_pokemon is None)
+                if not knocked_out:
+                    assert state.opponent_player_state.active_pokemon.damage - defending.damage == damage
+            ended = [e for e in state.events if e.event_type == EventType.TURN_ENDED]
+            assert len(ended) == (state.turn_number - before.turn_number)
+            won = [e.player_idx for e in state.events if e.event_type == EventType.GAME_WON]
+            assert won == ([state.winner] if state.winner is not None else [])
+    
+    assert all(counts.values())
+    
+    state = initialize_game()
+    apply_action(state, Action(ActionType.END_TURN))
+    assert state.events is None
+
+
 if __name__ == "__main__":
-    test_basic_gameplay()
+    import sys
+    import pytest
+    sys.exit(pytest.main([__file__]))
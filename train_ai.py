@@ -1,120 +1,141 @@
 import random
-import copy
+import time
+from contextlib import nullcontext
 from typing import Optional
 from game_engine import initialize_game, check_win_condition
 from game import apply_action, get_valid_actions
 from game_state import GameState
+from game_record import GameRecord
+from events import EventType, GameEvent
+from trajectory_store import TrajectoryStore, MemmapReplayBuffer
+from profiler import NULL_PROFILER, PhaseProfiler, ProfileWriter, format_window
 from state_encoder import encode_state
-from action_encoder import ActionEncoder
+from action_encoder import ActionEncoder, CanonicalActionEncoder
 from dqn_agent import DQNAgent
+from learner import ConcurrentLearner
 from actions import Action, ActionType
 
 
-def calculate_reward(state, prev_state, player_idx, done):
-    if done:
-        if state.winner == player_idx:
-            return 100.0
-        elif state.winner == 1 - player_idx:
-            return -100.0
-        else:
-            return 0.0
-    
+def calculate_reward(events: list[GameEvent], player_idx: int) -> float:
     reward = 0.0
-    
-    current_player = state.current_player_state
-    opponent = state.opponent_player_state
-    
-    prev_current_player = prev_state.current_player_state
-    prev_opponent = prev_state.opponent_player_state
-    
-    if player_idx == state.current_player:
-        reward += (len(prev_current_player.prizes) - len(current_player.prizes)) * 10.0
-        reward -= (len(prev_opponent.prizes) - len(opponent.prizes)) * 10.0
-        
-        if current_player.active_pokemon and prev_current_player.active_pokemon:
-            prev_damage = prev_current_player.active_pokemon.damage
-            curr_damage = current_player.active_pokemon.damage
-            if curr_damage < prev_damage:
-                reward += 5.0
-        
-        if opponent.active_pokemon and prev_opponent.active_pokemon:
-            prev_damage = prev_opponent.active_pokemon.damage
-            curr_damage = opponent.active_pokemon.damage
-            if curr_damage > prev_damage:
-                reward += 5.0
-    
+    for event in events:
+        if event.event_type == EventType.GAME_WON:
+            return 100.0 if event.player_idx == player_idx else -100.0
+        if event.event_type == EventType.PRIZE_TAKEN:
+            reward += 10.0 if event.player_idx == player_idx else -10.0
+        elif event.event_type == EventType.DAMAGE_DEALT and event.player_idx == player_idx:
+            reward += 5.0
     return reward
 
 
-def random_action(state):
+def random_action(state, rng: Optional[random.Random] = None):
     actions = get_valid_actions(state)
     if not actions:
         return Action(ActionType.END_TURN)
-    return random.choice(actions)
+    return (rng if rng is not None else random).choice(actions)
 
 
-def play_game(agent: DQNAgent, opponent_agent: Optional[DQNAgent] = None, training: bool = True):
-    state = initialize_game()
-    initial_state = copy.deepcopy(state)
-    prev_states = {0: initial_state, 1: initial_state}
-    actions_taken = {0: [], 1: []}
+class RandomAgent:
+    def __init__(self, seed: Optional[int] = None):
+        self.rng = random.Random(seed)
+    
+    def select_action(self, state: GameState, player_idx: int, training: bool = False) -> Action:
+        return random_action(state, self.rng)
+    
+    def store_transition(self, *args) -> None:
+        pass
+    
+    def begin_transition(self, *args) -> None:
+        return None
+    
+    def end_transition(self, *args) -> None:
+        pass
+    
+    def end_episode(self) -> None:
+        pass
+
+
+def play_game(
+    agent: DQNAgent,
+    opponent_agent: Optional[DQNAgent] = None,
+    training: bool = True,
+    seed: Optional[int] = None,
+    record: Optional[GameRecord] = None,
+    profiler=NULL_PROFILER,
+):
+    blocks_at_start = profiler.begin_game()
+    if seed is None:
+        seed = random.getrandbits(63)
+    if record is not None:
+        record.seed = seed
+    state = initialize_game(rng=random.Random(seed))
+    if training:
+        state.events = []
+    actions_taken = 0
+    pending = {}
     
     max_turns = 200
     turn_count = 0
     
     while state.winner is None and turn_count < max_turns:
         player_idx = state.current_player
-        prev_state = prev_states[player_idx]
-        
-        if opponent_agent is None or player_idx == 0:
-            action = agent.select_action(state, player_idx, training=training)
-        else:
-            action = opponent_agent.select_action(state, player_idx, training=training)
-        
-        state_before_action = copy.deepcopy(state)
-        apply_action(state, action)
-        check_win_condition(state)
+        actor = agent if opponent_agent is None or player_idx == 0 else opponent_agent
         
-        done = state.winner is not None
+        with profiler.phase("select_action"):
+            action = actor.select_action(state, player_idx, training=training)
         
-        actions_taken[player_idx].append(action)
+        if training and (player_idx == 0 or opponent_agent is not None):
+            with profiler.phase("store_transition"):
+                if player_idx in pending:
+                    transition, reward = pending[player_idx]
+                    actor.end_transition(transition, reward, state, False, player_idx)
+                pending[player_idx] = [actor.begin_transition(state, action, player_idx), 0.0]
         
-        if training and prev_state is not None and len(actions_taken[player_idx]) > 0:
-            reward = calculate_reward(state, prev_state, player_idx, done)
-            
-            if player_idx == 0:
-                agent.store_transition(prev_state, actions_taken[player_idx][-1], reward, state, done, player_idx)
-            elif opponent_agent is not None:
-                opponent_agent.store_transition(prev_state, actions_taken[player_idx][-1], reward, state, done, player_idx)
+        with profiler.phase("apply_action"):
+            if state.events is not None:
+                state.events.clear()
+            apply_action(state, action)
+            if record is not None:
+                record.append(action)
+            check_win_condition(state)
+        actions_taken += 1
         
-        if not done:
-            prev_states[player_idx] = state_before_action
+        with profiler.phase("reward"):
+            for p, step in pending.items():
+                step[1] += calculate_reward(state.events, p)
         
         if state.current_player != player_idx:
             turn_count += 1
     
+    if pending:
+        with profiler.phase("store_transition"):
+            for p, (transition, reward) in pending.items():
+                actor = agent if opponent_agent is None or p == 0 else opponent_agent
+                actor.end_transition(transition, reward, state, state.winner is not None, p)
+            agent.end_episode()
+            if opponent_agent is not None:
+                opponent_agent.end_episode()
+    
+    profiler.count("actions", actions_taken)
+    profiler.end_game(blocks_at_start)
     return state.winner, turn_count
 
 
-def build_action_space(action_encoder: ActionEncoder, num_games: int = 20) -> None:
-    for _ in range(num_games):
-        state = initialize_game()
-        max_turns = 50
-        turn_count = 0
-        
-        while state.winner is None and turn_count < max_turns:
-            actions = get_valid_actions(state)
-            for action in actions:
-                action_encoder.encode(action)
-            
-            if not actions:
-                break
-            
-            apply_action(state, random.choice(actions))
-            check_win_condition(state)
-            
-            if state.current_player != (turn_count % 2):
-                turn_count += 1
+def evaluate_agent(
+    agent: DQNAgent,
+    num_games: int = 100,
+    num_threads: int = 16,
+    max_batch_size: int = 64,
+) -> float:
+    from concurrent.futures import ThreadPoolExecutor
+    from inference_server import InferenceServer
+    
+    with InferenceServer(agent.q_network, agent.device, max_batch_size=max_batch_size) as server:
+        client = server.client(agent.action_encoder)
+        with ThreadPoolExecutor(num_threads) as pool:
+            winners = list(pool.map(lambda _: play_game(client, RandomAgent(), training=False)[0], range(num_games)))
+    
+    return sum(1 for w in winners if w == 0) / max(num_games, 1)
 
 
 def train_agent(
@@ -124,51 +145,144 @@ def train_agent(
     batch_size: int = 32,
     save_freq: int = 1000,
     save_path: str = "dqn_model.pt",
+    double_dqn: bool = False,
+    prioritized_replay: bool = False,
+    trajectory_path: Optional[str] = None,
+    profile_path: Optional[str] = None,
+    canonical_actions: bool = False,
+    n_step: int = 1,
+    td_lambda: Optional[float] = None,
+    compressed_replay: bool = False,
+    prefetch_depth: int = 0,
+    updates_per_step: Optional[float] = None,
 ):
-    action_encoder = ActionEncoder()
-    print("Building action space...")
-    build_action_space(action_encoder, num_games=50)
+    action_encoder = CanonicalActionEncoder() if canonical_actions else ActionEncoder()
     print(f"Action space size: {action_encoder.get_max_actions()}")
     
     sample_state = initialize_game()
     sample_obs = encode_state(sample_state, 0)
     state_dim = len(sample_obs)
     
-    agent = DQNAgent(state_dim, action_encoder)
+    agent = DQNAgent(state_dim, action_encoder, double_dqn=double_dqn, prioritized_replay=prioritized_replay,
+                     compressed_replay=compressed_replay, n_step=n_step, td_lambda=td_lambda)
+    print(f"Replay buffer: {agent.replay_buffer.bytes_per_transition():.0f} bytes/transition")
+    if trajectory_path is not None:
+        agent.trajectory_store = TrajectoryStore(trajectory_path, state_dim, action_encoder.get_max_actions(),
+                                                 gamma=agent.gamma, n_step=n_step, td_lambda=td_lambda)
+        resumed = agent.trajectory_store.load_into(agent.replay_buffer)
+        if resumed:
+            print(f"Resumed {resumed} transitions from {trajectory_path}")
+    
+    profiler = NULL_PROFILER
+    profile_writer = None
+    if profile_path is not None:
+        profiler = agent.profiler = PhaseProfiler()
+        profile_writer = ProfileWriter(profile_path)
+    if prefetch_depth > 0:
+        agent.start_prefetch(batch_size, prefetch_depth)
+    learner = None
+    if updates_per_step is not None:
+        learner = ConcurrentLearner(agent, batch_size, updates_per_step).start()
+        total_rewards = learner.losses
+    else:
+        total_rewards = []
     
     wins = 0
-    total_rewards = []
+    window_start, window_steps, window_updates = time.perf_counter(), agent.env_steps, agent.updates
     
     for episode in range(episodes):
-        winner, turns = play_game(agent, training=True)
+        with profiler.phase("play_game"):
+            winner, turns = play_game(agent, training=True, profiler=profiler)
         
         if winner == 0:
             wins += 1
         
-        if episode % train_freq == 0 and len(agent.replay_buffer) >= batch_size:
-            loss = agent.train_step(batch_size)
+        if learner is not None:
+            with profiler.phase("throttle"):
+                learner.throttle()
+        elif episode % train_freq == 0 and len(agent.replay_buffer) >= batch_size:
+            with profiler.phase("train_step"):
+                loss = agent.train_step(batch_size)
             if loss is not None:
                 total_rewards.append(loss)
         
         if episode % target_update_freq == 0:
-            agent.update_target_network()
+            with profiler.phase("target_update"), learner.lock if learner is not None else nullcontext():
+                agent.update_target_network()
         
         agent.update_epsilon()
         
         if episode % 100 == 0:
             win_rate = wins / max(episode + 1, 1)
-            avg_loss = sum(total_rewards[-100:]) / len(total_rewards[-100:]) if total_rewards else 0.0
-            print(f"Episode {episode}, Win Rate: {win_rate:.2f}, Epsilon: {agent.epsilon:.3f}, Avg Loss: {avg_loss:.4f}")
+            recent = list(total_rewards)[-100:]
+            avg_loss = sum(recent) / len(recent) if recent else 0.0
+            elapsed = time.perf_counter() - window_start
+            steps_per_s = (agent.env_steps - window_steps) / elapsed
+            updates_per_s = (agent.updates - window_updates) / elapsed
+            window_start, window_steps, window_updates = time.perf_counter(), agent.env_steps, agent.updates
+            print(f"Episode {episode}, Win Rate: {win_rate:.2f}, Epsilon: {agent.epsilon:.3f}, Avg Loss: {avg_loss:.4f}"
+                  + f", Env Steps/s: {steps_per_s:.0f}, Updates/s: {updates_per_s:.0f}"
+                  + (f", Prefetch Waits: {agent.prefetcher.wait_rate():.0%}" if agent.prefetcher is not None else ""))
+            if profile_writer is not None:
+                window = profiler.window(episode=episode)
+                profile_writer.write(window)
+                print(format_window(window))
             wins = 0
         
         if episode % save_freq == 0 and episode > 0:
-            agent.save(save_path)
+            with learner.lock if learner is not None else nullcontext():
+                agent.save(save_path)
+            if agent.trajectory_store is not None:
+                agent.trajectory_store.flush()
             print(f"Model saved to {save_path}")
     
+    if learner is not None:
+        learner.stop()
+    agent.stop_prefetch()
     agent.save(save_path)
+    if agent.trajectory_store is not None:
+        agent.trajectory_store.flush()
     print(f"Training complete. Final model saved to {save_path}")
 
 
+def train_offline(
+    trajectory_path: str,
+    num_updates: int = 100000,
+    batch_size: int = 32,
+    target_update_freq: int = 1000,
+    save_path: str = "dqn_model.pt",
+    double_dqn: bool = False,
+    canonical_actions: bool = False,
+    prefetch_depth: int = 0,
+):
+    store = TrajectoryStore(trajectory_path)
+    action_encoder = CanonicalActionEncoder() if canonical_actions else ActionEncoder()
+    assert store.action_dim == action_encoder.get_max_actions(), "Stored trajectories use a different action space"
+    assert store.gamma is not None, "Stored trajectories do not record the discount their returns used"
+    agent = DQNAgent(store.state_dim, action_encoder, gamma=store.gamma, double_dqn=double_dqn, replay_capacity=1,
+                     n_step=store.n_step, td_lambda=store.td_lambda)
+    agent.replay_buffer = MemmapReplayBuffer(store)
+    print(f"Training offline on {len(agent.replay_buffer)} transitions from {trajectory_path}")
+    if prefetch_depth > 0:
+        agent.start_prefetch(batch_size, prefetch_depth)
+    
+    losses = []
+    for update in range(1, num_updates + 1):
+        loss = agent.train_step(batch_size)
+        if loss is not None:
+            losses.append(loss)
+        if update % target_update_freq == 0:
+            agent.update_target_network()
+        if update % 1000 == 0:
+            print(f"Update {update}, Avg Loss: {sum(losses[-100:]) / len(losses[-100:]) if losses else 0.0:.4f}"
+                  + (f", Prefetch Waits: {agent.prefetcher.wait_rate():.0%}" if agent.prefetcher is not None else ""))
+    
+    agent.stop_prefetch()
+    agent.save(save_path)
+    print(f"Offline training complete. Final model saved to {save_path}")
+    return agent
+
+
 if __name__ == "__main__":
     from typing import Optional
     train_agent(episodes=10000)
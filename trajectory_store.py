@@ -0,0 +1,201 @@
+import json
+import os
+import numpy as np
+import torch
+from typing import Optional
+from replay_buffer import ReplayBuffer, Transition, TransitionBatch, TensorBatch, to_tensors
+
+
+def transition_dtype(state_dim: int, action_dim: int) -> np.dtype:
+    return np.dtype([
+        ("state", np.float32, (state_dim,)),
+        ("next_state", np.float32, (state_dim,)),
+        ("action", np.int64),
+        ("reward", np.float32),
+        ("done", np.bool_),
+        ("action_mask", np.bool_, (action_dim,)),
+        ("next_action_mask", np.bool_, (action_dim,)),
+    ])
+
+
+class TrajectoryStore:
+    def __init__(
+        self,
+        path: str,
+        state_dim: Optional[int] = None,
+        action_dim: Optional[int] = None,
+        chunk_size: int = 65536,
+        write_buffer: int = 1024,
+        gamma: Optional[float] = None,
+        n_step: Optional[int] = None,
+        td_lambda: Optional[float] = None,
+    ):
+        self.path = path
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            assert state_dim in (None, meta["state_dim"]), "State dim does not match stored trajectories"
+            assert action_dim in (None, meta["action_dim"]), "Action dim does not match stored trajectories"
+            assert gamma in (None, meta.get("gamma")), "Discount does not match stored trajectories"
+            assert n_step in (None, meta.get("n_step", 1)), "N-step horizon does not match stored trajectories"
+            assert td_lambda is None or td_lambda == meta.get("td_lambda"), "Lambda does not match stored trajectories"
+            state_dim, action_dim, chunk_size = meta["state_dim"], meta["action_dim"], meta["chunk_size"]
+            gamma, n_step, td_lambda = meta.get("gamma"), meta.get("n_step", 1), meta.get("td_lambda")
+        else:
+            assert state_dim is not None and action_dim is not None, "A new store needs state and action dims"
+            n_step = 1 if n_step is None else n_step
+            os.makedirs(path, exist_ok=True)
+            with open(meta_path, "w") as f:
+                json.dump({"state_dim": state_dim, "action_dim": action_dim, "chunk_size": chunk_size,
+                           "gamma": gamma, "n_step": n_step, "td_lambda": td_lambda}, f)
+        
+        self.gamma = gamma
+        self.n_step = n_step
+        self.td_lambda = td_lambda
+        self.state_dim = state_dim
+        self.action_dim = action_dim
+        self.chunk_size = chunk_size
+        self.dtype = transition_dtype(state_dim, action_dim)
+        self.pending = np.zeros(write_buffer, dtype=self.dtype)
+        self.num_pending = 0
+        self.chunk_sizes = [self._recover_chunk(i) for i in range(self._count_chunks())]
+    
+    def _chunk_path(self, chunk: int) -> str:
+        return os.path.join(self.path, f"chunk_{chunk:06d}.bin")
+    
+    def _count_chunks(self) -> int:
+        count = 0
+        while os.path.exists(self._chunk_path(count)):
+            count += 1
+        return count
+    
+    def _recover_chunk(self, chunk: int) -> int:
+        path = self._chunk_path(chunk)
+        records, torn = divmod(os.path.getsize(path), self.dtype.itemsize)
+        if torn:
+            os.truncate(path, records * self.dtype.itemsize)
+        return records
+    
+    def push(self, transition: Transition) -> None:
+        record = self.pending[self.num_pending]
+        record["state"] = transition.state
+        record["next_state"] = transition.next_state
+        record["action"] = transition.action
+        record["reward"] = transition.reward
+        record["done"] = transition.done
+        record["action_mask"] = transition.action_mask
+        record["next_action_mask"] = transition.next_action_mask
+        self.num_pending += 1
+        if self.num_pending == len(self.pending):
+            self.flush()
+    
+    def push_batch(
+        self,
+        states: np.ndarray,
+        actions: np.ndarray,
+        rewards: np.ndarray,
+        next_states: np.ndarray,
+        dones: np.ndarray,
+        action_masks: np.ndarray,
+        next_action_masks: np.ndarray,
+    ) -> None:
+        records = np.empty(len(states), dtype=self.dtype)
+        records["state"] = states
+        records["next_state"] = next_states
+        records["action"] = actions
+        records["reward"] = rewards
+        records["done"] = dones
+        records["action_mask"] = action_masks
+        records["next_action_mask"] = next_action_masks
+        self.flush()
+        self._write(records)
+    
+    def flush(self) -> None:
+        if self.num_pending:
+            self._write(self.pending[:self.num_pending])
+            self.num_pending = 0
+    
+    def _write(self, records: np.ndarray) -> None:
+        while len(records):
+            if not self.chunk_sizes or self.chunk_sizes[-1] == self.chunk_size:
+                self.chunk_sizes.append(0)
+            take = min(len(records), self.chunk_size - self.chunk_sizes[-1])
+            with open(self._chunk_path(len(self.chunk_sizes) - 1), "ab") as f:
+                f.write(records[:take].tobytes())
+            self.chunk_sizes[-1] += take
+            records = records[take:]
+    
+    def chunks(self) -> list[np.memmap]:
+        self.flush()
+        return [
+            np.memmap(self._chunk_path(i), dtype=self.dtype, mode="r", shape=(size,))
+            for i, size in enumerate(self.chunk_sizes)
+            if size > 0
+        ]
+    
+    def load_into(self, replay_buffer: ReplayBuffer, max_transitions: Optional[int] = None) -> int:
+        limit = replay_buffer.capacity if max_transitions is None else min(max_transitions, replay_buffer.capacity)
+        skip = max(len(self) - limit, 0)
+        loaded = 0
+        for chunk in self.chunks():
+            if skip >= len(chunk):
+                skip -= len(chunk)
+                continue
+            records = chunk[skip:]
+            skip = 0
+            replay_buffer.push_batch(
+                records["state"], records["action"], records["reward"], records["next_state"],
+                records["done"], records["action_mask"], records["next_action_mask"],
+            )
+            loaded += len(records)
+        return loaded
+    
+    def __len__(self) -> int:
+        return sum(self.chunk_sizes) + self.num_pending
+
+
+class MemmapReplayBuffer:
+    def __init__(self, store: TrajectoryStore, seed: Optional[int] = None):
+        self.store = store
+        self.rng = np.random.default_rng(seed)
+        self.refresh()
+    
+    def refresh(self) -> None:
+        self.chunks = self.store.chunks()
+        self.offsets = np.cumsum([0] + [len(chunk) for chunk in self.chunks])
+    
+    def sample_indices(self, batch_size: int) -> np.ndarray:
+        return self.rng.integers(0, len(self), size=batch_size)
+    
+    def sample(self, batch_size: int) -> TransitionBatch:
+        return self.gather(self.sample_indices(batch_size))
+    
+    def gather(self, indices: np.ndarray) -> TransitionBatch:
+        records = np.empty(len(indices), dtype=self.store.dtype)
+        chunk_ids = np.searchsorted(self.offsets, indices, side="right") - 1
+        for chunk in np.unique(chunk_ids):
+            selected = chunk_ids == chunk
+            records[selected] = self.chunks[chunk][indices[selected] - self.offsets[chunk]]
+        
+        return TransitionBatch(
+            states=np.ascontiguousarray(records["state"]),
+            actions=np.ascontiguousarray(records["action"]),
+            rewards=np.ascontiguousarray(records["reward"]),
+            next_states=np.ascontiguousarray(records["next_state"]),
+            dones=np.ascontiguousarray(records["done"]),
+            action_masks=np.ascontiguousarray(records["action_mask"]),
+            next_action_masks=np.ascontiguousarray(records["next_action_mask"]),
+            indices=indices,
+        )
+    
+    def sample_tensors(
+        self,
+        batch_size: int,
+        device: Optional[torch.device] = None,
+        pin_memory: bool = False,
+    ) -> TensorBatch:
+        return to_tensors(self.sample(batch_size), device, pin_memory)
+    
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
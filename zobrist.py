@@ -0,0 +1,193 @@
+from typing import Optional
+from card_catalog import CATALOG, ENERGY_TYPES, STATUSES
+from cards import Card
+from game_state import GameState, PlayerState, PokemonInPlay
+
+
+MASK = (1 << 64) - 1
+
+HAND = 1
+HAND_SIZE = 2
+DECK = 3
+DECK_SIZE = 4
+PRIZE = 5
+PRIZE_SIZE = 6
+DISCARD = 7
+POKEMON = 8
+DAMAGE = 9
+ENERGY = 10
+STATUS = 11
+ENERGY_ATTACHED = 12
+POKEMON_PLAYED = 13
+CURRENT_PLAYER = 14
+TURN = 15
+WINNER = 16
+
+_keys: dict[tuple, int] = {}
+_pile_rows: dict[tuple[int, int], list[list[int]]] = {}
+
+
+def _splitmix64(x: int) -> int:
+    x = (x + 0x9E3779B97F4A7C15) & MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK
+    return x ^ (x >> 31)
+
+
+def zkey(*parts: int) -> int:
+    key = _keys.get(parts)
+    if key is None:
+        key = 0
+        for part in parts:
+            key = _splitmix64(key ^ (part & MASK))
+        _keys[parts] = key
+    return key
+
+
+def _pile_key(kind: int, player_idx: int, cards: list[Card]) -> int:
+    rows = _pile_rows.setdefault((kind, player_idx), [])
+    if len(rows) < len(cards) or (rows and len(rows[0]) < len(CATALOG)):
+        rows[:] = [
+            [zkey(kind, player_idx, position, card_id) for card_id in range(len(CATALOG))]
+            for position in range(max(len(cards), len(rows)))
+        ]
+    id_of = CATALOG.id_of
+    key = 0
+    for row, card in zip(rows, cards):
+        key ^= row[id_of(card)]
+    return key
+
+
+def _public(hashes: list[int], key: int) -> None:
+    hashes[0] ^= key
+    hashes[1] ^= key
+    hashes[2] ^= key
+
+
+def _private(hashes: list[int], player_idx: int, key: int) -> None:
+    hashes[0] ^= key
+    hashes[1 + player_idx] ^= key
+
+
+def _pokemon_key(player_idx: int, slot: int, pokemon: PokemonInPlay) -> int:
+    key = (
+        zkey(POKEMON, player_idx, slot, CATALOG.id_of(pokemon.card))
+        ^ zkey(DAMAGE, player_idx, slot, pokemon.damage)
+        ^ zkey(STATUS, player_idx, slot, STATUSES.index(pokemon.status))
+    )
+    counts = [0] * len(ENERGY_TYPES)
+    for energy in pokemon.attached_energy:
+        type_idx = ENERGY_TYPES.index(energy.energy_type)
+        counts[type_idx] += 1
+        key ^= zkey(ENERGY, player_idx, slot, type_idx, counts[type_idx])
+    return key
+
+
+def compute_hashes(state: GameState) -> list[int]:
+    hashes = [0, 0, 0]
+    for p, player in enumerate((state.player1, state.player2)):
+        _private(hashes, p, _pile_key(HAND, p, player.hand))
+        hashes[0] ^= _pile_key(DECK, p, player.deck) ^ _pile_key(PRIZE, p, player.prizes)
+        discard_counts: dict[int, int] = {}
+        for card in player.discard:
+            card_id = CATALOG.id_of(card)
+            discard_counts[card_id] = discard_counts.get(card_id, 0) + 1
+            _public(hashes, zkey(DISCARD, p, card_id, discard_counts[card_id]))
+        
+        _public(hashes, zkey(HAND_SIZE, p, len(player.hand)))
+        _public(hashes, zkey(DECK_SIZE, p, len(player.deck)))
+        _public(hashes, zkey(PRIZE_SIZE, p, len(player.prizes)))
+        _public(hashes, zkey(ENERGY_ATTACHED, p, player.energy_attached_this_turn))
+        if player.pokemon_played_this_turn:
+            _public(hashes, zkey(POKEMON_PLAYED, p))
+        if player.active_pokemon is not None:
+            _public(hashes, _pokemon_key(p, 0, player.active_pokemon))
+        for i, pokemon in enumerate(player.bench):
+            _public(hashes, _pokemon_key(p, 1 + i, pokemon))
+    
+    _public(hashes, zkey(CURRENT_PLAYER, state.current_player))
+    _public(hashes, zkey(TURN, state.turn_number))
+    if state.winner is not None:
+        _public(hashes, zkey(WINNER, state.winner))
+    return hashes
+
+
+def ensure_hashes(state: GameState) -> list[int]:
+    if state.hashes is None:
+        state.hashes = compute_hashes(state)
+    return state.hashes
+
+
+def state_hash(state: GameState) -> int:
+    return ensure_hashes(state)[0]
+
+
+def view_hash(state: GameState, player_idx: int) -> int:
+    return ensure_hashes(state)[1 + player_idx]
+
+
+def on_draw(hashes: list[int], player_idx: int, player: PlayerState, card: Card) -> None:
+    card_id = CATALOG.id_of(card)
+    deck_size = len(player.deck)
+    hand_size = len(player.hand)
+    hashes[0] ^= zkey(DECK, player_idx, deck_size, card_id)
+    _public(hashes, zkey(DECK_SIZE, player_idx, deck_size + 1) ^ zkey(DECK_SIZE, player_idx, deck_size))
+    _private(hashes, player_idx, zkey(HAND, player_idx, hand_size - 1, card_id))
+    _public(hashes, zkey(HAND_SIZE, player_idx, hand_size - 1) ^ zkey(HAND_SIZE, player_idx, hand_size))
+
+
+def on_take_prize(hashes: list[int], player_idx: int, player: PlayerState, card: Card) -> None:
+    card_id = CATALOG.id_of(card)
+    prize_count = len(player.prizes)
+    hand_size = len(player.hand)
+    hashes[0] ^= zkey(PRIZE, player_idx, prize_count, card_id)
+    _public(hashes, zkey(PRIZE_SIZE, player_idx, prize_count + 1) ^ zkey(PRIZE_SIZE, player_idx, prize_count))
+    _private(hashes, player_idx, zkey(HAND, player_idx, hand_size - 1, card_id))
+    _public(hashes, zkey(HAND_SIZE, player_idx, hand_size - 1) ^ zkey(HAND_SIZE, player_idx, hand_size))
+
+
+def on_hand_remove(hashes: list[int], player_idx: int, hand: list[Card], hand_index: int) -> None:
+    key = 0
+    for i in range(hand_index, len(hand)):
+        key ^= zkey(HAND, player_idx, i, CATALOG.id_of(hand[i]))
+        if i > hand_index:
+            key ^= zkey(HAND, player_idx, i - 1, CATALOG.id_of(hand[i]))
+    _private(hashes, player_idx, key)
+    _public(hashes, zkey(HAND_SIZE, player_idx, len(hand)) ^ zkey(HAND_SIZE, player_idx, len(hand) - 1))
+
+
+def on_pokemon_placed(hashes: list[int], player_idx: int, slot: int, pokemon: PokemonInPlay) -> None:
+    _public(hashes, _pokemon_key(player_idx, slot, pokemon))
+
+
+def on_energy_attached(hashes: list[int], player_idx: int, slot: int, pokemon: PokemonInPlay, card: Card) -> None:
+    count = sum(1 for e in pokemon.attached_energy if e.energy_type == card.energy_type)
+    _public(hashes, zkey(ENERGY, player_idx, slot, ENERGY_TYPES.index(card.energy_type), count))
+
+
+def on_damage(hashes: list[int], player_idx: int, slot: int, before: int, after: int) -> None:
+    _public(hashes, zkey(DAMAGE, player_idx, slot, before) ^ zkey(DAMAGE, player_idx, slot, after))
+
+
+def on_turn_flags(hashes: list[int], player_idx: int, player: PlayerState,
+                  new_energy_attached: int, new_pokemon_played: bool) -> None:
+    key = 0
+    if new_energy_attached != player.energy_attached_this_turn:
+        key ^= zkey(ENERGY_ATTACHED, player_idx, new_energy_attached)
+        key ^= zkey(ENERGY_ATTACHED, player_idx, player.energy_attached_this_turn)
+    if new_pokemon_played != player.pokemon_played_this_turn:
+        key ^= zkey(POKEMON_PLAYED, player_idx)
+    _public(hashes, key)
+
+
+def on_end_turn(hashes: list[int], previous_player: int, turn_number: int) -> None:
+    _public(
+        hashes,
+        zkey(CURRENT_PLAYER, previous_player) ^ zkey(CURRENT_PLAYER, 1 - previous_player)
+        ^ zkey(TURN, turn_number) ^ zkey(TURN, turn_number + 1),
+    )
+
+
+def on_winner(hashes: list[int], winner: Optional[int]) -> None:
+    if winner is not None:
+        _public(hashes, zkey(WINNER, winner))